@@ -0,0 +1,368 @@
+"""
+Time series aggregation to typical periods for fast design screening.
+
+The year is cut into periods (days by default) which are clustered by their
+demand, irradiation and wind profiles. One representative (medoid) period
+per cluster is simulated and weighted by the number of periods it stands for,
+in the objective as in the annual limit of the gas supply.
+
+Storages are linked across the whole year: every original period carries the
+storage level at its start, which changes by the level change of its
+representative period (inter-period linking after Kotzur et al., 2018).
+The results are expanded back to the full year so that display_results and
+the plotting functions can be used unchanged.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+from collections import namedtuple
+import logging
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as po
+
+import oemof.solph as solph
+import oemof.outputlib as outputlib
+
+from basic_analysis import display_results
+from energy_system import build_energy_system
+from energy_system import solve_energy_system
+from energy_system import solve_model
+from input_data import Weather
+from input_data import merge_parameters
+from kpi import KPI_NAMES
+from solver_config import pick_solver
+from solver_config import solver_options
+
+# weather:        Weather of the representative periods, one after another
+# weights:        number of hours of the year each simulated hour stands for
+# assignment:     cluster of every original period
+# mapping:        simulated hour of every hour of the year
+# period_length:  hours per period
+Aggregation = namedtuple('Aggregation', ['weather', 'weights', 'assignment',
+                                         'mapping', 'period_length'])
+
+
+###############################################################################
+# clustering
+###############################################################################
+def _normalised_profiles(weather):
+    profiles = np.column_stack([weather.demand_el, weather.demand_th,
+                                weather.irradiation, weather.wind_power])
+    peak = profiles.max(axis=0)
+    peak[peak == 0] = 1
+    return profiles / peak
+
+
+def _kmeans(features, number_of_clusters, seed, iterations):
+    rng = np.random.default_rng(seed)
+
+    # k-means++ initialisation
+    centroids = [features[rng.integers(len(features))]]
+    for _ in range(1, number_of_clusters):
+        distance = np.min([((features - c) ** 2).sum(axis=1)
+                           for c in centroids], axis=0)
+        centroids.append(features[rng.choice(len(features),
+                                             p=distance / distance.sum())])
+    centroids = np.array(centroids)
+
+    labels = None
+    for _ in range(iterations):
+        distance = ((features[:, None, :] - centroids[None, :, :]) ** 2
+                    ).sum(axis=2)
+        new_labels = distance.argmin(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for c in range(number_of_clusters):
+            if np.any(labels == c):
+                centroids[c] = features[labels == c].mean(axis=0)
+    return labels, centroids
+
+
+def aggregate_weather(weather, number_of_periods, period_length=24, seed=0,
+                      iterations=100):
+    """
+    Cluster the weather data to number_of_periods typical periods.
+
+    period_length is given in hours, e.g. 24 for typical days or 168 for
+    typical weeks. Hours at the end of the year that do not fill a whole
+    period are assigned to the closest typical period.
+    """
+    profiles = _normalised_profiles(weather)
+    number_of_full_periods = len(weather) // period_length
+    if not 0 < number_of_periods <= number_of_full_periods:
+        raise ValueError('number_of_periods must be between 1 and {0}'.format(
+            number_of_full_periods))
+
+    features = profiles[:number_of_full_periods * period_length].reshape(
+        number_of_full_periods, -1)
+    labels, centroids = _kmeans(features, number_of_periods, seed, iterations)
+
+    # the member closest to the centroid represents the cluster; clusters
+    # are numbered in the order of their representative in the year
+    representatives = []
+    for c in range(number_of_periods):
+        members = np.flatnonzero(labels == c)
+        if len(members) == 0:
+            continue
+        distance = ((features[members] - centroids[c]) ** 2).sum(axis=1)
+        representatives.append(members[distance.argmin()])
+    representatives = np.sort(representatives)
+    distance = ((features[:, None, :] - features[representatives][None, :, :])
+                ** 2).sum(axis=2)
+    assignment = distance.argmin(axis=1)
+
+    # remaining hours at the end of the year
+    remainder = len(weather) - number_of_full_periods * period_length
+    if remainder:
+        partial = profiles[-remainder:].ravel()
+        distance = ((features[representatives][:, :partial.size] - partial)
+                    ** 2).sum(axis=1)
+        assignment = np.append(assignment, distance.argmin())
+
+    hours = np.arange(len(weather))
+    mapping = assignment[hours // period_length] * period_length + (
+        hours % period_length)
+
+    simulated = (representatives[:, None] * period_length
+                 + np.arange(period_length)).ravel()
+    reduced = Weather(weather.demand_el[simulated],
+                      weather.demand_th[simulated],
+                      weather.irradiation[simulated],
+                      weather.wind_power[simulated])
+    weights = np.bincount(mapping, minlength=len(simulated)).astype(float)
+
+    logging.info('Aggregated {0} hours to {1} typical periods of {2} '
+                 'hours'.format(len(weather), len(representatives),
+                                period_length))
+    return Aggregation(reduced, weights, assignment, mapping, period_length)
+
+
+###############################################################################
+# model
+###############################################################################
+def _period_lengths(aggregation):
+    lengths = np.full(len(aggregation.assignment), aggregation.period_length)
+    remainder = len(aggregation.mapping) % aggregation.period_length
+    if remainder:
+        lengths[-1] = remainder
+    return lengths
+
+
+def _link_storages(model, aggregation):
+    """
+    Replace the storage balance of oemof by one linked over the whole year.
+
+    delta is the change of the storage level since the start of the typical
+    period, soc the storage level at the start of every original period.
+    Self-discharge is neglected in the level bounds within a period.
+    """
+    m = model
+    if not hasattr(m, 'GenericStorageBlock'):
+        return
+    block = m.GenericStorageBlock
+    block.balance_first.deactivate()
+    block.balance.deactivate()
+    block.balanced_cstr.deactivate()
+
+    L = aggregation.period_length
+    lengths = _period_lengths(aggregation)
+    number_of_clusters = len(m.TIMESTEPS) // L
+
+    link = po.Block()
+    m.add_component('StorageLinking', link)
+    link.CLUSTERS = po.Set(initialize=range(number_of_clusters))
+    link.PERIODS = po.Set(initialize=range(len(lengths) + 1))
+    link.delta = po.Var(block.STORAGES, m.TIMESTEPS, within=po.Reals)
+    link.delta_max = po.Var(block.STORAGES, link.CLUSTERS, within=po.Reals)
+    link.delta_min = po.Var(block.STORAGES, link.CLUSTERS, within=po.Reals)
+    link.soc = po.Var(block.STORAGES, link.PERIODS,
+                      within=po.NonNegativeReals)
+    link.constraints = po.ConstraintList()
+
+    for n in block.STORAGES:
+        i = list(n.inputs)[0]
+        o = list(n.outputs)[0]
+        capacity = n.nominal_storage_capacity
+
+        for t in m.TIMESTEPS:
+            c, h = divmod(t, L)
+            expr = (m.flow[i, n, t] * n.inflow_conversion_factor[t]
+                    - m.flow[n, o, t] / n.outflow_conversion_factor[t]
+                    ) * m.timeincrement[t]
+            if h > 0:
+                expr += link.delta[n, t - 1] * (1 - n.loss_rate[t])
+            link.constraints.add(link.delta[n, t] == expr)
+            link.constraints.add(link.delta_max[n, c] >= link.delta[n, t])
+            link.constraints.add(link.delta_min[n, c] <= link.delta[n, t])
+
+        for p, length in enumerate(lengths):
+            c = aggregation.assignment[p]
+            link.constraints.add(
+                link.soc[n, p + 1] == link.soc[n, p]
+                * (1 - n.loss_rate[0]) ** length
+                + link.delta[n, c * L + length - 1])
+            link.constraints.add(
+                link.soc[n, p] + link.delta_min[n, c] >= 0)
+            link.constraints.add(
+                link.soc[n, p] + link.delta_max[n, c] <= capacity)
+
+        for p in link.PERIODS:
+            link.soc[n, p].setub(capacity)
+        if n.initial_storage_level is not None:
+            link.soc[n, 0].fix(n.initial_storage_level * capacity)
+        if n.balanced:
+            link.constraints.add(link.soc[n, len(lengths)] == link.soc[n, 0])
+
+
+def _weight_summed_max(model, aggregation):
+    """
+    Replace the summed_max constraints of oemof by ones weighted with the
+    hours every simulated hour stands for, so that they limit the sum over
+    the whole year.
+    """
+    m = model
+    if not hasattr(m.Flow, 'summed_max'):
+        return
+    m.Flow.summed_max.deactivate()
+
+    def _weighted_summed_max(_, i, o):
+        return (sum(m.flow[i, o, t] * m.timeincrement[t]
+                    * aggregation.weights[t] for t in m.TIMESTEPS)
+                <= m.flows[i, o].summed_max * m.flows[i, o].nominal_value)
+
+    m.WeightedSummedMax = po.Constraint(m.Flow.SUMMED_MAX_FLOWS,
+                                        rule=_weighted_summed_max)
+
+
+def _storage_levels(model, aggregation):
+    """Storage level of every hour of the year from the linking variables."""
+    if not hasattr(model, 'StorageLinking'):
+        return {}
+    link = model.StorageLinking
+    L = aggregation.period_length
+    hours = np.arange(len(aggregation.mapping))
+    periods = hours // L
+
+    levels = {}
+    for n in model.GenericStorageBlock.STORAGES:
+        soc = np.array([link.soc[n, p].value for p in link.PERIODS])
+        delta = np.array([link.delta[n, t].value for t in model.TIMESTEPS])
+        decay = (1 - n.loss_rate[0]) ** (hours % L + 1)
+        levels[n] = soc[periods] * decay + delta[aggregation.mapping]
+    return levels
+
+
+def expand_results(results, aggregation, timeindex):
+    """Results of the typical periods repeated for every hour of the year."""
+    expanded = {}
+    for key, value in results.items():
+        sequences = value['sequences']
+        expanded[key] = {
+            'scalars': value['scalars'],
+            'sequences': pd.DataFrame(sequences.values[aggregation.mapping],
+                                      columns=sequences.columns,
+                                      index=timeindex)}
+    return expanded
+
+
+def solve_aggregated(design, params, aggregation, solver='cbc',
+                     solver_verbose=False, **settings):
+    """
+    Build and solve the model of the typical periods of aggregation.
+
+    settings are those of solver_config.solver_options (threads, method,
+    time_limit, mip_gap, tolerance). Returns the energy system;
+    energysystem.results['main'] holds the results expanded to the full
+    year.
+    """
+    solver = pick_solver(solver)
+    options = solver_options(solver, **settings)
+    energysystem = build_energy_system(design, params, aggregation.weather)
+
+    logging.info('Optimise the aggregated energy system')
+    model = solph.Model(energysystem,
+                        objective_weighting=aggregation.weights)
+    _weight_summed_max(model, aggregation)
+    _link_storages(model, aggregation)
+    solve_model(model, solver, options, solver_verbose)
+
+    levels = _storage_levels(model, aggregation)
+    if levels:
+        # processing.results expects every variable to be indexed by
+        # timestep: the oemof storage level is set to the level of the first
+        # hour of the year each simulated hour stands for
+        first_hour = np.empty(len(aggregation.weights), dtype=int)
+        first_hour[aggregation.mapping[::-1]] = np.arange(
+            len(aggregation.mapping))[::-1]
+        for n, level in levels.items():
+            for t in model.TIMESTEPS:
+                model.GenericStorageBlock.capacity[n, t].value = level[
+                    first_hour[t]]
+        model.del_component(model.StorageLinking)
+
+    timeindex = pd.date_range('1/1/2030', periods=len(aggregation.mapping),
+                              freq='H')
+    results = expand_results(outputlib.processing.results(model),
+                             aggregation, timeindex)
+    for n, level in levels.items():
+        results[n, None]['sequences']['capacity'] = level
+
+    energysystem.results['main'] = results
+    energysystem.results['meta'] = outputlib.processing.meta_results(model)
+    return energysystem
+
+
+def compare_with_full_year(design, params, weather, aggregation,
+                           solver='cbc', solver_verbose=False):
+    """
+    KPIs of the aggregated and of the full year model and their deviation.
+
+    Returns a DataFrame indexed by KPI_NAMES.
+    """
+    param_value = merge_parameters(design, params)
+
+    energysystem = solve_aggregated(design, params, aggregation, solver,
+                                    solver_verbose)
+    kpis, _ = display_results(
+        outputlib.views.convert_keys_to_strings(
+            energysystem.results['main']),
+        param_value, verbose=False)
+
+    energysystem = build_energy_system(design, params, weather)
+    solve_energy_system(energysystem, solver=solver,
+                        solver_verbose=solver_verbose)
+    reference_kpis, _ = display_results(
+        outputlib.views.convert_keys_to_strings(
+            energysystem.results['main']),
+        param_value, verbose=False)
+
+    comparison = pd.DataFrame({'aggregated': kpis,
+                               'full year': reference_kpis},
+                              index=KPI_NAMES)
+    comparison['error [%]'] = (
+        (comparison['aggregated'] - comparison['full year'])
+        / comparison['full year'] * 100)
+    return comparison
+
+
+if __name__ == '__main__':
+    import os
+
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    aggregation = aggregate_weather(inputs.weather, number_of_periods=12)
+    print(compare_with_full_year(design, inputs.params, inputs.weather,
+                                 aggregation))
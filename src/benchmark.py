@@ -0,0 +1,196 @@
+"""
+Benchmarks of building, solving and post-processing the energy system.
+
+Every case is one design at one horizon, run in a fresh process so that the
+memory of one case does not carry over to the next. The phases recorded by
+profiling.py (creating the objects, building the model, solving, processing
+the results) and the analysis of the results are timed per case:
+
+    python benchmark.py                     run and compare with the baseline
+    python benchmark.py --save-baseline     run and store as the new baseline
+    python benchmark.py --horizons 24 168   only some horizons
+
+Horizons longer than the weather data repeat it (35040 hours: four years).
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+import oemof.outputlib as outputlib
+
+import profiling
+from basic_analysis import display_results
+from energy_system import build_energy_system
+from energy_system import solve_energy_system
+from input_data import Weather
+from input_data import load_input_bundle
+from input_data import load_parameters
+from input_data import merge_parameters
+
+HORIZONS = (24, 168, 720, 8760, 35040)
+
+# design variants: name -> values overriding design_parameters.csv
+DESIGNS = {
+    # all components of design_parameters.csv
+    'full': {},
+    # only the gas fired heat supply and the shortage sources
+    'minimal': {'number_of_windturbines': 0, 'PV_area_field': 0,
+                'PV_area_roof': 0, 'area_solar_th': 0,
+                'number_of_heat_pumps': 0},
+    }
+
+STORAGE = {'storage': {},
+           'no storage': {'capacity_electr_storage': 0,
+                          'capacity_thermal_storage': 0}}
+
+# phases of a case, see profiling.py
+PHASES = ('create objects', 'build model', 'solve', 'process results',
+          'analysis')
+
+# relative slowdown of a phase reported as regression
+TOLERANCE = 0.2
+
+
+def repeat_weather(weather, number_of_time_steps):
+    """Weather of number_of_time_steps hours, repeating weather if needed."""
+    return Weather(*(np.resize(getattr(weather, name), number_of_time_steps)
+                     for name in Weather.__slots__))
+
+
+def benchmark_cases(horizons=HORIZONS, designs=DESIGNS, storage=STORAGE):
+    """All combinations of horizon, design and storage as case dicts."""
+    return [{'horizon': horizon, 'design': design, 'storage': store}
+            for horizon, design, store in itertools.product(
+                horizons, designs, storage)]
+
+
+def run_case(case, base_design, inputs, solver='cbc', memory=False):
+    """Seconds (and peak memory) of every phase of one case."""
+    design = merge_parameters(DESIGNS[case['design']], base_design)
+    design.update(STORAGE[case['storage']])
+    weather = repeat_weather(inputs.weather, case['horizon'])
+
+    profiler = profiling.start(memory=memory)
+    try:
+        energysystem = build_energy_system(design, inputs.params, weather)
+        solve_energy_system(energysystem, solver=solver)
+        with profiling.phase('analysis'):
+            string_results = outputlib.views.convert_keys_to_strings(
+                energysystem.results['main'])
+            display_results(string_results,
+                            merge_parameters(design, inputs.params),
+                            verbose=False)
+    finally:
+        profiling.stop()
+
+    row = dict(case)
+    for record in profiler.records:
+        if record['phase'] in PHASES:
+            row[record['phase'] + ' [s]'] = record['seconds']
+            if memory:
+                row[record['phase'] + ' peak [MB]'] = record['peak [MB]']
+    row['total [s]'] = sum(row.get(phase + ' [s]', 0) for phase in PHASES)
+    row['max_rss [MB]'] = profiler.records[-1]['max_rss [MB]']
+    return row
+
+
+def _run_case_in_process(args):
+    return run_case(*args)
+
+
+def run_benchmarks(cases, base_design, inputs, solver='cbc', memory=False,
+                   repeat=1):
+    """
+    Run cases one after another, each in a fresh process.
+
+    With repeat > 1 every case is run several times and the fastest run is
+    kept. Returns a DataFrame with one row per case.
+    """
+    rows = []
+    for case in cases:
+        logging.info('Benchmark {0}'.format(case))
+        runs = []
+        for _ in range(repeat):
+            with multiprocessing.Pool(1) as pool:
+                runs.append(pool.apply(_run_case_in_process,
+                                       ((case, base_design, inputs, solver,
+                                         memory),)))
+        rows.append(min(runs, key=lambda row: row['total [s]']))
+    return pd.DataFrame(rows).set_index(['horizon', 'design', 'storage'])
+
+
+def compare_with_baseline(table, baseline, tolerance=TOLERANCE):
+    """
+    Ratio of every time of table to the baseline (> 1: slower).
+
+    The column 'regression' marks the cases where a phase is slower than
+    the baseline by more than tolerance.
+    """
+    times = [column for column in table.columns if column.endswith('[s]')
+             and column in baseline.columns]
+    ratio = table[times] / baseline.reindex(table.index)[times]
+    ratio['regression'] = (ratio > 1 + tolerance).any(axis=1)
+    return ratio
+
+
+def load_baseline(file_path):
+    """Baseline written by run_benchmarks(...).to_csv(file_path)."""
+    return pd.read_csv(file_path, index_col=['horizon', 'design', 'storage'])
+
+
+def add_arguments(parser):
+    """Command line arguments of the benchmarks, see main()."""
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    parser.add_argument('--horizons', type=int, nargs='+', default=HORIZONS)
+    parser.add_argument('--designs', nargs='+', default=list(DESIGNS))
+    parser.add_argument('--storage', nargs='+', default=list(STORAGE))
+    parser.add_argument('--solver', default='cbc')
+    parser.add_argument('--memory', action='store_true',
+                        help='record peak memory (slows the phases down)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--baseline',
+                        default=abs_path + '/benchmarks/baseline.csv')
+    parser.add_argument('--save-baseline', action='store_true')
+
+
+def main(args):
+    """Run the benchmarks of the parsed arguments args."""
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    base_design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    cases = benchmark_cases(args.horizons,
+                            {name: DESIGNS[name] for name in args.designs},
+                            {name: STORAGE[name] for name in args.storage})
+    table = run_benchmarks(cases, base_design, inputs, solver=args.solver,
+                           memory=args.memory, repeat=args.repeat)
+    print(table)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        table.to_csv(args.baseline)
+        print('Baseline stored in {0}'.format(args.baseline))
+    elif os.path.exists(args.baseline):
+        comparison = compare_with_baseline(table, load_baseline(
+            args.baseline))
+        print(comparison)
+        if comparison['regression'].any():
+            raise SystemExit('Slower than the baseline')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    add_arguments(parser)
+    logging.basicConfig(level=logging.INFO)
+    main(parser.parse_args())
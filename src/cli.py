@@ -0,0 +1,317 @@
+"""
+Command line interface of the energy system simulation.
+
+    python cli.py solve       build and solve one design, store the results
+    python cli.py sweep       solve a grid of designs in parallel
+    python cli.py analyse     KPIs of stored results
+    python cli.py plot        plots of stored results
+    python cli.py bench       benchmarks, see benchmark.py
+    python cli.py queue       resumable design studies, see job_queue.py
+    python cli.py districts   districts coupled by exchange, see districts.py
+
+python cli.py <command> --help lists the options of a command. Modules are
+imported by the commands that need them: analyse and plot read the results
+stored by solve (see results_store.py) without importing oemof or the
+solver interface, analyse not even matplotlib.
+
+Further commands are added to SUBCOMMANDS with register(). Their argument
+and run functions may be given as 'module:function', so that the module is
+only imported when the command is run.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+
+RESULTS_DIR = abs_path + '/results/optimisation_results/results'
+
+# name -> (help, function adding the arguments, function running the command)
+SUBCOMMANDS = {}
+
+
+def register(name, help, arguments, run):
+    """
+    Add the subcommand name.
+
+    arguments(parser) adds the arguments of the command to its argparse
+    parser, run(args) runs it with the parsed arguments. Both may be given
+    as 'module:function'.
+    """
+    SUBCOMMANDS[name] = (help, arguments, run)
+
+
+def _resolve(function):
+    if isinstance(function, str):
+        module, name = function.split(':')
+        return getattr(importlib.import_module(module), name)
+    return function
+
+
+def input_arguments(parser):
+    parser.add_argument('--data-dir', default=abs_path + '/data')
+    parser.add_argument('--design', default='design_parameters.csv',
+                        help='design parameters, in --data-dir')
+    parser.add_argument('--params', default='general_parameters.csv',
+                        help='general parameters, in --data-dir')
+    parser.add_argument('--weather', default='weather_data.CSV',
+                        help='weather data, in --data-dir')
+    parser.add_argument('--cache-dir', default=abs_path + '/cache')
+
+
+def load_inputs(args):
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    inputs = load_input_bundle(os.path.join(args.data_dir, args.weather),
+                               os.path.join(args.data_dir, args.params),
+                               cache_dir=args.cache_dir)
+    design = load_parameters(os.path.join(args.data_dir, args.design))
+    return inputs, design
+
+
+def _stored_design(stored, args):
+    # the design stored by solve, else the one of --design
+    from input_data import load_parameters
+
+    if 'design' in stored.meta:
+        return stored.meta['design']
+    return load_parameters(os.path.join(args.data_dir, args.design))
+
+
+###############################################################################
+# solve
+###############################################################################
+def solve_arguments(parser):
+    input_arguments(parser)
+    parser.add_argument('--results', default=RESULTS_DIR,
+                        help='directory of the stored results')
+    parser.add_argument('--solver', default='cbc')
+    parser.add_argument('--time-steps', type=int, default=None,
+                        help='number of hours, default: all')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--method', choices=('simplex', 'barrier'))
+    parser.add_argument('--time-limit', type=float, default=None)
+    parser.add_argument('--rolling-window', type=int, default=None,
+                        help='optimise windows of this many hours one after '
+                        'another, see rolling_horizon.py')
+    parser.add_argument('--rolling-overlap', type=int, default=24)
+    parser.add_argument('--stream', action='store_true',
+                        help='read the weather file window by window, for '
+                        'long files; needs --rolling-window')
+
+
+def solve(args):
+    import oemof.outputlib as outputlib
+
+    from basic_analysis import display_results
+    from input_data import merge_parameters
+    from kpi import KPI_NAMES
+    from results_store import write_results
+
+    settings = {'solver': args.solver, 'threads': args.threads,
+                'method': args.method, 'time_limit': args.time_limit}
+    if args.stream:
+        from input_data import load_parameters
+        from input_data import stream_weather
+
+        if not args.rolling_window or args.time_steps is not None:
+            raise ValueError('--stream needs --rolling-window and no '
+                             '--time-steps')
+        params = load_parameters(os.path.join(args.data_dir, args.params))
+        design = load_parameters(os.path.join(args.data_dir, args.design))
+        weather = stream_weather(os.path.join(args.data_dir, args.weather))
+    else:
+        inputs, design = load_inputs(args)
+        params = inputs.params
+        weather = inputs.weather
+        if args.time_steps is not None:
+            weather = weather.window(0, args.time_steps)
+
+    if args.rolling_window:
+        from rolling_horizon import solve_rolling_horizon
+
+        energysystem = solve_rolling_horizon(design, params, weather,
+                                             window=args.rolling_window,
+                                             overlap=args.rolling_overlap,
+                                             **settings)
+    else:
+        from energy_system import build_energy_system
+        from energy_system import solve_energy_system
+
+        energysystem = build_energy_system(design, params, weather)
+        solve_energy_system(energysystem, **settings)
+
+    string_results = outputlib.views.convert_keys_to_strings(
+        energysystem.results['main'])
+    kpis, _ = display_results(string_results,
+                              merge_parameters(design, params))
+    # the design is stored with the results for analyse and plot
+    meta = dict(energysystem.results['meta'])
+    meta['design'] = dict(design)
+    write_results(args.results, string_results, dict(zip(KPI_NAMES, kpis)),
+                  meta)
+    logging.info('Results stored in {0}'.format(args.results))
+
+
+###############################################################################
+# sweep
+###############################################################################
+def grid_values(text):
+    name, _, values = text.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError(
+            'expected name=value,value,..., got {0}'.format(text))
+    return name, [float(value) for value in values.split(',')]
+
+
+def sweep_arguments(parser):
+    input_arguments(parser)
+    parser.add_argument('grid', nargs='+', type=grid_values,
+                        metavar='name=value,value,...',
+                        help='values of a design parameter, e.g. '
+                        'number_of_chps=2,4')
+    parser.add_argument('--output', default=abs_path
+                        + '/results/sweep_results.csv')
+    parser.add_argument('--solver', default='cbc')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--persistent', action='store_true',
+                        help='re-solve the model of each worker in place')
+    parser.add_argument('--template', action='store_true',
+                        help='one model of all components per worker')
+    parser.add_argument('--fast-dispatch', action='store_true',
+                        help='merit order dispatch instead of the LP')
+    parser.add_argument('--sparse', action='store_true',
+                        help='sparse LP solved by HiGHS instead of solph')
+    parser.add_argument('--min-self-sufficiency', type=float, default=None,
+                        help='skip designs that surely miss it [%%]')
+    parser.add_argument('--max-co2', type=float, default=None,
+                        help='skip designs that surely exceed it [t/a]')
+    parser.add_argument('--max-costs', type=float, default=None,
+                        help='skip designs that surely exceed it '
+                        '[Mio. EUR/a]')
+    parser.add_argument('--prune-dominated', action='store_true',
+                        help='skip designs that are surely worse than '
+                        'another in all KPIs, see screening.py')
+
+
+def sweep(args):
+    from kpi import KPI_NAMES
+    from sweep import design_grid
+    from sweep import run_sweep
+
+    inputs, base_design = load_inputs(args)
+    designs = design_grid(**dict(args.grid))
+    persistent = 'template' if args.template else args.persistent
+    screening = {'min_self_sufficiency': args.min_self_sufficiency,
+                 'max_co2': args.max_co2, 'max_costs': args.max_costs,
+                 'objectives': KPI_NAMES if args.prune_dominated else None}
+    if all(value is None for value in screening.values()):
+        screening = None
+    table = run_sweep(designs, base_design, inputs, processes=args.processes,
+                      persistent=persistent, solver=args.solver,
+                      fast_dispatch=args.fast_dispatch, sparse=args.sparse,
+                      screening=screening)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    table.to_csv(args.output)
+    print(table)
+
+
+###############################################################################
+# analyse
+###############################################################################
+def analyse_arguments(parser):
+    input_arguments(parser)
+    parser.add_argument('--results', default=RESULTS_DIR,
+                        help='directory of the stored results')
+
+
+def analyse(args):
+    from basic_analysis import display_results
+    from input_data import load_parameters
+    from input_data import merge_parameters
+    from results_store import read_results
+
+    stored = read_results(args.results)
+    params = load_parameters(os.path.join(args.data_dir, args.params))
+    display_results(stored, merge_parameters(_stored_design(stored, args),
+                                             params))
+
+
+###############################################################################
+# plot
+###############################################################################
+def plot_arguments(parser):
+    analyse_arguments(parser)
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--end', type=int, default=1400)
+    parser.add_argument('--output-dir', default=abs_path + '/results')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--show', action='store_true',
+                        help='show the plots, not only save them')
+
+
+def plot(args):
+    import matplotlib
+    if not args.show:
+        matplotlib.use('Agg')
+
+    from basic_analysis import PLOTS
+    from input_data import merge_parameters
+    from results_store import read_results
+    from results_view import results_view
+
+    inputs, _ = load_inputs(args)
+    stored = read_results(args.results)
+    param_value = merge_parameters(_stored_design(stored, args),
+                                   inputs.params)
+    view = results_view(stored)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, plot_results in PLOTS.items():
+        plot_results(view, param_value, inputs.weather, args.start, args.end,
+                     show=args.show, dpi=args.dpi,
+                     file_path=os.path.join(args.output_dir,
+                                            'detailed_analysis_' + name
+                                            + '.png'))
+
+
+register('solve', 'build and solve one design, store the results',
+         solve_arguments, solve)
+register('sweep', 'solve a grid of designs in parallel', sweep_arguments,
+         sweep)
+register('analyse', 'KPIs of stored results', analyse_arguments, analyse)
+register('plot', 'plots of stored results', plot_arguments, plot)
+register('bench', 'benchmarks of build, solve and analysis',
+         'benchmark:add_arguments', 'benchmark:main')
+register('queue', 'resumable design study in a queue file',
+         'job_queue:add_arguments', 'job_queue:main')
+register('districts', 'districts coupled by exchange of electricity and heat',
+         'districts:add_arguments', 'districts:main')
+
+
+def main(argv=None):
+    """Parse argv (default: sys.argv) and run the subcommand."""
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+    for name, (help, arguments, _) in SUBCOMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help)
+        # only the arguments of the given command are resolved
+        if argv and argv[0] == name:
+            _resolve(arguments)(subparser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    return _resolve(SUBCOMMANDS[args.command][2])(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Components of the energy system that depend on the design.
+
+Their labels, design parameters and sizes are kept apart from
+energy_system.py, which imports oemof and Pyomo, so that models without
+them (fast_dispatch.py, sparse_model.py, screening.py) can be imported
+without those packages.
+"""
+
+# components that depend on the design: label -> (design parameter, bus)
+# A component is only part of the energy system if its parameter is > 0.
+DESIGN_COMPONENTS = {
+    'wind_turbine': ('number_of_windturbines', 'electricity'),
+    'PV_field': ('PV_area_field', 'electricity'),
+    'PV_roof': ('PV_area_roof', 'electricity'),
+    'solar_thermal': ('area_solar_th', 'heat'),
+    'chp': ('number_of_chps', 'heat'),
+    'boiler': ('number_of_boilers', 'heat'),
+    'heat_pump': ('number_of_heat_pumps', 'heat'),
+    'storage_th': ('capacity_thermal_storage', 'heat'),
+    'storage_el': ('capacity_electr_storage', 'electricity'),
+    }
+
+FIXED_SOURCES = ('wind_turbine', 'PV_field', 'PV_roof', 'solar_thermal')
+TRANSFORMERS = ('chp', 'boiler', 'heat_pump')
+STORAGES = ('storage_th', 'storage_el')
+
+
+def components(param_value):
+    """Labels of the design dependent components present in a design."""
+    return {label for label, (name, _) in DESIGN_COMPONENTS.items()
+            if param_value[name] > 0}
+
+
+def design_values(param_value, weather):
+    """
+    Values of the energy system that change with the design, keyed by label.
+
+    Fixed sources map to their hourly feed-in [MWh], transformers to the
+    nominal value of their heat output [MW] and storages to a tuple of
+    (nominal storage capacity [MWh], nominal in- and outflow [MW]).
+    """
+    pv = param_value
+    values = {
+        'wind_turbine': (weather.wind_power * pv['number_of_windturbines']
+                         * 0.001),
+        'PV_field': (weather.irradiation * pv['eta_PV'] * 0.000001
+                     * pv['PV_area_field'] * 10000),
+        'PV_roof': (weather.irradiation * pv['eta_PV'] * 0.000001
+                    * pv['PV_area_roof'] * 10000),
+        'solar_thermal': (weather.irradiation * pv['eta_solar_th'] * 0.000001
+                          * pv['area_solar_th'] * 10000),
+        'chp': pv['number_of_chps'] * pv['chp_heat_output'],
+        'boiler': pv['number_of_boilers'] * pv['boiler_heat_output'],
+        'heat_pump': pv['number_of_heat_pumps'] * pv['heatpump_heat_output'],
+        }
+    capacity_th = pv['capacity_thermal_storage'] * pv['daily_demand_th']
+    values['storage_th'] = (capacity_th,
+                            capacity_th / pv['charge_time_storage_th'])
+    capacity_el = pv['capacity_electr_storage'] * pv['daily_demand_el']
+    values['storage_el'] = (capacity_el,
+                            capacity_el / pv['charge_time_storage_el'])
+    return values
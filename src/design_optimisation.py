@@ -0,0 +1,259 @@
+"""
+Multi-objective optimisation of the design with NSGA-II.
+
+The design variables of design_parameters.csv are varied within bounds to
+find the Pareto front of costs, CO2 emissions and self-sufficiency, the
+KPIs of display_results. Optionally designs have to keep KPIs within
+limits (e.g. a minimum self-sufficiency), handled by constrained domination
+(Deb et al., 2002).
+
+Every generation is evaluated in parallel by the workers of the design sweep
+and every design vector is evaluated only once: results are cached by the
+(rounded) design vector for the whole run.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import logging
+
+import numpy as np
+import pandas as pd
+
+from kpi import KPI_NAMES
+from sweep import design_sample
+from sweep import evaluate_designs
+from sweep import sweep_pool
+
+# KPI -> 1 to minimise, -1 to maximise
+OBJECTIVES = {KPI_NAMES[0]: 1,
+              KPI_NAMES[1]: 1,
+              KPI_NAMES[2]: -1}
+
+# distribution indices of simulated binary crossover and polynomial mutation
+ETA_CROSSOVER = 15
+ETA_MUTATION = 20
+CROSSOVER_PROBABILITY = 0.9
+
+
+###############################################################################
+# ranking
+###############################################################################
+def constraint_violation(kpis, constraints):
+    """
+    Sum of the violations of constraints by every design.
+
+    kpis is a DataFrame of KPIs, constraints maps KPI names to (lower, upper)
+    where None means unbounded. Designs without KPIs (failed solves) get an
+    infinite violation.
+    """
+    violation = np.zeros(len(kpis))
+    for name, (lower, upper) in (constraints or {}).items():
+        values = kpis[name].to_numpy()
+        if lower is not None:
+            violation += np.maximum(0, lower - values)
+        if upper is not None:
+            violation += np.maximum(0, values - upper)
+    failed = kpis[list(OBJECTIVES)].isnull().any(axis=1).to_numpy()
+    violation[failed] = np.inf
+    return violation
+
+
+def non_dominated_sort(objectives, violation):
+    """
+    Rank of the Pareto front of every design (0 for the best front).
+
+    objectives are minimised. A feasible design dominates every infeasible
+    one, of two infeasible designs the one with the smaller violation.
+    """
+    feasible = violation <= 0
+    pareto = ((objectives[:, None, :] <= objectives[None, :, :]).all(axis=2)
+              & (objectives[:, None, :] < objectives[None, :, :]).any(axis=2))
+    dominates = np.where(feasible[:, None] & feasible[None, :], pareto,
+                         violation[:, None] < violation[None, :])
+
+    ranks = np.full(len(objectives), -1)
+    dominated_by = dominates.sum(axis=0)
+    rank = 0
+    front = np.flatnonzero(dominated_by == 0)
+    while front.size:
+        ranks[front] = rank
+        dominated_by = dominated_by - dominates[front].sum(axis=0)
+        rank += 1
+        front = np.flatnonzero((dominated_by == 0) & (ranks < 0))
+    return ranks
+
+
+def crowding_distance(objectives, ranks):
+    """Crowding distance of every design within its front."""
+    distance = np.zeros(len(objectives))
+    for rank in np.unique(ranks):
+        members = np.flatnonzero(ranks == rank)
+        for values in objectives[members].T:
+            order = np.argsort(values)
+            values = values[order]
+            span = values[-1] - values[0]
+            distance[members[order[[0, -1]]]] = np.inf
+            if len(order) > 2 and span > 0:
+                distance[members[order[1:-1]]] += (
+                    (values[2:] - values[:-2]) / span)
+    return distance
+
+
+###############################################################################
+# variation
+###############################################################################
+def _tournament(rng, ranks, distance, number):
+    a = rng.integers(len(ranks), size=number)
+    b = rng.integers(len(ranks), size=number)
+    a_wins = (ranks[a] < ranks[b]) | (
+        (ranks[a] == ranks[b]) & (distance[a] >= distance[b]))
+    return np.where(a_wins, a, b)
+
+
+def _crossover(rng, parents_a, parents_b, lower, upper):
+    """Simulated binary crossover, bounded to [lower, upper]."""
+    u = rng.random(parents_a.shape)
+    beta = np.where(u <= 0.5, (2 * u) ** (1 / (ETA_CROSSOVER + 1)),
+                    (1 / (2 * (1 - u))) ** (1 / (ETA_CROSSOVER + 1)))
+    cross = rng.random(len(parents_a)) < CROSSOVER_PROBABILITY
+    beta[~cross] = 1
+    children_a = 0.5 * ((1 + beta) * parents_a + (1 - beta) * parents_b)
+    children_b = 0.5 * ((1 - beta) * parents_a + (1 + beta) * parents_b)
+    return (np.clip(children_a, lower, upper),
+            np.clip(children_b, lower, upper))
+
+
+def _mutation(rng, children, lower, upper):
+    """Polynomial mutation of every variable with probability 1/n."""
+    span = np.where(upper > lower, upper - lower, 1)
+    u = rng.random(children.shape)
+    delta = np.where(u < 0.5, (2 * u) ** (1 / (ETA_MUTATION + 1)) - 1,
+                     1 - (2 * (1 - u)) ** (1 / (ETA_MUTATION + 1)))
+    mutate = rng.random(children.shape) < 1 / children.shape[1]
+    return np.clip(children + mutate * delta * span, lower, upper)
+
+
+###############################################################################
+# optimisation
+###############################################################################
+def optimise_designs(bounds, base_design, inputs, integer=(),
+                     constraints=None, population_size=40, generations=25,
+                     seed=None, processes=None, cache=None, **options):
+    """
+    Pareto optimal designs of costs, CO2 emissions and self-sufficiency.
+
+    bounds maps the design variables to (lower, upper); variables listed in
+    integer only take whole numbers (e.g. number_of_chps). constraints maps
+    KPI names to (lower, upper) limits, e.g.
+    {'Self-Sufficiency [%]': (90, None)}. The options are passed to
+    sweep.sweep_pool (solver, fast_dispatch, aggregation, ...).
+
+    cache maps design vectors (tuples in the order of bounds) to their KPIs.
+    Pass the same dict to later runs to reuse their evaluations.
+
+    Returns the Pareto front of all evaluated feasible designs and a table
+    of all evaluated designs, both as DataFrames of design variables and
+    KPIs.
+    """
+    names = list(bounds)
+    lower = np.array([bounds[name][0] for name in names], dtype=float)
+    upper = np.array([bounds[name][1] for name in names], dtype=float)
+    is_integer = np.array([name in integer for name in names])
+    sense = np.array(list(OBJECTIVES.values()))
+    rng = np.random.default_rng(seed)
+    if cache is None:
+        cache = {}
+
+    def key(x):
+        return tuple(int(v) if i else round(float(v), 6)
+                     for v, i in zip(x, is_integer))
+
+    def evaluate(pool, population):
+        keys = [key(x) for x in population]
+        new = list(dict.fromkeys(k for k in keys if k not in cache))
+        if new:
+            logging.info('Evaluate {0} new designs'.format(len(new)))
+            table = evaluate_designs(pool, [dict(zip(names, k)) for k in new],
+                                     base_design, inputs)
+            for k, (_, row) in zip(new, table.iterrows()):
+                cache[k] = row.drop(names)
+        kpis = pd.DataFrame([cache[k] for k in keys]).reset_index(drop=True)
+        objectives = kpis[list(OBJECTIVES)].to_numpy() * sense
+        return kpis, objectives, constraint_violation(kpis, constraints)
+
+    population = np.array([[d[name] for name in names] for d in
+                           design_sample(bounds, population_size,
+                                         integer=integer, seed=rng)],
+                          dtype=float)
+
+    with sweep_pool(base_design, inputs, processes=processes,
+                    **options) as pool:
+        _, objectives, violation = evaluate(pool, population)
+        ranks = non_dominated_sort(objectives, violation)
+        distance = crowding_distance(objectives, ranks)
+
+        for generation in range(generations):
+            a = population[_tournament(rng, ranks, distance, population_size)]
+            b = population[_tournament(rng, ranks, distance, population_size)]
+            children = np.vstack(_crossover(rng, a, b, lower, upper))
+            children = _mutation(rng, children[:population_size], lower,
+                                 upper)
+            children[:, is_integer] = np.round(children[:, is_integer])
+
+            combined = np.vstack([population, children])
+            _, objectives, violation = evaluate(pool, combined)
+            ranks = non_dominated_sort(objectives, violation)
+            distance = crowding_distance(objectives, ranks)
+
+            survivors = np.lexsort((-distance, ranks))[:population_size]
+            population = combined[survivors]
+            objectives = objectives[survivors]
+            violation = violation[survivors]
+            ranks = non_dominated_sort(objectives, violation)
+            distance = crowding_distance(objectives, ranks)
+
+            logging.info('Generation {0}: {1} designs in the first front, '
+                         '{2} evaluated'.format(generation + 1,
+                                                (ranks == 0).sum(),
+                                                len(cache)))
+
+    archive = pd.concat([pd.DataFrame(list(cache), columns=names),
+                         pd.DataFrame(list(cache.values())).reset_index(
+                             drop=True)], axis=1)
+    objectives = archive[list(OBJECTIVES)].to_numpy() * sense
+    violation = constraint_violation(archive, constraints)
+    ranks = non_dominated_sort(objectives, violation)
+    front = archive[(ranks == 0) & (violation <= 0)]
+    return front.sort_values(KPI_NAMES[1]).reset_index(drop=True), archive
+
+
+if __name__ == '__main__':
+    import os
+
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    base_design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    bounds = {'number_of_windturbines': (0, 12),
+              'number_of_chps': (0, 8),
+              'number_of_boilers': (0, 4),
+              'number_of_heat_pumps': (0, 6),
+              'PV_area_roof': (0, 8),
+              'area_solar_th': (0, 8),
+              'capacity_electr_storage': (0, 3),
+              'capacity_thermal_storage': (0, 10)}
+    integer = ('number_of_windturbines', 'number_of_chps',
+               'number_of_boilers', 'number_of_heat_pumps')
+
+    front, archive = optimise_designs(bounds, base_design, inputs,
+                                      integer=integer, seed=1)
+    front.to_csv(abs_path + '/results/pareto_front.csv')
+    print(front)
@@ -0,0 +1,472 @@
+"""
+Several districts coupled by exchange of electricity and heat.
+
+Every district has its own design parameters and demand profile, its energy
+system is the one of energy_system.py, assembled as the sparse LP of
+sparse_model.py. A link carries electricity or heat between two districts in
+both directions up to its capacity [MW], the share loss of the energy is
+lost on the way. Every district gets an import and an export column per
+link it is part of.
+
+The coupled LP is solved by ADMM (alternating direction method of
+multipliers). Per link, direction and hour the districts agree on the energy
+sent, z. In every iteration
+
+    1. every district solves its LP in a parallel process, the exchange
+       priced with its multipliers and penalised with
+       (rho / 2) * (sent energy - z)**2
+    2. z becomes the mean of the energy the sender wants to send and the
+       energy the receiver wants to receive (before the losses)
+    3. the multipliers grow by rho times the deviation from z
+
+until the deviations from z (primal residual) and the change of z (dual
+residual) are below tolerance, relative to the capacity of the link. HiGHS
+solves LPs only, so the penalty is approximated by its tangents at
+TANGENTS times the capacity from z. At the end the exchange is fixed to z
+and the districts are solved once more; shortage and excess cover what is
+left of the deviations.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import argparse
+from collections import namedtuple
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from input_data import Weather
+from sparse_model import SparseModel
+
+# distance of the tangents of the penalty from z, times the capacity of the
+# link; closer tangents approximate the penalty better near z
+TANGENTS = (0.005, 0.02, 0.1, 0.4, 1.)
+
+District = namedtuple('District', ['name', 'design', 'weather'])
+Link = namedtuple('Link', ['district_a', 'district_b', 'bus', 'capacity',
+                           'loss'], defaults=(0.,))
+
+# one direction of a link
+Arc = namedtuple('Arc', ['sender', 'receiver', 'label', 'bus', 'capacity',
+                         'loss'])
+
+DistrictResults = namedtuple('DistrictResults', [
+    'results', 'costs', 'exchange', 'prices', 'iterations',
+    'primal_residual', 'dual_residual', 'converged'])
+
+# set once per worker process by _init_worker
+_worker_state = {}
+
+
+def scaled_weather(weather, demand_el=1., demand_th=1.):
+    """Weather with the demands scaled, e.g. for a smaller district."""
+    return Weather(weather.demand_el * demand_el,
+                   weather.demand_th * demand_th, weather.irradiation,
+                   weather.wind_power)
+
+
+def link_label(link):
+    return 'link_{0}_{1}_{2}'.format(link.district_a, link.district_b,
+                                     link.bus)
+
+
+def link_arcs(links):
+    """Both directions of every link."""
+    pairs = set()
+    arcs = []
+    for link in links:
+        pair = (frozenset((link.district_a, link.district_b)), link.bus)
+        if pair in pairs:
+            raise ValueError('Two {0} links between {1} and {2}'.format(
+                link.bus, link.district_a, link.district_b))
+        pairs.add(pair)
+        for sender, receiver in ((link.district_a, link.district_b),
+                                 (link.district_b, link.district_a)):
+            arcs.append(Arc(sender, receiver, link_label(link), link.bus,
+                            link.capacity, link.loss))
+    return arcs
+
+
+def district_exchanges(name, links):
+    """Exchanges of the SparseModel of district name, see sparse_model.py."""
+    return {link_label(link): (link.bus, link.capacity) for link in links
+            if name in (link.district_a, link.district_b)}
+
+
+class DistrictModel(SparseModel):
+    """
+    SparseModel of a district with priced and penalised exchange.
+
+    weights maps the keys of the exchange columns to the weight w of their
+    penalty (w / 2) * (flow - target)**2 per hour. The penalty is a column
+    per key bounded from below by tangents of the parabola, rows of A_ub
+    whose right hand side depends on the target.
+    """
+
+    def __init__(self, design, params, weather, number_of_time_steps,
+                 exchanges, weights):
+        self.weights = weights
+        super().__init__(design, params, weather, number_of_time_steps,
+                         exchanges)
+
+    def _assemble(self):
+        super()._assemble()
+        self._penalties = {}
+        if not self.weights:
+            return
+        T = self.number_of_time_steps
+        hours = np.arange(T)
+        first_column = self._number_of_columns
+        first_row = self.A_ub.shape[0]
+
+        # per key the column of the penalty and its tangents at flow =
+        # target + delta: w * delta * flow - penalty <= w * delta * target
+        # + w * delta**2 / 2
+        rows, columns, values = [], [], []
+        row = 0
+        for key, weight in self.weights.items():
+            flow = self.column_range(key).start
+            penalty = self._number_of_columns
+            self._number_of_columns += T
+            label = key[0] if key[0] in self.exchanges else key[1]
+            deltas = self.exchanges[label][1] * np.concatenate(
+                [TANGENTS, np.negative(TANGENTS)])
+            self._penalties[key] = (penalty, first_row + row,
+                                    weight * deltas)
+            for delta in deltas:
+                rows += [row + hours, row + hours]
+                columns += [flow + hours, penalty + hours]
+                values += [np.full(T, weight * delta), np.full(T, -1.)]
+                row += T
+
+        number_of_penalties = self._number_of_columns - first_column
+        self.c = np.concatenate([self.c, np.ones(number_of_penalties)])
+        self.lower = np.concatenate([self.lower,
+                                     np.zeros(number_of_penalties)])
+        self.upper = np.concatenate([self.upper,
+                                     np.full(number_of_penalties, np.inf)])
+        self.A_eq = sparse.hstack([
+            self.A_eq, sparse.csr_array((self.A_eq.shape[0],
+                                         number_of_penalties))]).tocsr()
+        tangents = sparse.csr_array(
+            (np.concatenate(values),
+             (np.concatenate(rows), np.concatenate(columns))),
+            shape=(row, self._number_of_columns))
+        self.A_ub = sparse.vstack([
+            sparse.hstack([self.A_ub, sparse.csr_array(
+                (first_row, number_of_penalties))]), tangents]).tocsr()
+        self.b_ub = np.concatenate([self.b_ub, np.zeros(row)])
+        for key in self.weights:
+            self.set_exchange(key, 0., np.zeros(T))
+
+    def set_exchange(self, key, price, target, scale=1.):
+        """
+        Price [EUR/MWh] and target [MWh] of the exchange column key, the
+        weight of its penalty times scale.
+
+        The slopes of the tangents stay, with a larger weight they touch the
+        parabola closer to the target.
+        """
+        T = self.number_of_time_steps
+        self.c[self.column_range(key)] = price
+        _, row, slopes = self._penalties[key]
+        weight = self.weights[key] * scale
+        for slope in slopes:
+            self.b_ub[row:row + T] = slope * target + slope ** 2 / (2 * weight)
+            row += T
+
+    def penalty(self, key):
+        """Hourly penalty of the exchange column key in the last solution."""
+        first = self._penalties[key][0]
+        return self.x[first:first + self.number_of_time_steps]
+
+
+###############################################################################
+# workers
+###############################################################################
+def _init_worker(districts, links, params, number_of_time_steps, rho,
+                 settings):
+    _worker_state['districts'] = {district.name: district
+                                  for district in districts}
+    _worker_state['links'] = links
+    _worker_state['params'] = params
+    _worker_state['number_of_time_steps'] = number_of_time_steps
+    _worker_state['rho'] = rho
+    _worker_state['settings'] = settings
+    _worker_state['models'] = {}
+
+
+def _model(name):
+    # every worker keeps the models of the districts it has solved
+    models = _worker_state['models']
+    if name not in models:
+        district = _worker_state['districts'][name]
+        rho = _worker_state['rho']
+        weights = {}
+        for arc in link_arcs(_worker_state['links']):
+            # the penalty is on the energy sent, the receiver gets
+            # (1 - loss) of it
+            if arc.sender == name:
+                weights[arc.bus, arc.label] = rho
+            elif arc.receiver == name:
+                weights[arc.label, arc.bus] = rho / (1 - arc.loss) ** 2
+        models[name] = DistrictModel(
+            district.design, _worker_state['params'], district.weather,
+            _worker_state['number_of_time_steps'],
+            district_exchanges(name, _worker_state['links']), weights)
+    return models[name]
+
+
+def _solve_district(task):
+    # task: name, {key: (price, target)}, scale of rho, fixed or not;
+    # returns the name, the costs without prices and penalties, the results
+    # if fixed and the exchange flows
+    name, exchange, scale, fixed = task
+    model = _model(name)
+    bounds = {}
+    for key, (price, target) in exchange.items():
+        model.set_exchange(key, price, target, scale)
+        if fixed:
+            columns = model.column_range(key)
+            bounds[key] = (model.lower[columns].copy(),
+                           model.upper[columns].copy())
+            model.lower[columns] = model.upper[columns] = target
+    try:
+        model.solve(**_worker_state['settings'])
+    finally:
+        for key, (lower, upper) in bounds.items():
+            columns = model.column_range(key)
+            model.lower[columns] = lower
+            model.upper[columns] = upper
+    flows = {key: model.flow(key) for key in model.weights}
+    costs = model.results['meta']['objective'] - sum(
+        (model.c[model.column_range(key)] * flows[key]).sum()
+        + model.penalty(key).sum() for key in model.weights)
+    return name, costs, model.results if fixed else None, flows
+
+
+###############################################################################
+# ADMM
+###############################################################################
+def _exchange(names, arcs, prices, sent):
+    # {district: {key: (price, target)}} from the multipliers of sender and
+    # receiver and the energy sent, one row per arc
+    exchange = {name: {} for name in names}
+    for arc, (sender_price, receiver_price), target in zip(arcs, prices,
+                                                           sent):
+        exchange[arc.sender][arc.bus, arc.label] = (sender_price, target)
+        exchange[arc.receiver][arc.label, arc.bus] = (
+            receiver_price / (1 - arc.loss), (1 - arc.loss) * target)
+    return exchange
+
+
+def solve_districts(districts, links, params, number_of_time_steps=None,
+                    processes=None, rho=10., max_iterations=50,
+                    tolerance=0.01, **settings):
+    """
+    Solve the districts coupled by links, returns DistrictResults.
+
+    districts are District tuples (name, design parameters, Weather with the
+    demand profile of the district, see scaled_weather()), links are Link
+    tuples, params are the general parameters shared by all districts. rho
+    [EUR/MWh**2] is the weight of the penalty, settings are handed to
+    SparseModel.solve().
+
+    DistrictResults holds the string keyed results and the costs [EUR] of
+    every district for the exchange fixed at the end, the energy sent [MWh]
+    and the price paid by the receiver [EUR/MWh] (one column per link
+    direction), the number of iterations, the residuals of the last one and
+    whether they met tolerance within max_iterations.
+    """
+    names = [district.name for district in districts]
+    if len(set(names)) != len(names):
+        raise ValueError('District names are not unique')
+    if not links:
+        raise ValueError('No links, solve the districts one by one with '
+                         'sparse_model.solve_sparse()')
+    for link in links:
+        for name in (link.district_a, link.district_b):
+            if name not in names:
+                raise ValueError('Link to unknown district {0}'.format(name))
+    if number_of_time_steps is None:
+        number_of_time_steps = min(len(district.weather)
+                                   for district in districts)
+    if processes is None:
+        processes = len(districts)
+
+    arcs = link_arcs(links)
+    capacity = np.array([arc.capacity for arc in arcs])[:, None]
+    loss = np.array([arc.loss for arc in arcs])[:, None]
+    # energy sent and the multipliers of sender and receiver, one row per
+    # arc
+    sent = np.zeros((len(arcs), number_of_time_steps))
+    prices = np.zeros((len(arcs), 2, number_of_time_steps))
+    scale = 1.
+
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(districts, links, params,
+                                        number_of_time_steps, rho,
+                                        settings)) as pool:
+        for iteration in range(1, max_iterations + 1):
+            solved = pool.map(_solve_district, [
+                (name, exchange, scale, False) for name, exchange in
+                _exchange(names, arcs, prices, sent).items()])
+            flows = {name: flows for name, _, _, flows in solved}
+            exports = np.array([flows[arc.sender][arc.bus, arc.label]
+                                for arc in arcs])
+            imports = np.array([flows[arc.receiver][arc.label, arc.bus]
+                                for arc in arcs]) / (1 - loss)
+
+            previous = sent
+            sent = np.clip((exports + imports) / 2
+                           + prices.sum(axis=1) / (2 * rho * scale), 0.,
+                           capacity)
+            prices[:, 0] += rho * scale * (exports - sent)
+            prices[:, 1] += rho * scale * (imports - sent)
+
+            primal_residual = np.sqrt(np.mean(
+                ((exports - sent) ** 2 + (imports - sent) ** 2)
+                / (2 * capacity ** 2)))
+            dual_residual = np.sqrt(np.mean(((sent - previous)
+                                             / capacity) ** 2))
+            logging.info('Iteration {0}: costs {1:.0f} EUR, residuals {2:.4f}'
+                         ' {3:.4f}'.format(iteration,
+                                           sum(costs for _, costs, _, _
+                                               in solved),
+                                           primal_residual, dual_residual))
+            converged = max(primal_residual, dual_residual) <= tolerance
+            if converged:
+                break
+            # balance the residuals: a larger rho pulls the districts
+            # closer to z, a smaller one lets z follow them faster
+            if primal_residual > 10 * dual_residual:
+                scale *= 2
+            elif dual_residual > 10 * primal_residual:
+                scale /= 2
+        else:
+            logging.warning('No convergence after {0} iterations, residuals '
+                            '{1:.4f} {2:.4f} above the tolerance {3}; the '
+                            'exchange is fixed to the last z'.format(
+                                max_iterations, primal_residual,
+                                dual_residual, tolerance))
+
+        solved = pool.map(_solve_district, [
+            (name, exchange, scale, True) for name, exchange in
+            _exchange(names, arcs, np.zeros_like(prices), sent).items()])
+
+    costs = pd.Series({name: costs for name, costs, _, _ in solved},
+                      name='costs [EUR]')
+    columns = ['{0}->{1} {2}'.format(arc.sender, arc.receiver, arc.bus)
+               for arc in arcs]
+    timeindex = pd.date_range('1/1/2030', periods=number_of_time_steps,
+                              freq='H')
+    return DistrictResults(
+        {name: results for name, _, results, _ in solved}, costs,
+        pd.DataFrame(sent.T, index=timeindex, columns=columns),
+        pd.DataFrame((prices[:, 1] / (1 - loss)).T, index=timeindex,
+                     columns=columns),
+        iteration, primal_residual, dual_residual, converged)
+
+
+###############################################################################
+# command line
+###############################################################################
+def district_argument(text):
+    # name=design file[,factor of the electricity demand[,of the heat demand]]
+    name, _, values = text.partition('=')
+    values = values.split(',')
+    if not values[0] or len(values) > 3:
+        raise argparse.ArgumentTypeError(
+            'expected name=design.csv[,factor_el[,factor_th]], got {0}'
+            .format(text))
+    factors = [float(value) for value in values[1:]]
+    return name, values[0], factors + [1.] * (2 - len(factors))
+
+
+def link_argument(text):
+    # district_a,district_b,bus,capacity[,loss]
+    values = text.split(',')
+    if len(values) not in (4, 5) or values[2] not in ('electricity',
+                                                        'heat'):
+        raise argparse.ArgumentTypeError(
+            'expected district_a,district_b,electricity|heat,capacity'
+            '[,loss], got {0}'.format(text))
+    return Link(values[0], values[1], values[2],
+                *[float(value) for value in values[3:]])
+
+
+def add_arguments(parser):
+    """Arguments of the districts command."""
+    from cli import abs_path
+    from cli import input_arguments
+
+    input_arguments(parser)
+    parser.add_argument('--district', action='append', required=True,
+                        type=district_argument,
+                        metavar='name=design.csv[,factor_el[,factor_th]]',
+                        help='district with the design parameters of a file'
+                        ' in --data-dir and the demands of the weather data'
+                        ' times the factors')
+    parser.add_argument('--link', action='append', default=[],
+                        type=link_argument,
+                        metavar='district_a,district_b,bus,capacity[,loss]')
+    parser.add_argument('--time-steps', type=int, default=None,
+                        help='number of hours, default: all')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--rho', type=float, default=10.)
+    parser.add_argument('--max-iterations', type=int, default=50)
+    parser.add_argument('--output', default=abs_path
+                        + '/results/district_exchange.csv')
+
+
+def main(args):
+    """Run the districts command of the parsed arguments args."""
+    from cli import load_inputs
+    from input_data import load_parameters
+
+    inputs, _ = load_inputs(args)
+    districts = [District(name,
+                          load_parameters(os.path.join(args.data_dir,
+                                                       design)),
+                          scaled_weather(inputs.weather, *factors))
+                 for name, design, factors in args.district]
+    solution = solve_districts(districts, args.link, inputs.params,
+                               args.time_steps, processes=args.processes,
+                               rho=args.rho,
+                               max_iterations=args.max_iterations)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    solution.exchange.to_csv(args.output)
+    print(solution.costs)
+    print(solution.exchange.sum())
+
+
+if __name__ == '__main__':
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    # the city of design_parameters.csv next to a district with half its
+    # demand, one CHP and no wind turbines
+    suburb = dict(design, number_of_windturbines=0, number_of_chps=1)
+    districts = [District('city', design, inputs.weather),
+                 District('suburb', suburb,
+                          scaled_weather(inputs.weather, 0.5, 0.5))]
+    links = [Link('city', 'suburb', 'electricity', 20., 0.02),
+             Link('city', 'suburb', 'heat', 5., 0.1)]
+
+    solution = solve_districts(districts, links, inputs.params,
+                               number_of_time_steps=24 * 7)
+    print(solution.costs)
+    print(solution.exchange.sum())
@@ -0,0 +1,320 @@
+"""
+Construction and optimisation of the energy system of the city.
+
+The model used to be built at module level in main_script.py. The functions
+below contain the same component definitions so that a design can be built
+and solved repeatedly from other scripts (e.g. the design sweep).
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import oemof.solph as solph
+import oemof.outputlib as outputlib
+from oemof.tools import helpers
+from pyomo.opt import SolverFactory
+
+import logging
+import os
+import pandas as pd
+import time
+
+from design_components import components
+from input_data import merge_parameters
+from profiling import phase
+from profiling import profiled
+from solver_config import DIRECT_SOLVERS
+from solver_config import iterations
+from solver_config import pick_solver
+from solver_config import solver_options
+
+@profiled('create objects')
+def build_energy_system(design, params, weather, number_of_time_steps=None,
+                        investments=None):
+    """
+    Create the oemof energy system for one design.
+
+    design holds the values of design_parameters.csv, params the general
+    parameters and weather the hourly time series of an InputBundle (see
+    input_data.py). By default the whole weather series is simulated.
+
+    investments maps component labels to solph.Investment objects; the
+    size of these components is optimised instead of taken from the design
+    (see investment.py).
+    """
+    param_value = merge_parameters(design, params)
+    if number_of_time_steps is None:
+        number_of_time_steps = len(weather)
+    investments = investments or {}
+    present = components(param_value) | set(investments)
+
+    def size(label, nominal_value):
+        # nominal value of a design dependent flow or its investment
+        if label in investments:
+            return {'investment': investments[label]}
+        return {'nominal_value': nominal_value}
+
+    date_time_index = pd.date_range('1/1/2030', periods=number_of_time_steps,
+                                    freq='H')
+    energysystem = solph.EnergySystem(timeindex=date_time_index)
+
+    logging.info('Create oemof objects')
+
+    ## Bus objects
+    ###########################################################################
+    bgas = solph.Bus(label="natural_gas")
+    bel = solph.Bus(label="electricity")
+    bth = solph.Bus(label='heat')
+
+    energysystem.add(bgas, bel, bth)
+
+    ## Sink objects
+    ###########################################################################
+    #Electricty demand
+    energysystem.add(
+            solph.Sink(label='demand_el',
+                       inputs={bel: solph.Flow(
+                               actual_value=weather.demand_el,  # [MWh]
+                               nominal_value=1,
+                               fixed=True)})
+                    )
+
+    #Heat demand
+    energysystem.add(
+            solph.Sink(label='demand_th',
+                       inputs={bth: solph.Flow(
+                               actual_value=weather.demand_th,  # [MWh]
+                               nominal_value=1,
+                               fixed=True)})
+                    )
+
+    #Excess electricity
+    energysystem.add(
+            solph.Sink(label='excess_bel',
+                       inputs={bel: solph.Flow(
+                               variable_costs=param_value['var_costs_excess_bel'])})
+                    )
+
+    #Excess heat
+    energysystem.add(
+            solph.Sink(label='excess_bth',
+                       inputs={bth: solph.Flow(
+                               variable_costs=param_value['var_costs_excess_bth'])})
+                    )
+
+    ## Source objects
+    ###########################################################################
+    #Electricty shortage
+    energysystem.add(
+            solph.Source(label='shortage_bel',
+                         outputs={bel: solph.Flow(
+                                 variable_costs=param_value['var_costs_shortage_bel'])})
+                    )
+
+    #Heat shortage
+    energysystem.add(
+            solph.Source(label='shortage_bth',
+                         outputs={bth: solph.Flow(
+                                 variable_costs=param_value['var_costs_shortage_bth'])})
+                    )
+
+    #Natural gas
+    energysystem.add(
+            solph.Source(label='rgas',
+                         outputs={bgas: solph.Flow(
+                                 nominal_value=param_value['nom_val_gas'],
+                                 summed_max=param_value['sum_max_gas'],
+                                 variable_costs=param_value['var_costs_gas'])})
+                    )
+
+    # Wind turbines
+    if 'wind_turbine' in present:
+        energysystem.add(
+                solph.Source(label='wind_turbine',
+                             outputs={bel: solph.Flow(
+                                     actual_value=(weather.wind_power * 0.001),  # [MWh/unit]
+                                     fixed=True,
+                                     **size('wind_turbine', param_value['number_of_windturbines']))})  # [1]
+                        )
+
+    # Open-field photovoltaic power plant
+    if 'PV_field' in present:
+        energysystem.add(
+                solph.Source(label='PV_field',
+                             outputs={bel: solph.Flow(
+                                     actual_value=(weather.irradiation * param_value['eta_PV'] * 0.000001),  # [MWh/m²]
+                                     fixed=True,
+                                     **size('PV_field', param_value['PV_area_field']*10000))})  # [m²]
+                        )
+
+    # Rooftop photovoltaic
+    if 'PV_roof' in present:
+        energysystem.add(
+                solph.Source(label='PV_roof',
+                             outputs={bel: solph.Flow(
+                                     actual_value=(weather.irradiation * param_value['eta_PV'] * 0.000001),  # [MWh/m²]
+                                     fixed=True,
+                                     **size('PV_roof', param_value['PV_area_roof']*10000))})  # [m²]
+                        )
+
+    # Rooftop solar thermal
+    if 'solar_thermal' in present:
+        energysystem.add(
+                solph.Source(label='solar_thermal',
+                             outputs={bth: solph.Flow(
+                                     actual_value=(weather.irradiation * param_value['eta_solar_th'] * 0.000001),  # [MWh/m²]
+                                     fixed=True,
+                                     **size('solar_thermal', param_value['area_solar_th']*10000))})  # [m²]
+                        )
+
+    # Combined heat and power plant
+    if 'chp' in present:
+        energysystem.add(
+                solph.Transformer(label='chp',
+                                  inputs={bgas: solph.Flow()},
+                                  outputs={bth: solph.Flow(
+                                          **size('chp', param_value['number_of_chps']*param_value['chp_heat_output'])),  # [MW]
+                                           bel: solph.Flow()},
+                                  conversion_factors={bth: param_value['conversion_factor_bth_chp'],
+                                                      bel: param_value['conversion_factor_bel_chp']})
+                        )
+
+    # Boiler
+    if 'boiler' in present:
+        energysystem.add(
+                solph.Transformer(label='boiler',
+                                  inputs={bgas: solph.Flow()},
+                                  outputs={bth: solph.Flow(
+                                          **size('boiler', param_value['number_of_boilers']*param_value['boiler_heat_output']))},   # [MWh]
+                                  conversion_factors={bth: param_value['conversion_factor_boiler']})
+                        )
+
+    # Heat pump
+    if 'heat_pump' in present:
+        energysystem.add(
+                solph.Transformer(label='heat_pump',
+                                  inputs={bel: solph.Flow()},
+                                  outputs={bth: solph.Flow(
+                                          **size('heat_pump', param_value['number_of_heat_pumps'] * param_value['heatpump_heat_output']))},  # [MW]
+                                  conversion_factors={bth: param_value['COP_heat_pump']})
+                        )
+
+    def storage_size(label, capacity, charge_time):
+        # storage and flow arguments of the nominal values or the investment
+        if label in investments:
+            return ({'investment': investments[label],
+                     'invest_relation_input_capacity': 1 / charge_time,
+                     'invest_relation_output_capacity': 1 / charge_time},
+                    {})
+        return ({'nominal_storage_capacity': capacity},
+                {'nominal_value': capacity / charge_time})
+
+    # Thermal storage
+    if 'storage_th' in present:
+        storage, flow = storage_size('storage_th',
+                                     param_value['capacity_thermal_storage'] * param_value['daily_demand_th'],
+                                     param_value['charge_time_storage_th'])
+        energysystem.add(
+                solph.components.GenericStorage(label='storage_th',
+                                                inputs={bth: solph.Flow(**flow)},
+                                                outputs={bth: solph.Flow(**flow)},
+                                                loss_rate=param_value['capacity_loss_storage_th'],
+                                                initial_storage_level=param_value['init_capacity_storage_th'],
+                                                inflow_conversion_factor=param_value['inflow_conv_factor_storage_th'],
+                                                outflow_conversion_factor=param_value['outflow_conv_factor_storage_th'],
+                                                **storage)
+                          )
+
+    # Electricty storage
+    if 'storage_el' in present:
+        storage, flow = storage_size('storage_el',
+                                     param_value['capacity_electr_storage'] * param_value['daily_demand_el'],
+                                     param_value['charge_time_storage_el'])
+        energysystem.add(
+                solph.components.GenericStorage(label='storage_el',
+                                                inputs={bel: solph.Flow(**flow)},
+                                                outputs={bel: solph.Flow(**flow)},
+                                                loss_rate=param_value['capacity_loss_storage_el'],
+                                                initial_storage_level=param_value['init_capacity_storage_el'],
+                                                inflow_conversion_factor=param_value['inflow_conv_factor_storage_el'],
+                                                outflow_conversion_factor=param_value['outflow_conv_factor_storage_el'],
+                                                **storage)
+                        )
+
+    return energysystem
+
+
+def solve_model(model, solver, options, solver_verbose=False):
+    """
+    Solve a built solph.Model.
+
+    solver is the name of an installed solver (see solver_config.pick_solver)
+    and options its options, see solver_config.solver_options.
+    """
+    if solver in DIRECT_SOLVERS:
+        opt = SolverFactory(solver)
+        opt.options.update(options)
+        solver_results = opt.solve(model, tee=solver_verbose)
+        model.es.results = solver_results
+        model.solver_results = solver_results
+    else:
+        model.solve(solver=solver, solve_kwargs={'tee': solver_verbose},
+                    cmdline_options=options)
+
+
+def solve_energy_system(energysystem, solver='cbc', solver_verbose=False,
+                        write_lp_file=False, duals=False, **settings):
+    """
+    Optimise the energy system and store the results in energysystem.results.
+
+    solver may be 'auto' for the fastest installed solver, settings are
+    those of solver_config.solver_options (threads, method, time_limit,
+    mip_gap, tolerance). Build and solve time, solver, options and iteration
+    count are added to energysystem.results['meta']. With duals=True the
+    duals and reduced costs are imported into model.dual and model.rc (see
+    sensitivity.py).
+
+    Returns the solved solph.Model.
+    """
+    solver = pick_solver(solver)
+    options = solver_options(solver, **settings)
+
+    logging.info('Optimise the energy system')
+
+    start = time.perf_counter()
+    with phase('build model'):
+        model = solph.Model(energysystem)
+        if duals:
+            model.receive_duals()
+    build_time = time.perf_counter() - start
+
+    if write_lp_file:
+        filename = os.path.join(
+            helpers.extend_basic_path('lp_files'), 'model.lp')
+        logging.info('Store lp-file in {0}.'.format(filename))
+        with phase('write lp file'):
+            model.write(filename,
+                        io_options={'symbolic_solver_labels': True})
+
+    # if tee_switch is true solver messages will be displayed
+    logging.info('Solve the optimization problem')
+    start = time.perf_counter()
+    with phase('solve'):
+        solve_model(model, solver, options, solver_verbose)
+    solve_time = time.perf_counter() - start
+
+    with phase('process results'):
+        energysystem.results['main'] = outputlib.processing.results(model)
+        energysystem.results['meta'] = outputlib.processing.meta_results(
+            model)
+    energysystem.results['meta'].update({
+        'solver_name': solver,
+        'solver_options': options,
+        'build_time': build_time,
+        'solve_time': solve_time,
+        'iterations': iterations(energysystem.results['meta'].get('solver')),
+        })
+    logging.info('Built in {0:.1f} s, solved in {1:.1f} s'.format(
+        build_time, solve_time))
+
+    return model
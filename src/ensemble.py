@@ -0,0 +1,148 @@
+"""
+Ensemble of weather years for one design.
+
+The design is solved for many weather years (historical or synthetic) to see
+how robust its KPIs are, instead of the single year of weather_data.CSV. The
+model is built once per worker process; for every further weather year only
+the profiles of the demands and fixed sources are swapped (see
+PersistentModel.set_weather). The result is the distribution of the KPIs
+over the weather years.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import glob
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+import oemof.outputlib as outputlib
+
+from input_data import WEATHER_COLUMNS
+from input_data import Weather
+from input_data import merge_parameters
+from input_data import parse_weather
+from kpi import FLOW_SUMS
+from kpi import evaluate_kpis
+from kpi import flow_sums
+from persistent_model import PersistentModel
+
+# set once per worker process by _init_worker
+_worker_state = {}
+
+
+def load_weather_years(source):
+    """
+    Weather years as a dict of name -> Weather.
+
+    source is either a directory with one file per year in the format of
+    weather_data.CSV (the file names are the names of the years) or an array
+    of shape (years, hours, 4) with the columns in the order of
+    WEATHER_COLUMNS.
+    """
+    if isinstance(source, str):
+        file_paths = sorted(set(glob.glob(os.path.join(source, '*.csv'))
+                                + glob.glob(os.path.join(source, '*.CSV'))))
+        if not file_paths:
+            raise ValueError('No weather files in {0}'.format(source))
+        return {os.path.splitext(os.path.basename(file_path))[0]:
+                parse_weather(file_path) for file_path in file_paths}
+
+    source = np.asarray(source, dtype=np.float64)
+    if source.ndim != 3 or source.shape[2] != len(WEATHER_COLUMNS):
+        raise ValueError('Expected an array of shape (years, hours, {0})'
+                         .format(len(WEATHER_COLUMNS)))
+    return {number: Weather(*source[number].T)
+            for number in range(len(source))}
+
+
+def _init_worker(design, params, cfg):
+    _worker_state['design'] = design
+    _worker_state['params'] = params
+    _worker_state['cfg'] = cfg
+
+
+def _solve_year(weather):
+    # build the model for the first weather year of this worker, then only
+    # swap the profiles
+    cfg = _worker_state['cfg']
+    try:
+        model = _worker_state.get('model')
+        if model is None:
+            model = PersistentModel(_worker_state['design'],
+                                    _worker_state['params'], weather,
+                                    cfg['number_of_time_steps'],
+                                    solver=cfg['solver'],
+                                    solver_verbose=cfg['solver_verbose'])
+            _worker_state['model'] = model
+        else:
+            model.set_weather(weather)
+        model.solve()
+        return flow_sums(outputlib.views.convert_keys_to_strings(
+            model.energysystem.results['main']))
+    except Exception:
+        logging.exception('Weather year could not be solved')
+        return dict.fromkeys(FLOW_SUMS, np.nan)
+
+
+def run_ensemble(design, params, weather_years, solver='cbc',
+                 number_of_time_steps=None, processes=None,
+                 solver_verbose=False):
+    """
+    Solve design for every weather year in parallel.
+
+    weather_years maps names to Weather objects, see load_weather_years().
+    Returns a DataFrame of the KPIs (see kpi.evaluate_kpis) with one row per
+    weather year; years that could not be solved have NaN KPIs.
+    """
+    cfg = {'solver': solver,
+           'solver_verbose': solver_verbose,
+           'number_of_time_steps': number_of_time_steps}
+    if processes is None:
+        processes = os.cpu_count()
+    names = list(weather_years)
+
+    logging.info('Solve {0} weather years with {1} processes'.format(
+        len(names), processes))
+
+    # consecutive years per worker, so that each builds its model only once
+    chunksize = max(1, -(-len(names) // processes))
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(design, params, cfg)) as pool:
+        sums = pool.map(_solve_year, [weather_years[name] for name in names],
+                        chunksize=chunksize)
+
+    param_value = merge_parameters(design, params)
+    return evaluate_kpis(param_value, param_value,
+                         pd.DataFrame(sums, index=names))
+
+
+def kpi_distribution(kpis, percentiles=(0.05, 0.5, 0.95)):
+    """Mean, standard deviation, extremes and percentiles of every KPI."""
+    return kpis.describe(percentiles=list(percentiles))
+
+
+if __name__ == '__main__':
+    import sys
+
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    # directory of weather years given on the command line
+    weather_years = load_weather_years(sys.argv[1])
+
+    kpis = run_ensemble(design, inputs.params, weather_years)
+    kpis.to_csv(abs_path + '/results/ensemble_kpis.csv')
+    print(kpi_distribution(kpis))
@@ -0,0 +1,249 @@
+"""
+Dispatch of designs without storages in NumPy, without Pyomo and a solver.
+
+Without storages there is no coupling between the hours: every hour is a
+small LP with the two balances of electricity and heat (natural gas is
+balanced by its source) and seven variables
+
+    gas to CHP, gas to boiler, electricity to heat pump,
+    shortage and excess of electricity and heat.
+
+An optimal solution of such an LP is a basic solution: two variables are
+determined by the balances, all others are at a bound (0 or the capacity).
+All basic solutions are evaluated for all hours at once and the cheapest
+feasible one is chosen per hour. This is the same optimum the LP solver
+finds for the model of energy_system.py, up to alternative optima of equal
+cost, see verify_against_lp(). Alternative optima have the same costs but
+may differ in CO2-emission and self-sufficiency.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+
+from design_components import components
+from design_components import design_values
+from input_data import merge_parameters
+
+# columns of the hourly LP
+GAS_CHP, GAS_BOILER, EL_HEAT_PUMP, SHORTAGE_EL, SHORTAGE_TH, EXCESS_EL, \
+    EXCESS_TH = range(7)
+
+# relative tolerance for bounds and cost comparisons
+TOLERANCE = 1e-9
+
+
+def has_storage(param_value):
+    """True if the design contains a thermal or electrical storage."""
+    return (param_value['capacity_electr_storage'] > 0
+            or param_value['capacity_thermal_storage'] > 0)
+
+
+def solve_hourly_lps(A, b, cost, upper):
+    """
+    Solve min cost @ x s.t. A @ x == b[t], 0 <= x <= upper for every hour t.
+
+    A has two rows, b one row per hour; upper is np.inf for unbounded
+    variables. Returns the optimal x per hour.
+    """
+    number_of_hours = len(b)
+    number_of_variables = A.shape[1]
+    bounded = np.isfinite(upper) & (upper > 0)
+
+    best_cost = np.full(number_of_hours, np.inf)
+    best_x = np.zeros((number_of_hours, number_of_variables))
+
+    for basis in itertools.combinations(range(number_of_variables), 2):
+        basis = list(basis)
+        A_B = A[:, basis]
+        if abs(np.linalg.det(A_B)) < TOLERANCE:
+            continue
+        A_B_inv = np.linalg.inv(A_B)
+        upper_B = upper[basis]
+
+        nonbasic = [k for k in range(number_of_variables)
+                    if k not in basis and bounded[k]]
+        for at_upper in itertools.product((False, True),
+                                          repeat=len(nonbasic)):
+            x_N = np.zeros(number_of_variables)
+            for k, up in zip(nonbasic, at_upper):
+                if up:
+                    x_N[k] = upper[k]
+
+            x_B = (b - A @ x_N) @ A_B_inv.T
+            scale = 1 + np.abs(x_B)
+            feasible = ((x_B >= -TOLERANCE * scale)
+                        & (x_B <= upper_B + TOLERANCE * scale)).all(axis=1)
+            total_cost = cost @ x_N + x_B @ cost[basis]
+            better = feasible & (
+                total_cost < best_cost - TOLERANCE * (1 + np.abs(total_cost)))
+            if better.any():
+                best_cost[better] = total_cost[better]
+                best_x[better] = x_N
+                best_x[np.ix_(better, basis)] = x_B[better]
+
+    return np.clip(best_x, 0, upper)
+
+
+def dispatch(design, params, weather):
+    """
+    Optimal hourly flows of a design without storages.
+
+    Returns a dict of flow arrays keyed by (source label, target label) with
+    the same flows as the results of the LP.
+    """
+    param_value = merge_parameters(design, params)
+    if has_storage(param_value):
+        raise ValueError('The fast dispatch only applies to designs without '
+                         'storages')
+
+    pv = param_value
+    present = components(pv)
+    values = design_values(pv, weather)
+    zeros = np.zeros(len(weather))
+
+    feed_in_el = sum(values[label] if label in present else zeros
+                     for label in ('wind_turbine', 'PV_field', 'PV_roof'))
+    feed_in_th = values['solar_thermal'] if 'solar_thermal' in present \
+        else zeros
+
+    cf_el_chp = pv['conversion_factor_bel_chp']
+    cf_th_chp = pv['conversion_factor_bth_chp']
+    eta_boiler = pv['conversion_factor_boiler']
+    cop = pv['COP_heat_pump']
+
+    # rows: electricity and heat balance
+    A = np.array([[cf_el_chp, 0, -1, 1, 0, -1, 0],
+                  [cf_th_chp, eta_boiler, cop, 0, 1, 0, -1]])
+    b = np.column_stack([weather.demand_el - feed_in_el,
+                         weather.demand_th - feed_in_th])
+    cost = np.array([pv['var_costs_gas'], pv['var_costs_gas'], 0,
+                     pv['var_costs_shortage_bel'],
+                     pv['var_costs_shortage_bth'],
+                     pv['var_costs_excess_bel'],
+                     pv['var_costs_excess_bth']])
+    upper = np.array([values['chp'] / cf_th_chp,
+                      values['boiler'] / eta_boiler,
+                      values['heat_pump'] / cop,
+                      np.inf, np.inf, np.inf, np.inf])
+
+    # the gas source must not limit the dispatch, else the hours are coupled
+    if upper[GAS_CHP] + upper[GAS_BOILER] > pv['nom_val_gas']:
+        raise ValueError('Gas demand may exceed nom_val_gas, use the LP')
+
+    x = solve_hourly_lps(A, b, cost, upper)
+
+    gas = x[:, GAS_CHP] + x[:, GAS_BOILER]
+    # summed_max of oemof is relative to the nominal value
+    if gas.sum() > pv['sum_max_gas'] * pv['nom_val_gas']:
+        raise ValueError('Gas demand exceeds sum_max_gas, use the LP')
+
+    flows = {
+        ('electricity', 'demand_el'): weather.demand_el.copy(),
+        ('heat', 'demand_th'): weather.demand_th.copy(),
+        ('electricity', 'excess_bel'): x[:, EXCESS_EL],
+        ('heat', 'excess_bth'): x[:, EXCESS_TH],
+        ('shortage_bel', 'electricity'): x[:, SHORTAGE_EL],
+        ('shortage_bth', 'heat'): x[:, SHORTAGE_TH],
+        ('rgas', 'natural_gas'): gas,
+        }
+    for label in ('wind_turbine', 'PV_field', 'PV_roof'):
+        if label in present:
+            flows[label, 'electricity'] = values[label]
+    if 'solar_thermal' in present:
+        flows['solar_thermal', 'heat'] = values['solar_thermal']
+    if 'chp' in present:
+        flows['natural_gas', 'chp'] = x[:, GAS_CHP]
+        flows['chp', 'heat'] = x[:, GAS_CHP] * cf_th_chp
+        flows['chp', 'electricity'] = x[:, GAS_CHP] * cf_el_chp
+    if 'boiler' in present:
+        flows['natural_gas', 'boiler'] = x[:, GAS_BOILER]
+        flows['boiler', 'heat'] = x[:, GAS_BOILER] * eta_boiler
+    if 'heat_pump' in present:
+        flows['electricity', 'heat_pump'] = x[:, EL_HEAT_PUMP]
+        flows['heat_pump', 'heat'] = x[:, EL_HEAT_PUMP] * cop
+    return flows
+
+
+def dispatch_results(design, params, weather):
+    """
+    Dispatch of a design in the format of the string keyed LP results.
+
+    The result can be passed to display_results and the plotting functions
+    like the output of outputlib.views.convert_keys_to_strings.
+    """
+    timeindex = pd.date_range('1/1/2030', periods=len(weather), freq='H')
+    return {key: {'scalars': pd.Series(dtype=float),
+                  'sequences': pd.DataFrame({'flow': flow}, index=timeindex)}
+            for key, flow in dispatch(design, params, weather).items()}
+
+
+def verify_against_lp(design, params, weather):
+    """
+    Compare the fast dispatch with the LP of energy_system.py.
+
+    The LP is solved by HiGHS in memory (see sparse_model.py), without
+    oemof and Pyomo. Returns a DataFrame with the annual sum of every flow
+    of both and the objective value (variable costs) of both in the last
+    row.
+
+    The objectives agree, the flows only up to alternative optima of equal
+    cost: in hours where heat of the CHP costs as much as heat shortage, the
+    two may choose differently, with the same costs but different gas use,
+    CO2-emission and self-sufficiency.
+    """
+    from sparse_model import solve_sparse
+
+    pv = merge_parameters(design, params)
+    flows = dispatch(design, params, weather)
+
+    model = solve_sparse(design, params, weather)
+    string_results = model.results['main']
+
+    comparison = pd.DataFrame(
+        {'fast dispatch': {key: flow.sum() for key, flow in flows.items()},
+         'LP': {key: string_results[key]['sequences']['flow'].sum()
+                for key in flows}})
+
+    costs = {'fast dispatch': 0, 'LP': model.results['meta']['objective']}
+    for key, name in ((('rgas', 'natural_gas'), 'var_costs_gas'),
+                      (('shortage_bel', 'electricity'),
+                       'var_costs_shortage_bel'),
+                      (('shortage_bth', 'heat'), 'var_costs_shortage_bth'),
+                      (('electricity', 'excess_bel'), 'var_costs_excess_bel'),
+                      (('heat', 'excess_bth'), 'var_costs_excess_bth')):
+        costs['fast dispatch'] += flows[key].sum() * pv[name]
+    comparison.loc[('objective', ''), :] = pd.Series(costs)
+
+    deviation = ((comparison['fast dispatch'] - comparison['LP']).abs()
+                 / comparison['LP'].abs().clip(lower=1))
+    logging.info('Largest deviation from the LP: {0:.2e}'.format(
+        deviation.max()))
+    comparison['deviation'] = deviation
+    return comparison
+
+
+if __name__ == '__main__':
+    import os
+
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+
+    # reference case: the design of design_parameters.csv without storages
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+    design['capacity_electr_storage'] = 0
+    design['capacity_thermal_storage'] = 0
+
+    print(verify_against_lp(design, inputs.params, inputs.weather))
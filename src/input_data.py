@@ -0,0 +1,269 @@
+"""
+Loading of the input data of the energy system.
+
+weather_data.CSV and general_parameters.csv are parsed once into an
+immutable, NumPy backed bundle. The parsed bundle is cached on disk as NPZ,
+keyed by a hash of the file contents, so later runs skip CSV parsing and
+pandas altogether as long as the files are unchanged.
+
+Weather files are read in chunks and resampled to hours on the fly, so long
+(multi-year) or sub-hourly (e.g. 15 minute) series never exist as a full raw
+DataFrame in memory; only the hourly arrays the model needs are kept.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+from collections import namedtuple
+from collections.abc import Mapping
+import csv
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from profiling import profiled
+
+# bump when the layout of the cache files changes
+CACHE_VERSION = 1
+
+# attribute name of Weather -> column of weather_data.CSV
+WEATHER_COLUMNS = {'demand_el': 'Demand_el [MWh]',
+                   'demand_th': 'Demand_th [MWh]',
+                   'irradiation': 'Sol_irradiation [Wh/sqm]',
+                   'wind_power': 'Wind_power [kW/unit]'}
+
+# aggregation of the steps of an hour in sub-hourly weather data: energies
+# per step are summed, powers averaged
+RESAMPLING = {'demand_el': 'sum',
+              'demand_th': 'sum',
+              'irradiation': 'sum',
+              'wind_power': 'mean'}
+
+# rows of the weather file read at once
+CHUNK_SIZE = 24 * 7 * 4
+
+InputBundle = namedtuple('InputBundle', ['weather', 'params', 'key'])
+
+# bundles already loaded in this process, keyed by content hash
+_bundles = {}
+
+
+class Weather(object):
+    """
+    Read-only hourly time series of the weather data.
+
+    The series are available as attributes (weather.demand_el) and, like the
+    DataFrame they replace, by column name (weather['Demand_el [MWh]']).
+    """
+    __slots__ = tuple(WEATHER_COLUMNS)
+
+    def __init__(self, demand_el, demand_th, irradiation, wind_power):
+        for name, values in zip(self.__slots__,
+                                (demand_el, demand_th, irradiation,
+                                 wind_power)):
+            values = np.asarray(values, dtype=np.float64)
+            if values.flags.writeable:
+                values = values.copy()
+                values.flags.writeable = False
+            object.__setattr__(self, name, values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Weather data is read-only')
+
+    def __reduce__(self):
+        return (Weather, tuple(getattr(self, name)
+                               for name in self.__slots__))
+
+    def __getitem__(self, column):
+        for name, weather_column in WEATHER_COLUMNS.items():
+            if weather_column == column:
+                return getattr(self, name)
+        raise KeyError(column)
+
+    def __len__(self):
+        return len(self.demand_el)
+
+    def window(self, start, stop):
+        """Weather of the hours start to stop (exclusive), without copying."""
+        return Weather(*(getattr(self, name)[start:stop]
+                         for name in self.__slots__))
+
+
+class Parameters(Mapping):
+    """Read-only mapping of parameter names (var_name) to values."""
+
+    def __init__(self, values):
+        self._values = dict(values)
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return 'Parameters({0!r})'.format(self._values)
+
+
+###############################################################################
+# parsing
+###############################################################################
+def load_parameters(file_path):
+    """Read a parameter file (design or general) as {var_name: value}."""
+    with open(file_path, newline='') as f:
+        return {row['var_name']: float(row['value'])
+                for row in csv.DictReader(f)}
+
+
+def merge_parameters(design, params):
+    """Combine design and general parameters, the design takes precedence."""
+    param_value = dict(params)
+    param_value.update(design)
+    return param_value
+
+
+def _hourly(values, steps_per_hour):
+    # values has one row per step and the columns of WEATHER_COLUMNS
+    steps = values.reshape(-1, steps_per_hour, values.shape[1])
+    return [getattr(steps[:, :, number], RESAMPLING[name])(axis=1)
+            for number, name in enumerate(WEATHER_COLUMNS)]
+
+
+def stream_weather(file_path, steps_per_hour=1, chunk_size=CHUNK_SIZE):
+    """
+    Hourly Weather of consecutive parts of a weather file.
+
+    The file is read chunk_size rows at a time; steps_per_hour > 1 resamples
+    sub-hourly data to hours (see RESAMPLING). Raises ValueError for missing
+    values and for files that do not end with a whole hour.
+    """
+    import pandas as pd
+
+    columns = list(WEATHER_COLUMNS.values())
+    reader = pd.read_csv(file_path, usecols=columns,
+                         dtype=dict.fromkeys(columns, np.float64),
+                         chunksize=chunk_size * steps_per_hour)
+    rest = np.zeros((0, len(columns)))
+    for chunk in reader:
+        values = chunk[columns].to_numpy()
+        missing = np.isnan(values).any(axis=1)
+        if missing.any():
+            raise ValueError('Missing values in row {0} of {1}'.format(
+                chunk.index[missing][0] + 1, file_path))
+        values = np.vstack([rest, values])
+        whole = len(values) - len(values) % steps_per_hour
+        rest = values[whole:]
+        if whole:
+            yield Weather(*_hourly(values[:whole], steps_per_hour))
+    if len(rest):
+        raise ValueError('{0} ends with an incomplete hour of {1} steps'
+                         .format(file_path, len(rest)))
+
+
+def concat_weather(parts):
+    """One Weather of consecutive Weather parts."""
+    return Weather(*(np.concatenate([getattr(part, name) for part in parts])
+                     for name in Weather.__slots__))
+
+
+def parse_weather(file_path, steps_per_hour=1, number_of_time_steps=None):
+    """
+    Parse a weather file like weather_data.CSV into an hourly Weather object.
+
+    With number_of_time_steps the length of the hourly series is checked.
+    """
+    weather = concat_weather(list(stream_weather(file_path, steps_per_hour)))
+    if (number_of_time_steps is not None
+            and len(weather) != number_of_time_steps):
+        raise ValueError('{0} has {1} hours, expected {2}'.format(
+            file_path, len(weather), number_of_time_steps))
+    return weather
+
+
+###############################################################################
+# cached loading
+###############################################################################
+def content_hash(*file_paths, **options):
+    """Hash of the contents of the given files and of options to read them."""
+    sha = hashlib.sha256(str(CACHE_VERSION).encode())
+    for file_path in file_paths:
+        file_sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 20), b''):
+                file_sha.update(block)
+        sha.update(file_sha.digest())
+    if options:
+        sha.update(repr(sorted(options.items())).encode())
+    return sha.hexdigest()
+
+
+def _read_cache(cache_file, key):
+    with np.load(cache_file, allow_pickle=False) as npz:
+        weather = Weather(*(npz[name] for name in Weather.__slots__))
+        params = Parameters(zip(npz['param_names'].tolist(),
+                                npz['param_values'].tolist()))
+    return InputBundle(weather, params, key)
+
+
+def _write_cache(cache_file, bundle):
+    # write to a temporary file first so that concurrent runs never see a
+    # partially written cache file
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f,
+                     param_names=np.array(list(bundle.params), dtype=str),
+                     param_values=np.array(list(bundle.params.values()),
+                                           dtype=np.float64),
+                     **{name: getattr(bundle.weather, name)
+                        for name in Weather.__slots__})
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+@profiled('load inputs')
+def load_input_bundle(weather_file, params_file, cache_dir=None,
+                      steps_per_hour=1):
+    """
+    Load weather data and general parameters as an InputBundle.
+
+    The bundle is looked up in this order: bundles already loaded in this
+    process, the NPZ cache in cache_dir and finally the CSV files. Pass
+    cache_dir=None to disable the on-disk cache. steps_per_hour is the
+    resolution of the weather file, which is resampled to hours.
+    """
+    if steps_per_hour == 1:
+        key = content_hash(weather_file, params_file)
+    else:
+        key = content_hash(weather_file, params_file,
+                           steps_per_hour=steps_per_hour)
+    if key in _bundles:
+        return _bundles[key]
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, 'inputs_{0}.npz'.format(key))
+
+    if cache_file is not None and os.path.exists(cache_file):
+        logging.info('Load input data from cache {0}'.format(cache_file))
+        bundle = _read_cache(cache_file, key)
+    else:
+        logging.info('Parse input data from {0} and {1}'.format(
+            weather_file, params_file))
+        bundle = InputBundle(parse_weather(weather_file, steps_per_hour),
+                             Parameters(load_parameters(params_file)), key)
+        if cache_file is not None:
+            _write_cache(cache_file, bundle)
+
+    _bundles[key] = bundle
+    return bundle
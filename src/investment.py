@@ -0,0 +1,136 @@
+"""
+Investment optimisation of the design.
+
+Instead of solving the dispatch of many given designs, the sizes of selected
+components are decision variables of one LP: every unit of size costs the
+annuity of its investment costs (invest_cost_*, lifetime and wacc of
+general_parameters.csv), so the optimum is the design with the lowest annual
+costs, the 'Costs [Mio. EUR/a]' KPI of display_results.
+
+The sizes are optimised continuously, also numbers of units (wind turbines,
+CHPs, ...); round them and solve the dispatch of the rounded design to get
+an installable design.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import logging
+
+import oemof.solph as solph
+import oemof.outputlib as outputlib
+
+from design_components import DESIGN_COMPONENTS
+from design_components import STORAGES
+from energy_system import build_energy_system
+from energy_system import solve_energy_system
+from input_data import merge_parameters
+from kpi import INVESTMENT_COSTS
+from kpi import annuity_factor
+
+
+def nominal_units(params):
+    """Nominal value of a component (MW, m², MWh, ...) per unit of design."""
+    return {'number_of_windturbines': 1,  # feed-in per turbine
+            'PV_area_field': 10000,  # [m²/ha]
+            'PV_area_roof': 10000,
+            'area_solar_th': 10000,
+            'number_of_chps': params['chp_heat_output'],  # [MW/unit]
+            'number_of_boilers': params['boiler_heat_output'],
+            'number_of_heat_pumps': params['heatpump_heat_output'],
+            'capacity_thermal_storage': params['daily_demand_th'],  # [MWh]
+            'capacity_electr_storage': params['daily_demand_el']}
+
+
+def _labels():
+    return {name: label for label, (name, _) in DESIGN_COMPONENTS.items()}
+
+
+def investments(params, bounds):
+    """
+    solph.Investment per component label for the design parameters in bounds.
+
+    bounds maps design parameters to their upper bound in the units of
+    design_parameters.csv (e.g. {'number_of_windturbines': 12}).
+    """
+    labels = _labels()
+    units = nominal_units(params)
+    annuity = float(annuity_factor(params['lifetime'], params['wacc']))
+
+    result = {}
+    for name, upper in bounds.items():
+        if name not in labels:
+            raise ValueError('{0} is not a design parameter'.format(name))
+        result[labels[name]] = solph.Investment(
+            ep_costs=params[INVESTMENT_COSTS[name]] * annuity / units[name],
+            maximum=upper * units[name])
+    return result
+
+
+def optimal_design(energysystem, design, params, bounds):
+    """Design with the optimised sizes of a solved investment model."""
+    string_results = outputlib.views.convert_keys_to_strings(
+        energysystem.results['main'])
+    labels = _labels()
+    units = nominal_units(params)
+
+    optimum = dict(design)
+    for name in bounds:
+        label = labels[name]
+        if label in STORAGES:
+            key = (label, 'None')
+        else:
+            key = (label, DESIGN_COMPONENTS[label][1])
+        optimum[name] = string_results[key]['scalars']['invest'] / units[name]
+    return optimum
+
+
+def solve_investment(design, params, weather, bounds,
+                     number_of_time_steps=None, solver='cbc',
+                     solver_verbose=False, **settings):
+    """
+    Optimise the sizes of the components in bounds and their dispatch.
+
+    The other design parameters keep their values of design. settings are
+    passed to solve_energy_system. Returns the optimal design and the solved
+    energy system.
+    """
+    logging.info('Optimise the sizes of {0}'.format(', '.join(bounds)))
+    energysystem = build_energy_system(design, params, weather,
+                                       number_of_time_steps,
+                                       investments=investments(params,
+                                                               bounds))
+    solve_energy_system(energysystem, solver=solver,
+                        solver_verbose=solver_verbose, **settings)
+    return optimal_design(energysystem, design, params, bounds), energysystem
+
+
+if __name__ == '__main__':
+    import os
+
+    from basic_analysis import display_results
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    bounds = {'number_of_windturbines': 12,
+              'PV_area_roof': 8,
+              'area_solar_th': 8,
+              'number_of_heat_pumps': 6,
+              'capacity_electr_storage': 3,
+              'capacity_thermal_storage': 10}
+
+    optimum, energysystem = solve_investment(design, inputs.params,
+                                             inputs.weather, bounds)
+    for name in bounds:
+        print('{0}: {1:.2f}'.format(name, optimum[name]))
+    display_results(outputlib.views.convert_keys_to_strings(
+        energysystem.results['main']), merge_parameters(optimum,
+                                                        inputs.params))
@@ -0,0 +1,436 @@
+"""
+Resumable queue of design evaluations in an SQLite file.
+
+A design study is a queue file holding the base design, the sweep options
+and one job per design. Any number of workers, started on one or several
+machines that share the file system, claim pending jobs, evaluate them (see
+sweep.evaluate_design) and store the annual flow sums of each design in the
+queue as soon as it is done. Nothing but the queue file is needed to go on
+after a crash:
+
+* a job whose worker died is claimed again once its lease has expired
+* a failed job is retried up to max_attempts times, then marked 'failed'
+* enqueueing a design that is already in the queue does nothing
+
+    python cli.py queue create study.sqlite number_of_chps=2,4 ...
+    python cli.py queue work study.sqlite --processes 8   (on every machine)
+    python cli.py queue stats study.sqlite
+    python cli.py queue results study.sqlite
+
+SQLite locks the file for every claim and completion, which needs a file
+system with working locks (local disks, most NFSv4 setups).
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from input_data import merge_parameters
+from kpi import FLOW_SUMS
+from kpi import KPI_COLUMNS
+from kpi import evaluate_kpis
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    design_key TEXT UNIQUE NOT NULL,
+    design TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    seconds REAL,
+    sums TEXT,
+    error TEXT);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, claimed_at);
+"""
+
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+# options of sweep.sweep_config that can be stored in the queue, typical
+# periods and the results cache are set up by every worker
+OPTIONS = {'solver': 'cbc',
+           'number_of_time_steps': None,
+           'solver_verbose': False,
+           'persistent': False,
+           'fast_dispatch': False,
+           'sparse': False,
+           'typical_periods': None,
+           'period_length': 24,
+           'results_cache_dir': None}
+
+
+def _design_key(design):
+    return json.dumps({name: float(value) for name, value in design.items()},
+                      sort_keys=True)
+
+
+def worker_name():
+    """Name of this process in the queue: host and process id."""
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+class JobQueue(object):
+    """
+    Queue of design evaluations in the SQLite file path.
+
+    lease is the number of seconds a claimed job is reserved for its worker;
+    after that it counts as abandoned and is handed out again. It has to be
+    longer than the evaluation of one design.
+    """
+
+    def __init__(self, path, lease=6 * 3600, max_attempts=3):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # autocommit, transactions are opened explicitly
+        self._connection = sqlite3.connect(path, timeout=60,
+                                           isolation_level=None)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock at once, so that two workers
+        # can not claim the same job
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+    ##########################################################################
+    # study
+    ##########################################################################
+    def configure(self, base_design, **options):
+        """Store the base design and the sweep options, see OPTIONS."""
+        unknown = set(options) - set(OPTIONS)
+        if unknown:
+            raise ValueError('Unknown options: {0}'.format(
+                ', '.join(sorted(unknown))))
+        settings = dict(OPTIONS, **options)
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO settings VALUES (?, ?)',
+                [('base_design', json.dumps(base_design)),
+                 ('options', json.dumps(settings))])
+
+    def settings(self):
+        """Base design and options stored by configure()."""
+        rows = dict(self._connection.execute(
+            'SELECT name, value FROM settings'))
+        if 'base_design' not in rows:
+            raise ValueError('{0} is not configured'.format(self.path))
+        return json.loads(rows['base_design']), json.loads(rows['options'])
+
+    def enqueue(self, designs):
+        """Add designs, skipping those already queued. Returns the number."""
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                'INSERT OR IGNORE INTO jobs (design_key, design) '
+                'VALUES (?, ?)',
+                [(_design_key(design), json.dumps(design))
+                 for design in designs])
+            return connection.total_changes - before
+
+    ##########################################################################
+    # jobs
+    ##########################################################################
+    def claim(self, worker=None):
+        """
+        Reserve the next pending or abandoned job for worker.
+
+        Returns (job id, design), None if there is no job left to claim.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            # jobs abandoned too often (e.g. crashing the worker) fail
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'abandoned' "
+                "WHERE status = 'running' AND claimed_at < ? "
+                "AND attempts >= ?", (now - self.lease, self.max_attempts))
+            row = connection.execute(
+                "SELECT id, design FROM jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND claimed_at < ?) "
+                "ORDER BY id LIMIT 1", (now - self.lease,)).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, "
+                    "claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker or worker_name(), now, row[0]))
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def complete(self, job_id, sums, seconds, worker=None):
+        """
+        Store the flow sums of a job, the checkpoint of its design.
+
+        Only the worker that holds the job may complete it. Returns False if
+        its lease has expired and the job has been claimed again.
+        """
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, "
+                "seconds = ?, sums = ?, error = NULL WHERE id = ? "
+                "AND worker = ? AND status = 'running'",
+                (time.time(), seconds,
+                 json.dumps({name: float(value)
+                             for name, value in sums.items()}), job_id,
+                 worker or worker_name())).rowcount == 1
+
+    def fail(self, job_id, error, worker=None):
+        """
+        Release a failed job for a retry, or mark it as failed.
+
+        As complete(), returns False if worker no longer holds the job.
+        """
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? "
+                "THEN 'pending' ELSE 'failed' END, error = ?, "
+                "finished_at = ? WHERE id = ? AND worker = ? "
+                "AND status = 'running'",
+                (self.max_attempts, error, time.time(), job_id,
+                 worker or worker_name())).rowcount == 1
+
+    def retry_failed(self):
+        """Queue the failed jobs again. Returns their number."""
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0 "
+                "WHERE status = 'failed'").rowcount
+
+    ##########################################################################
+    # progress
+    ##########################################################################
+    def counts(self):
+        """Number of jobs per status."""
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self._connection.execute(
+            'SELECT status, count(*) FROM jobs GROUP BY status'))
+        return counts
+
+    def stats(self):
+        """
+        Progress of the study: jobs per status, throughput and solve times.
+
+        Throughput is the number of done jobs per hour between the first
+        claim and the last completion; the solve times [s] are those of the
+        done jobs, also per worker.
+        """
+        jobs = pd.read_sql_query(
+            "SELECT worker, claimed_at, finished_at, seconds FROM jobs "
+            "WHERE status = 'done'", self._connection)
+        stats = {'jobs': self.counts()}
+        if len(jobs):
+            hours = (jobs['finished_at'].max()
+                     - jobs['claimed_at'].min()) / 3600
+            stats['throughput [jobs/h]'] = (len(jobs) / hours if hours > 0
+                                            else np.nan)
+            stats['seconds'] = jobs['seconds'].describe(
+                percentiles=[0.5, 0.9]).to_dict()
+            stats['workers'] = jobs.groupby('worker')['seconds'].agg(
+                ['count', 'mean']).to_dict(orient='index')
+        return stats
+
+    def results(self, params=None):
+        """
+        Designs of the done jobs with their flow sums, one row per design.
+
+        With the general parameters params the KPIs of kpi.evaluate_kpis
+        are added, as in sweep.evaluate_designs.
+        """
+        rows = self._connection.execute(
+            "SELECT design, sums FROM jobs WHERE status = 'done' "
+            "ORDER BY id").fetchall()
+        designs = pd.DataFrame([json.loads(design) for design, _ in rows])
+        sums = pd.DataFrame([json.loads(values) for _, values in rows],
+                            columns=list(FLOW_SUMS))
+        if params is None:
+            return pd.concat([designs, sums], axis=1)
+
+        if not rows:
+            # the columns of the queued designs, no KPIs to evaluate yet
+            first = self._connection.execute(
+                'SELECT design FROM jobs ORDER BY id LIMIT 1').fetchone()
+            return pd.DataFrame(columns=list(
+                json.loads(first[0]) if first else []) + KPI_COLUMNS)
+
+        base_design, _ = self.settings()
+        kpis = evaluate_kpis(designs, merge_parameters(base_design, params),
+                             sums)
+        return pd.concat([designs, kpis], axis=1)
+
+
+###############################################################################
+# workers
+###############################################################################
+def run_worker(path, inputs, lease=6 * 3600, max_attempts=3):
+    """
+    Evaluate jobs of the queue in path until none is left.
+
+    inputs is the InputBundle of the study. Returns the number of jobs done
+    by this worker.
+    """
+    # the solver stack is only imported by workers
+    from aggregation import aggregate_weather
+    from results_cache import ResultsCache
+    from sweep import evaluate_design
+    from sweep import sweep_config
+
+    name = worker_name()
+    done = 0
+    with JobQueue(path, lease, max_attempts) as queue:
+        base_design, options = queue.settings()
+        aggregation = None
+        if options['typical_periods']:
+            aggregation = aggregate_weather(inputs.weather,
+                                            options['typical_periods'],
+                                            options['period_length'])
+        results_cache = None
+        if options['results_cache_dir']:
+            results_cache = ResultsCache(options['results_cache_dir'])
+        cfg = sweep_config(options['solver'], options['number_of_time_steps'],
+                           options['solver_verbose'], options['persistent'],
+                           aggregation, options['fast_dispatch'],
+                           results_cache, options['sparse'])
+
+        while True:
+            job = queue.claim(name)
+            if job is None:
+                break
+            job_id, design = job
+            start = time.perf_counter()
+            try:
+                sums = evaluate_design(design, base_design, inputs, cfg)
+            except Exception as error:
+                logging.exception('Job {0} failed'.format(job_id))
+                released = queue.fail(job_id, repr(error), name)
+            else:
+                released = queue.complete(job_id, sums,
+                                          time.perf_counter() - start, name)
+                if released:
+                    done += 1
+            if not released:
+                logging.warning('Lease of job {0} expired, it was claimed '
+                                'again'.format(job_id))
+    logging.info('Worker {0} finished after {1} jobs'.format(name, done))
+    return done
+
+
+def run_workers(path, inputs, processes=None, lease=6 * 3600,
+                max_attempts=3):
+    """Run processes workers on this machine, see run_worker()."""
+    if processes is None:
+        processes = os.cpu_count()
+    with multiprocessing.Pool(processes) as pool:
+        return sum(pool.starmap(run_worker, [(path, inputs, lease,
+                                              max_attempts)] * processes))
+
+
+###############################################################################
+# command line, see cli.py
+###############################################################################
+def add_arguments(parser):
+    """Arguments of the queue command: create, work, stats, results."""
+    from cli import grid_values
+    from cli import input_arguments
+
+    actions = parser.add_subparsers(dest='action', metavar='action')
+    actions.required = True
+
+    create = actions.add_parser('create', help='queue a grid of designs')
+    create.add_argument('queue')
+    input_arguments(create)
+    create.add_argument('grid', nargs='+', type=grid_values,
+                        metavar='name=value,value,...')
+    create.add_argument('--solver', default='cbc')
+    create.add_argument('--persistent', action='store_true')
+    create.add_argument('--fast-dispatch', action='store_true')
+    create.add_argument('--sparse', action='store_true')
+    create.add_argument('--typical-periods', type=int, default=None)
+    create.add_argument('--results-cache-dir', default=None)
+
+    work = actions.add_parser('work', help='evaluate queued designs')
+    work.add_argument('queue')
+    input_arguments(work)
+    work.add_argument('--processes', type=int, default=1)
+    work.add_argument('--lease', type=float, default=6 * 3600,
+                      help='seconds after which a claimed job is abandoned')
+    work.add_argument('--max-attempts', type=int, default=3)
+
+    stats = actions.add_parser('stats', help='progress of the study')
+    stats.add_argument('queue')
+    stats.add_argument('--retry-failed', action='store_true')
+
+    results = actions.add_parser('results', help='KPIs of the done designs')
+    results.add_argument('queue')
+    input_arguments(results)
+    results.add_argument('--output', default=None, help='CSV file')
+
+
+def main(args):
+    """Run the queue command of the parsed arguments args."""
+    from cli import load_inputs
+    from input_data import load_parameters
+
+    if args.action == 'create':
+        from sweep import design_grid
+
+        _, base_design = load_inputs(args)
+        with JobQueue(args.queue) as queue:
+            queue.configure(base_design, solver=args.solver,
+                            persistent=args.persistent,
+                            fast_dispatch=args.fast_dispatch,
+                            sparse=args.sparse,
+                            typical_periods=args.typical_periods,
+                            results_cache_dir=args.results_cache_dir)
+            added = queue.enqueue(design_grid(**dict(args.grid)))
+        print('{0} designs queued'.format(added))
+    elif args.action == 'work':
+        inputs, _ = load_inputs(args)
+        if args.processes == 1:
+            run_worker(args.queue, inputs, args.lease, args.max_attempts)
+        else:
+            run_workers(args.queue, inputs, args.processes, args.lease,
+                        args.max_attempts)
+    elif args.action == 'stats':
+        with JobQueue(args.queue) as queue:
+            if args.retry_failed:
+                print('{0} failed jobs queued again'.format(
+                    queue.retry_failed()))
+            print(json.dumps(queue.stats(), indent=1, default=str))
+    elif args.action == 'results':
+        params = load_parameters(os.path.join(args.data_dir, args.params))
+        with JobQueue(args.queue) as queue:
+            table = queue.results(params)
+        if args.output:
+            table.to_csv(args.output)
+        print(table)
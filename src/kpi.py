@@ -0,0 +1,130 @@
+"""
+Key performance indicators (KPIs) of designs, evaluated for many at once.
+
+The KPIs of a design only depend on its capacities, the general parameters
+and a few annual flow sums. evaluate_kpis takes these as arrays with one
+entry per design and computes investment, annuity, variable costs, CO2
+emissions and self-sufficiency of all designs in a few NumPy operations.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import numpy as np
+import pandas as pd
+
+# names of the values in the first list returned by display_results
+KPI_NAMES = ['CO2-Emission [t/a]', 'Costs [Mio. EUR/a]',
+             'Self-Sufficiency [%]']
+
+# columns of evaluate_kpis
+KPI_COLUMNS = KPI_NAMES + ['CAPEX [Mio. EUR]', 'Annuity [Mio. EUR/a]',
+                           'Variable Costs [Mio. EUR/a]']
+
+# annual flow sums needed for the KPIs: name -> (source, target)
+FLOW_SUMS = {'gas': ('rgas', 'natural_gas'),
+             'shortage_el': ('shortage_bel', 'electricity'),
+             'shortage_th': ('shortage_bth', 'heat'),
+             'demand_el': ('electricity', 'demand_el'),
+             'demand_th': ('heat', 'demand_th'),
+             'el_heat_pump': ('electricity', 'heat_pump')}
+
+# design parameter -> parameter of the investment costs per unit of it
+INVESTMENT_COSTS = {'number_of_chps': 'invest_cost_chp',
+                    'number_of_boilers': 'invest_cost_boiler',
+                    'number_of_windturbines': 'invest_cost_wind',
+                    'number_of_heat_pumps': 'invest_cost_heatpump',
+                    'capacity_electr_storage': 'invest_cost_storage_el',
+                    'capacity_thermal_storage': 'invest_cost_storage_th',
+                    'PV_area_roof': 'invest_cost_pv',
+                    'area_solar_th': 'invest_cost_solarthermal',
+                    'PV_area_field': 'invest_cost_PV_pp'}
+
+
+def flow_sums(string_results):
+    """Annual sums of FLOW_SUMS from string keyed results, 0 if absent."""
+    return {name: (string_results[key]['sequences']['flow'].sum()
+                   if key in string_results else 0.)
+            for name, key in FLOW_SUMS.items()}
+
+
+def annuity_factor(lifetime, wacc):
+    """Factor of oemof.tools.economics.annuity, for arrays."""
+    lifetime = np.asarray(lifetime, dtype=float)
+    wacc = np.asarray(wacc, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = wacc * (1 + wacc) ** lifetime / ((1 + wacc) ** lifetime - 1)
+    return np.where(wacc == 0, 1 / lifetime, factor)
+
+
+def _values(designs, params, name):
+    if name in designs:
+        return np.asarray(designs[name], dtype=float)
+    return np.asarray(params[name], dtype=float)
+
+
+def investment(designs, params):
+    """
+    CAPEX [EUR] and annuity [EUR/a] of N designs, see evaluate_kpis() for
+    designs and params.
+    """
+    capex = sum(_values(designs, params, design)
+                * _values(designs, params, cost)
+                for design, cost in INVESTMENT_COSTS.items())
+    return capex, capex * annuity_factor(_values(designs, params, 'lifetime'),
+                                         _values(designs, params, 'wacc'))
+
+
+def evaluate_kpis(designs, params, sums):
+    """
+    KPIs of N designs.
+
+    designs maps design parameters to arrays of N values (e.g. a DataFrame
+    with one row per design), params the general parameters (scalars or
+    arrays of N values) and sums the FLOW_SUMS to arrays of N annual sums.
+    Design parameters missing in designs are taken from params.
+
+    Returns a DataFrame with one row per design, indexed like designs or
+    else like sums if they are DataFrames, and the columns KPI_COLUMNS.
+    """
+    def value(name):
+        return _values(designs, params, name)
+
+    def flow(name):
+        return np.asarray(sums[name], dtype=float)
+
+    capex, annuity = investment(designs, params)
+
+    var_costs = (flow('gas') * value('var_costs_gas')
+                 + flow('shortage_el') * value('var_costs_shortage_bel')
+                 + flow('shortage_th') * value('var_costs_shortage_bth'))
+
+    em_co2 = (flow('gas') * value('emission_gas')
+              + flow('shortage_el') * value('emission_el')
+              + flow('shortage_th') * value('emission_heat'))  # [kg/a]
+
+    # the electricity consumption of the heat pumps is not part of the
+    # electricity demand
+    el_consumption = flow('demand_el') + flow('el_heat_pump')
+    coverage_el = (el_consumption - flow('shortage_el')) / el_consumption
+    coverage_heat = ((flow('demand_th') - flow('shortage_th'))
+                     / flow('demand_th'))
+    selfsufficiency = (coverage_el + coverage_heat) / 2
+
+    columns = dict(zip(KPI_COLUMNS, (em_co2 / 1e3,
+                                     (var_costs + annuity) / 1e6,
+                                     selfsufficiency * 100,
+                                     capex / 1e6,
+                                     annuity / 1e6,
+                                     var_costs / 1e6)))
+    columns = {name: np.atleast_1d(values)
+               for name, values in columns.items()}
+    length = max(len(values) for values in columns.values())
+    # rows are labelled like the designs, else like the sums
+    index = None
+    if isinstance(designs, pd.DataFrame):
+        index = designs.index
+    elif isinstance(sums, pd.DataFrame):
+        index = sums.index
+    return pd.DataFrame({name: np.broadcast_to(values, length)
+                         for name, values in columns.items()}, index=index)
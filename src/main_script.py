@@ -6,18 +6,36 @@ Created on Thu Jan  9 11:29:34 2020
 
 # Default logger of oemof
 from oemof.tools import logger
-from oemof.tools import helpers
 
-import oemof.solph as solph
 import oemof.outputlib as outputlib
 
 import logging
 import os
-import pandas as pd
+
+import matplotlib.pyplot as plt
+
+import profiling
+from aggregation import aggregate_weather
+from aggregation import solve_aggregated
 from basic_analysis import display_results
 from basic_analysis import plot_results_elec
 from basic_analysis import plot_results_heat
 from basic_analysis import plot_results_ressources
+from energy_system import build_energy_system
+from energy_system import solve_energy_system
+from input_data import load_input_bundle
+from input_data import load_parameters
+from input_data import merge_parameters
+from investment import solve_investment
+from kpi import evaluate_kpis
+from kpi import flow_sums
+from results_cache import ResultsCache
+from results_cache import results_key
+from results_store import write_results
+from results_view import ResultsView
+from rolling_horizon import solve_rolling_horizon
+from sensitivity import sensitivity
+from sparse_model import solve_sparse
 
 ###############################################################################
 # definition of config file locally
@@ -25,283 +43,231 @@ from basic_analysis import plot_results_ressources
 cfg = {}
 cfg['design_parameters_file_name'] = 'design_parameters.csv'
 cfg['parameters_file_name'] = 'general_parameters.csv'
-cfg['time_series_file_name'] = 'weather_data.csv'
+cfg['time_series_file_name'] = 'weather_data.CSV'
+# time steps per hour in the weather file (4: 15 minutes), resampled to hours
+cfg['steps_per_hour'] = 1
+cfg['cache_dir'] = 'cache'
+# load designs solved before from the cache instead of solving them again
+cfg['results_cache'] = True
+cfg['results_cache_max_bytes'] = 2 * 1024 ** 3
 
 cfg['debug'] = False
 cfg['display_input_data'] = True
 cfg['display_results'] = True
-cfg['solver'] = 'cbc'
+# False: only save the plots, without a display (Agg backend)
+cfg['show_plots'] = True
+cfg['solver'] = 'cbc'  # or 'auto' for the fastest installed solver
+# 'solph' or 'sparse': LP assembled as sparse matrices and solved by HiGHS
+# in memory (see sparse_model.py)
+cfg['backend'] = 'solph'
 cfg['solver_verbose'] = False
+# solver settings, None for the solver default (see solver_config.py)
+cfg['solver_threads'] = None
+cfg['solver_method'] = None  # 'simplex' or 'barrier'
+cfg['solver_time_limit'] = None  # [s]
+cfg['solver_mip_gap'] = None
+# number of typical days to simulate instead of the full year (None: off)
+cfg['typical_periods'] = None
+cfg['period_length'] = 24
+# optimise windows of this many hours one after another (None: off)
+cfg['rolling_window'] = None
+cfg['rolling_overlap'] = 24
+# optimise the sizes of these design parameters up to the given bounds, e.g.
+# {'number_of_windturbines': 12, 'capacity_thermal_storage': 10} (None: off)
+cfg['investment_bounds'] = None
+# marginal costs of parameters and capacities from the duals of the solve,
+# written to results/sensitivity_*.csv (see sensitivity.py)
+cfg['sensitivity'] = False
+# record time and memory of every phase in results/profile.json and .csv
+cfg['profile'] = False
+cfg['profile_memory'] = True
+# also run the phases under cProfile, statistics in results/profile/
+cfg['cprofile'] = False
 
 
 ###############################################################################
 # run model
 ###############################################################################
 
+# at most one of the modes that replace the solph model of the whole horizon
+modes = [name for name, selected in (
+    ('typical_periods', cfg['typical_periods']),
+    ('rolling_window', cfg['rolling_window']),
+    ('investment_bounds', cfg['investment_bounds']),
+    ("backend='sparse'", cfg['backend'] == 'sparse')) if selected]
+if len(modes) > 1:
+    raise ValueError('{0} can not be combined'.format(' and '.join(modes)))
+# the sensitivities need the duals of the solph model of the whole horizon
+if cfg['sensitivity'] and modes:
+    raise ValueError('sensitivity can not be combined with {0}'.format(
+        modes[0]))
+
 # initiate the logger (see the API docs for more information)
 logger.define_logging(logfile='model.log', screen_level=logging.INFO,
                       file_level=logging.DEBUG)
 logging.info('Initialize the energy system')
 
-if cfg['debug']:
-    number_of_time_steps = 3
-else:
-    number_of_time_steps = 8760
-    
-date_time_index = pd.date_range('1/1/2030', periods=number_of_time_steps, freq='H')
-energysystem = solph.EnergySystem(timeindex=date_time_index)
+abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+
+if cfg['profile']:
+    profiling.start(memory=cfg['profile_memory'],
+                    profile_dir=(abs_path + '/results/profile'
+                                 if cfg['cprofile'] else None))
 
 
 ##########################################################################
 # Read time series and parameter values from data files
 ##########################################################################
 
-abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
-
+# weather data and general parameters are cached in /cache after the first run
 file_path_ts = abs_path + '/data/' + cfg['time_series_file_name']
-data = pd.read_csv(file_path_ts)
-
-# file_path_weather_ts = abs_path + '/data_preprocessed/' + cfg[
-#     'weather_time_series']
-# weather_data = pd.read_csv(file_path_weather_ts)
+file_path_param_01 = abs_path + '/data/' + cfg['design_parameters_file_name']
+file_path_param_02 = abs_path + '/data/' + cfg['parameters_file_name']
 
-file_name_param_01 = cfg['design_parameters_file_name']
-file_name_param_02 = cfg['parameters_file_name']
-file_path_param_01 = (abs_path + '/data/' + file_name_param_01)
-file_path_param_02 = (abs_path + '/data/' + file_name_param_02)
+inputs = load_input_bundle(file_path_ts, file_path_param_02,
+                           cache_dir=abs_path + '/' + cfg['cache_dir'],
+                           steps_per_hour=cfg['steps_per_hour'])
+data = inputs.weather
 
-param_df_01 = pd.read_csv(file_path_param_01, index_col=1)
-param_df_02 = pd.read_csv(file_path_param_02, index_col=1)
+# the whole weather data (e.g. several years) is simulated
+if cfg['debug']:
+    number_of_time_steps = 3
+else:
+    number_of_time_steps = len(data)
 
-param_df = pd.concat([param_df_01, param_df_02], sort=True)
-param_value = param_df['value']
+design = load_parameters(file_path_param_01)
+param_value = merge_parameters(design, inputs.params)
 
 
 ##########################################################################
-# Create oemof object
+# Look up the results of an identical run
 ##########################################################################
 
-logging.info('Create oemof objects')
+results_cache = ResultsCache(abs_path + '/' + cfg['cache_dir'] + '/results',
+                             max_bytes=cfg['results_cache_max_bytes'])
+results_cache_key = results_key(param_value, data,
+                                solver=cfg['solver'],
+                                backend=cfg['backend'],
+                                time_limit=cfg['solver_time_limit'],
+                                mip_gap=cfg['solver_mip_gap'],
+                                number_of_time_steps=number_of_time_steps,
+                                typical_periods=cfg['typical_periods'],
+                                period_length=cfg['period_length'],
+                                rolling_window=cfg['rolling_window'],
+                                rolling_overlap=cfg['rolling_overlap'])
+# the design of the investment mode is only known after the optimisation,
+# the sensitivities need the duals of a solve
+use_results_cache = cfg['results_cache'] and not (cfg['investment_bounds']
+                                                  or cfg['sensitivity'])
+cached = None
+if use_results_cache:
+    cached = results_cache.load(results_cache_key)
 
-## Bus objects
-###############################################################################
-bgas = solph.Bus(label="natural_gas")
-bel = solph.Bus(label="electricity")
-bth = solph.Bus(label='heat')
 
-energysystem.add(bgas, bel, bth)
+##########################################################################
+# Create oemof object
+##########################################################################
 
-## Sink objects
-###############################################################################
-#Electricty demand
-energysystem.add(
-        solph.Sink(label='demand_el',
-                   inputs={bel: solph.Flow(
-                           actual_value=data['Demand_el [MWh]'],  # [MWh]
-                           nominal_value=1,
-                           fixed=True)})
-                )
-
-#Heat demand
-energysystem.add(
-        solph.Sink(label='demand_th',
-                   inputs={bth: solph.Flow(
-                           actual_value=data['Demand_th [MWh]'],  # [MWh]
-                           nominal_value=1,
-                           fixed=True)})
-                )
-
-#Excell electricity    
-energysystem.add(
-        solph.Sink(label='excess_bel',
-                   inputs={bel: solph.Flow(
-                           variable_costs=param_value['var_costs_excess_bel'])})
-                )
-
-#Excess heat
-energysystem.add(
-        solph.Sink(label='excess_bth',
-                   inputs={bth: solph.Flow(
-                           variable_costs=param_value['var_costs_excess_bth'])})
-                )
-
-
-## Source objects
-###############################################################################
-#Electricty shortage    
-energysystem.add(
-        solph.Source(label='shortage_bel',
-                     outputs={bel: solph.Flow(
-                             variable_costs=param_value['var_costs_shortage_bel'])})
-                )
-
-#Heat shortage    
-energysystem.add(
-        solph.Source(label='shortage_bth',
-                     outputs={bth: solph.Flow(
-                             variable_costs=param_value['var_costs_shortage_bth'])})
-                )
-
-#Natural gas    
-energysystem.add(
-        solph.Source(label='rgas',
-                     outputs={bgas: solph.Flow(
-                             nominal_value=param_value['nom_val_gas'],
-                             summed_max=param_value['sum_max_gas'],
-                             variable_costs=param_value['var_costs_gas'])})
-                )
-   
-# Wind turbines
-if param_value['number_of_windturbines'] > 0:    
-    energysystem.add(           
-            solph.Source(label='wind_turbine',
-                         outputs={bel: solph.Flow(
-                                 actual_value=(data['Wind_power [kW/unit]'] * param_value['number_of_windturbines'] * 0.001),  # [MWh]
-                                 nominal_value=1, # [1]
-                                 fixed=True)})
-                    )
-            
-# Open-field photovoltaic power plant
-if param_value['PV_area_field'] > 0:
-    energysystem.add(
-            solph.Source(label='PV_field',
-                         outputs={bel: solph.Flow(
-                                 actual_value=(data['Sol_irradiation [Wh/sqm]'] * param_value['eta_PV'] * 0.000001),  # [MWh/m²]
-                                 nominal_value=param_value['PV_area_field']*10000,  # [m²]
-                                 fixed=True)})
-                        )
-
-# Rooftop photovoltaic
-if param_value['PV_area_roof'] > 0:    
-    energysystem.add(
-            solph.Source(label='PV_roof',
-                         outputs={bel: solph.Flow(
-                                 actual_value=(data['Sol_irradiation [Wh/sqm]'] * param_value['eta_PV'] * 0.000001),  # [MWh/m²]
-                                 nominal_value=param_value['PV_area_roof']*10000,  # [m²]
-                                 fixed=True)})
-                    )
-
-# Rooftop solar thermal
-if param_value['area_solar_th'] > 0:    
-    energysystem.add(
-            solph.Source(label='solar_thermal',
-                         outputs={bth: solph.Flow(
-                                 actual_value=(data['Sol_irradiation [Wh/sqm]'] * param_value['eta_solar_th'] * 0.000001),  # [MWh/m²]
-                                 nominal_value=param_value['area_solar_th']*10000,  # [m²]
-                                 fixed=True)})
-                    )
-
-# Combined heat and power plant
-if param_value['number_of_chps'] > 0:
-    energysystem.add(
-            solph.Transformer(label='chp',
-                              inputs={bgas: solph.Flow()},
-                              outputs={bth: solph.Flow(
-                                      nominal_value=param_value['number_of_chps']*param_value['chp_heat_output']),  # [MW]
-                                       bel: solph.Flow()},
-                              conversion_factors={bth: param_value['conversion_factor_bth_chp'],
-                                                  bel: param_value['conversion_factor_bel_chp']})
-                    )
-
-# Boiler
-if param_value['number_of_boilers'] > 0:
-    energysystem.add(
-            solph.Transformer(label='boiler',
-                              inputs={bgas: solph.Flow()},
-                              outputs={bth: solph.Flow(
-                                      nominal_value=param_value['number_of_boilers']*param_value['boiler_heat_output'])},   # [MWh]
-                              conversion_factors={bth: param_value['conversion_factor_boiler']})
-                    )   
-            
-# Heat pump
-if param_value['number_of_heat_pumps'] > 0:
-    energysystem.add(
-            solph.Transformer(label='heat_pump',
-                              inputs={bel: solph.Flow()},
-                              outputs={bth: solph.Flow(
-                                      nominal_value=(param_value['number_of_heat_pumps'] * param_value['heatpump_heat_output']))},  # [MW]
-                              conversion_factors={bth: param_value['COP_heat_pump']})
-                    )
-
-
-# Thermal storage
-if param_value['capacity_thermal_storage'] > 0:   
-    energysystem.add(
-            solph.components.GenericStorage(nominal_storage_capacity=(param_value['capacity_thermal_storage'] * param_value['daily_demand_th']),
-                                            label='storage_th',
-                                            inputs={bth: solph.Flow(
-                                                         nominal_value=(param_value['capacity_thermal_storage']
-                                                         * param_value['daily_demand_th'] / param_value['charge_time_storage_th']))},
-                                             outputs={bth: solph.Flow(
-                                                          nominal_value=(param_value['capacity_thermal_storage']
-                                                          * param_value['daily_demand_th'] / param_value['charge_time_storage_th']))},
-                                             loss_rate=param_value['capacity_loss_storage_th'],
-                                             initial_storage_level=param_value['init_capacity_storage_th'],
-                                             inflow_conversion_factor=param_value['inflow_conv_factor_storage_th'],
-                                             outflow_conversion_factor=param_value['outflow_conv_factor_storage_th'])
-                      )
-
-# Electricty storage
-if param_value['capacity_electr_storage'] > 0:
-    energysystem.add(
-            solph.components.GenericStorage(nominal_storage_capacity=(param_value['capacity_electr_storage'] * param_value['daily_demand_el']),
-                                            label='storage_el',
-                                            inputs={bel: solph.Flow(
-                                                        nominal_value=(param_value['capacity_electr_storage']
-                                                        * param_value['daily_demand_el'] / param_value['charge_time_storage_el']))},
-                                            outputs={bel: solph.Flow(
-                                                        nominal_value=(param_value['capacity_electr_storage']
-                                                        * param_value['daily_demand_el'] / param_value['charge_time_storage_el']))},
-                                            loss_rate=param_value['capacity_loss_storage_el'],
-                                            initial_storage_level=param_value['init_capacity_storage_el'],
-                                            inflow_conversion_factor=param_value['inflow_conv_factor_storage_el'],
-                                            outflow_conversion_factor=param_value['outflow_conv_factor_storage_el'])
-                    )
+# typical periods and rolling horizon build their own (reduced) models
+if cached is None and not (cfg['typical_periods'] or cfg['rolling_window']
+                           or cfg['investment_bounds']
+                           or cfg['backend'] == 'sparse'):
+    energysystem = build_energy_system(design, inputs.params, data,
+                                       number_of_time_steps)
 
 
 ##########################################################################
 # Optimise the energy system and plot the results
 ##########################################################################
 
-logging.info('Optimise the energy system')
-
-model = solph.Model(energysystem)
-
-if cfg['debug']:
-    filename = os.path.join(
-        helpers.extend_basic_path('lp_files'), 'model.lp')
-    logging.info('Store lp-file in {0}.'.format(filename))
-    model.write(filename, io_options={'symbolic_solver_labels': True})
-
-# if tee_switch is true solver messages will be displayed
-logging.info('Solve the optimization problem')
-model.solve(solver=cfg['solver'], solve_kwargs={'tee': cfg['solver_verbose']})
-
-logging.info('Store the energy system with the results.')
-
-energysystem.results['main'] = outputlib.processing.results(model)
-energysystem.results['meta'] = outputlib.processing.meta_results(model)
-
-energysystem.dump(dpath=abs_path + "/results/optimisation_results/dumps",
-                  filename="model.oemof")
-
+if cached is not None:
+    logging.info('The design was solved before, skip the optimisation.')
+elif cfg['investment_bounds']:
+    design, energysystem = solve_investment(
+        design, inputs.params, data, cfg['investment_bounds'],
+        number_of_time_steps, solver=cfg['solver'],
+        solver_verbose=cfg['solver_verbose'])
+    param_value = merge_parameters(design, inputs.params)
+    for name in cfg['investment_bounds']:
+        logging.info('Optimal {0}: {1:.2f}'.format(name, design[name]))
+elif cfg['typical_periods']:
+    with profiling.phase('aggregate weather'):
+        aggregation = aggregate_weather(data.window(0, number_of_time_steps),
+                                        cfg['typical_periods'],
+                                        cfg['period_length'])
+    energysystem = solve_aggregated(design, inputs.params, aggregation,
+                                    solver=cfg['solver'],
+                                    solver_verbose=cfg['solver_verbose'],
+                                    threads=cfg['solver_threads'],
+                                    method=cfg['solver_method'],
+                                    time_limit=cfg['solver_time_limit'],
+                                    mip_gap=cfg['solver_mip_gap'])
+elif cfg['backend'] == 'sparse':
+    # the SparseModel holds results in the format of energysystem.results
+    energysystem = solve_sparse(design, inputs.params, data,
+                                number_of_time_steps,
+                                solver_verbose=cfg['solver_verbose'],
+                                method=cfg['solver_method'],
+                                time_limit=cfg['solver_time_limit'],
+                                threads=cfg['solver_threads'],
+                                mip_gap=cfg['solver_mip_gap'])
+elif cfg['rolling_window']:
+    energysystem = solve_rolling_horizon(design, inputs.params,
+                                         data.window(0, number_of_time_steps),
+                                         window=cfg['rolling_window'],
+                                         overlap=cfg['rolling_overlap'],
+                                         solver=cfg['solver'],
+                                         solver_verbose=cfg['solver_verbose'],
+                                         threads=cfg['solver_threads'],
+                                         method=cfg['solver_method'],
+                                         time_limit=cfg['solver_time_limit'],
+                                         mip_gap=cfg['solver_mip_gap'])
+else:
+    model = solve_energy_system(energysystem, solver=cfg['solver'],
+                                solver_verbose=cfg['solver_verbose'],
+                                write_lp_file=cfg['debug'],
+                                threads=cfg['solver_threads'],
+                                method=cfg['solver_method'],
+                                time_limit=cfg['solver_time_limit'],
+                                mip_gap=cfg['solver_mip_gap'],
+                                duals=cfg['sensitivity'])
+    if cfg['sensitivity']:
+        report = sensitivity(model, param_value, data)
+        report.prices.to_csv(abs_path + '/results/sensitivity_prices.csv')
+        report.parameters.to_csv(abs_path
+                                 + '/results/sensitivity_parameters.csv')
+        report.capacities.to_csv(abs_path
+                                 + '/results/sensitivity_capacities.csv')
+        print(report.capacities)
 
 #########################################################################
-# Analyse results
+# Store and analyse results
 #########################################################################
 
-energysystem = solph.EnergySystem()
+if cached is None:
+    string_results = outputlib.views.convert_keys_to_strings(
+                    energysystem.results['main'])
+    kpis = evaluate_kpis(param_value, param_value,
+                         flow_sums(string_results)).iloc[0]
+    meta = energysystem.results['meta']
+    if use_results_cache:
+        results_cache.store(results_cache_key, string_results, kpis)
+else:
+    string_results, kpis = cached
+    meta = {'results_cache': results_cache_key}
 
-abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
-energysystem.restore(dpath=abs_path + "/results/optimisation_results/dumps",
-                     filename="model.oemof")
+logging.info('Store the results.')
 
-results = energysystem.results
-string_results = outputlib.views.convert_keys_to_strings(
-                energysystem.results['main'])
+# only the sequences, KPIs and meta results are stored, see results_store.py
+with profiling.phase('store results'):
+    write_results(abs_path + "/results/optimisation_results/results",
+                  string_results, kpis, meta)
 
 ## Call main analysis function
-results_main = display_results(string_results, param_value)
+with profiling.phase('analysis'):
+    # all sequences packed into one array for the analysis and the plots
+    results = ResultsView(string_results)
+    results_main = display_results(results, param_value)
 
 #########################################################################
 # Detailed analysis
@@ -310,6 +276,18 @@ start = 0
 end = 1400
 
 
-plot_results_elec(string_results, param_value, data, start, end)
-plot_results_heat(string_results, param_value, data, start, end)
-plot_results_ressources(string_results, param_value, data, start, end)
+if not cfg['show_plots']:
+    plt.switch_backend('Agg')
+
+with profiling.phase('plotting'):
+    plot_results_elec(results, param_value, data, start, end,
+                      show=cfg['show_plots'])
+    plot_results_heat(results, param_value, data, start, end,
+                      show=cfg['show_plots'])
+    plot_results_ressources(results, param_value, data, start, end,
+                            show=cfg['show_plots'])
+
+profiler = profiling.stop()
+if profiler is not None:
+    profiler.write(abs_path + '/results/profile.json')
+    profiler.write(abs_path + '/results/profile.csv')
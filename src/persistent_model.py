@@ -0,0 +1,408 @@
+"""
+Persistent model for fast re-solves of design variants.
+
+Between two designs with the same components only the nominal values of a
+few flows and storages change. Instead of rebuilding the solph.Model for
+every design, PersistentModel keeps the built Pyomo model alive and only
+changes the bounds and fixed values of the affected variables:
+
+* fixed sources (wind, PV, solar thermal): fixed hourly flow values
+* transformers (CHP, boiler, heat pump): upper bound of the heat output
+* storages: upper bounds of in- and outflow, of the storage capacity and the
+  fixed initial capacity
+
+set_weather() swaps the hourly profiles of demands and fixed sources in the
+same way, to solve one design for several weather years (see ensemble.py).
+
+With a persistent solver interface of Pyomo (e.g. 'gurobi_persistent') the
+changed variables are passed to the solver instance directly. Other solvers
+(e.g. 'cbc', which has no persistent interface) still skip the construction
+of the model but get the problem written out for each solve.
+
+TemplateModel always contains every design dependent component, so one model
+serves a whole family of designs, also designs adding components. The sizes
+and the feed-in profiles are mutable Pyomo parameters (zero for absent
+components) and the bounds depending on them are constraints built once;
+changing the design or the weather only assigns parameter values.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import logging
+
+import numpy as np
+import oemof.solph as solph
+import oemof.outputlib as outputlib
+import pyomo.environ as po
+from pyomo.opt import SolverFactory
+
+from design_components import DESIGN_COMPONENTS
+from design_components import FIXED_SOURCES
+from design_components import STORAGES
+from design_components import TRANSFORMERS
+from design_components import components
+from design_components import design_values
+from energy_system import build_energy_system
+from input_data import merge_parameters
+
+
+class PersistentModel(object):
+    """
+    A built solph.Model whose design capacities can be changed in place.
+
+    Designs passed to update() may switch components of the built model off
+    (a value of 0) but must not add components that were absent when the
+    model was built, see accepts().
+    """
+
+    def __init__(self, design, params, weather, number_of_time_steps=None,
+                 solver='cbc', solver_verbose=False):
+        self.params = params
+        self.weather = weather
+        self.solver = solver
+        self.solver_verbose = solver_verbose
+
+        self.param_value = merge_parameters(design, params)
+        self.components = components(self.param_value)
+        self.energysystem = build_energy_system(design, params, weather,
+                                                number_of_time_steps)
+
+        logging.info('Build persistent model')
+        self.model = solph.Model(self.energysystem)
+        self._values = design_values(self.param_value, weather)
+
+        self._opt = None
+        if solver.endswith('_persistent'):
+            self._opt = SolverFactory(solver)
+            self._opt.set_instance(self.model)
+
+    def accepts(self, design):
+        """True if design can be set with update() without a rebuild."""
+        param_value = merge_parameters(design, self.params)
+        return components(param_value) <= self.components
+
+    def update(self, design):
+        """Change the model to design, touching only changed components."""
+        param_value = merge_parameters(design, self.params)
+        added = components(param_value) - self.components
+        if added:
+            raise ValueError(
+                'Components {0} are not part of the persistent model, build '
+                'a new PersistentModel for this design'.format(
+                    ', '.join(sorted(added))))
+
+        values = design_values(param_value, self.weather)
+        changed = []
+        for label in self.components:
+            if np.array_equal(values[label], self._values[label]):
+                continue
+            logging.debug('Update {0}'.format(label))
+            if label in FIXED_SOURCES:
+                changed += self._set_fixed_source(label, values[label])
+            elif label in TRANSFORMERS:
+                changed += self._set_transformer(label, values[label])
+            elif label in STORAGES:
+                changed += self._set_storage(label, *values[label])
+
+        if self._opt is not None:
+            for var in changed:
+                self._opt.update_var(var)
+
+        self.param_value = param_value
+        self._values = values
+
+    def set_weather(self, weather):
+        """
+        Change the hourly profiles to those of weather (another weather year).
+
+        Only the fixed flows of the demands and fixed sources change, the
+        structure of the model is kept.
+        """
+        if len(weather) < len(self.model.TIMESTEPS):
+            raise ValueError('The weather data has {0} time steps, the model '
+                             '{1}'.format(len(weather),
+                                          len(self.model.TIMESTEPS)))
+
+        changed = []
+        for label, profile in (('demand_el', weather.demand_el),
+                               ('demand_th', weather.demand_th)):
+            node = self.energysystem.groups[label]
+            bus = next(iter(node.inputs))
+            node.inputs[bus].actual_value = profile
+            for t in self.model.TIMESTEPS:
+                var = self.model.flow[bus, node, t]
+                var.fix(profile[t])
+                changed.append(var)
+
+        values = design_values(self.param_value, weather)
+        for label in self.components & set(FIXED_SOURCES):
+            changed += self._set_fixed_source(label, values[label])
+
+        if self._opt is not None:
+            for var in changed:
+                self._opt.update_var(var)
+
+        self.weather = weather
+        self._values = values
+
+    def _node_and_bus(self, label):
+        _, bus_label = DESIGN_COMPONENTS[label]
+        return (self.energysystem.groups[label],
+                self.energysystem.groups[bus_label])
+
+    def _set_fixed_source(self, label, feed_in):
+        node, bus = self._node_and_bus(label)
+        flow = node.outputs[bus]
+        flow.actual_value = feed_in / flow.nominal_value
+
+        changed = []
+        for t in self.model.TIMESTEPS:
+            var = self.model.flow[node, bus, t]
+            var.fix(feed_in[t])
+            changed.append(var)
+        return changed
+
+    def _set_transformer(self, label, nominal_value):
+        node, bus = self._node_and_bus(label)
+        node.outputs[bus].nominal_value = nominal_value
+
+        changed = []
+        for t in self.model.TIMESTEPS:
+            var = self.model.flow[node, bus, t]
+            var.setub(nominal_value)
+            changed.append(var)
+        return changed
+
+    def _set_storage(self, label, capacity, power):
+        node, bus = self._node_and_bus(label)
+        node.nominal_storage_capacity = capacity
+        node.inputs[bus].nominal_value = power
+        node.outputs[bus].nominal_value = power
+
+        block = self.model.GenericStorageBlock
+        changed = []
+        for t in self.model.TIMESTEPS:
+            for var in (self.model.flow[bus, node, t],
+                        self.model.flow[node, bus, t]):
+                var.setub(power)
+                changed.append(var)
+            var = block.capacity[node, t]
+            var.setub(capacity * node.max_storage_level[t])
+            changed.append(var)
+
+        init_cap = block.init_cap[node]
+        init_cap.setub(capacity)
+        if node.initial_storage_level is not None:
+            init_cap.fix(node.initial_storage_level * capacity)
+        changed.append(init_cap)
+        return changed
+
+    def solve(self):
+        """Solve the model and store the results in energysystem.results."""
+        logging.info('Solve the persistent model')
+        if self._opt is None:
+            self.model.solve(solver=self.solver,
+                             solve_kwargs={'tee': self.solver_verbose})
+        else:
+            solver_results = self._opt.solve(tee=self.solver_verbose)
+            self.model.es.results = solver_results
+            self.model.solver_results = solver_results
+
+        self.energysystem.results['main'] = outputlib.processing.results(
+            self.model)
+        self.energysystem.results['meta'] = outputlib.processing.meta_results(
+            self.model)
+        return self.energysystem.results
+
+
+class TemplateModel(PersistentModel):
+    """
+    A solph.Model of all design dependent components with mutable sizes.
+
+    The parameters of the Pyomo model are
+
+        design_size[label]      size in the units of design_parameters.csv
+                                for fixed sources, nominal heat output [MW]
+                                for transformers, capacity [MWh] for storages
+        storage_power[label]    nominal in- and outflow of storages [MW]
+        feed_in[label, t]       feed-in of fixed sources per unit of size
+
+    update() accepts any design and set_weather() any weather of the same
+    length, both only assign parameter values.
+    """
+
+    def __init__(self, design, params, weather, number_of_time_steps=None,
+                 solver='cbc', solver_verbose=False):
+        self.params = params
+        self.weather = weather
+        self.solver = solver
+        self.solver_verbose = solver_verbose
+        self.components = set(DESIGN_COMPONENTS)
+
+        # every component is built, with placeholder sizes of one unit
+        units = {name: 1 for name, _ in DESIGN_COMPONENTS.values()}
+        self.energysystem = build_energy_system(
+            merge_parameters(units, design), params, weather,
+            number_of_time_steps)
+
+        logging.info('Build template model')
+        self.model = solph.Model(self.energysystem)
+        self._add_parameters()
+
+        self._opt = None
+        if solver.endswith('_persistent'):
+            self._opt = SolverFactory(solver)
+            self._opt.set_instance(self.model)
+
+        self.param_value = None
+        self._values = None
+        self._set_feed_in(weather)
+        self.update(design)
+
+    def _add_parameters(self):
+        m = self.model
+        m.design_size = po.Param(list(DESIGN_COMPONENTS), mutable=True,
+                                 initialize=0)
+        m.storage_power = po.Param(list(STORAGES), mutable=True, initialize=0)
+        m.feed_in = po.Param(list(FIXED_SOURCES), m.TIMESTEPS, mutable=True,
+                             initialize=0)
+        block = m.GenericStorageBlock
+
+        # the bounds of the placeholder sizes are replaced by constraints
+        def flow_var(label, t, inflow=False):
+            node, bus = self._node_and_bus(label)
+            if inflow:
+                return m.flow[bus, node, t]
+            return m.flow[node, bus, t]
+
+        for t in m.TIMESTEPS:
+            for label in FIXED_SOURCES:
+                flow_var(label, t).unfix()
+            for label in TRANSFORMERS:
+                flow_var(label, t).setub(None)
+            for label in STORAGES:
+                flow_var(label, t).setub(None)
+                flow_var(label, t, inflow=True).setub(None)
+                node, _ = self._node_and_bus(label)
+                block.capacity[node, t].setub(None)
+        for label in STORAGES:
+            node, _ = self._node_and_bus(label)
+            block.init_cap[node].unfix()
+            block.init_cap[node].setub(None)
+
+        m.fixed_source_feed_in = po.Constraint(
+            list(FIXED_SOURCES), m.TIMESTEPS,
+            rule=lambda m, label, t: (flow_var(label, t)
+                                      == m.feed_in[label, t]
+                                      * m.design_size[label]))
+        m.transformer_size = po.Constraint(
+            list(TRANSFORMERS), m.TIMESTEPS,
+            rule=lambda m, label, t: (flow_var(label, t)
+                                      <= m.design_size[label]))
+        m.storage_outflow = po.Constraint(
+            list(STORAGES), m.TIMESTEPS,
+            rule=lambda m, label, t: (flow_var(label, t)
+                                      <= m.storage_power[label]))
+        m.storage_inflow = po.Constraint(
+            list(STORAGES), m.TIMESTEPS,
+            rule=lambda m, label, t: (flow_var(label, t, inflow=True)
+                                      <= m.storage_power[label]))
+
+        def capacity_rule(m, label, t):
+            node, _ = self._node_and_bus(label)
+            return (block.capacity[node, t]
+                    <= m.design_size[label] * node.max_storage_level[t])
+        m.storage_size = po.Constraint(list(STORAGES), m.TIMESTEPS,
+                                       rule=capacity_rule)
+
+        def initial_capacity_rule(m, label):
+            node, _ = self._node_and_bus(label)
+            if node.initial_storage_level is None:
+                return block.init_cap[node] <= m.design_size[label]
+            return (block.init_cap[node]
+                    == node.initial_storage_level * m.design_size[label])
+        m.storage_initial_capacity = po.Constraint(
+            list(STORAGES), rule=initial_capacity_rule)
+
+    def _constraints(self, label):
+        # constraints of the template depending on the parameters of label
+        m = self.model
+        if label in FIXED_SOURCES:
+            return [m.fixed_source_feed_in[label, t] for t in m.TIMESTEPS]
+        if label in TRANSFORMERS:
+            return [m.transformer_size[label, t] for t in m.TIMESTEPS]
+        return ([m.storage_initial_capacity[label]]
+                + [constraint[label, t] for constraint in (
+                    m.storage_outflow, m.storage_inflow, m.storage_size)
+                   for t in m.TIMESTEPS])
+
+    def _push(self, labels):
+        # parameters in constraints are only read by the solver on creation
+        if self._opt is None:
+            return
+        for label in labels:
+            for constraint in self._constraints(label):
+                self._opt.remove_constraint(constraint)
+                self._opt.add_constraint(constraint)
+
+    def _set_feed_in(self, weather):
+        units = {name: 1 for name, _ in DESIGN_COMPONENTS.values()}
+        per_unit = design_values(merge_parameters(units, self.params),
+                                 weather)
+        for label in FIXED_SOURCES:
+            for t in self.model.TIMESTEPS:
+                self.model.feed_in[label, t] = per_unit[label][t]
+
+    def accepts(self, design):
+        """Every design can be set with update()."""
+        return True
+
+    def update(self, design):
+        """Assign the sizes of design, only for changed components."""
+        param_value = merge_parameters(design, self.params)
+        values = design_values(param_value, self.weather)
+        m = self.model
+
+        changed = []
+        for label, (name, _) in DESIGN_COMPONENTS.items():
+            if (self._values is not None
+                    and np.array_equal(values[label], self._values[label])):
+                continue
+            logging.debug('Update {0}'.format(label))
+            if label in FIXED_SOURCES:
+                m.design_size[label] = param_value[name]
+            elif label in TRANSFORMERS:
+                m.design_size[label] = values[label]
+            else:
+                m.design_size[label], m.storage_power[label] = values[label]
+            changed.append(label)
+        self._push(changed)
+
+        self.param_value = param_value
+        self._values = values
+
+    def set_weather(self, weather):
+        """Change the demands and the feed-in profiles to those of weather."""
+        if len(weather) < len(self.model.TIMESTEPS):
+            raise ValueError('The weather data has {0} time steps, the model '
+                             '{1}'.format(len(weather),
+                                          len(self.model.TIMESTEPS)))
+
+        changed = []
+        for label, profile in (('demand_el', weather.demand_el),
+                               ('demand_th', weather.demand_th)):
+            node = self.energysystem.groups[label]
+            bus = next(iter(node.inputs))
+            for t in self.model.TIMESTEPS:
+                var = self.model.flow[bus, node, t]
+                var.fix(profile[t])
+                changed.append(var)
+        if self._opt is not None:
+            for var in changed:
+                self._opt.update_var(var)
+
+        self._set_feed_in(weather)
+        self._push(FIXED_SOURCES)
+        self.weather = weather
+        self._values = design_values(self.param_value, weather)
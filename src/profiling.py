@@ -0,0 +1,161 @@
+"""
+Timing and memory of the phases of a run.
+
+Functions of the pipeline wrap their phases (loading the inputs, creating
+the oemof objects, building the model, solving, ...) in phase(name). While
+no profiler is started this does nothing; after start() every phase is
+recorded with
+
+    seconds         wall time
+    peak [MB]       peak of the memory allocated by Python and NumPy during
+                    the phase (tracemalloc, only with memory=True)
+    max_rss [MB]    peak resident memory of the process so far
+
+With profile_dir the phases are also run under cProfile and their
+statistics are written to profile_dir (one .prof file per phase, view them
+with pstats or snakeviz). Phases may be nested.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import contextlib
+import cProfile
+import csv
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# the started profiler, see start()
+_active = []
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss / 1024 ** (2 if sys.platform == 'darwin' else 1)
+
+
+class Profiler(object):
+    """Records of the phases run while the profiler is active."""
+
+    def __init__(self, memory=True, profile_dir=None):
+        self.memory = memory
+        self.profile_dir = profile_dir
+        self.records = []
+        self._stack = []
+        self._profiling = False
+
+    def _fold_peak(self):
+        # add the peak since the last reset to the innermost phase
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'],
+                                          tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the time and memory of the enclosed code as phase name."""
+        if self.memory:
+            self._fold_peak()
+        entry = {'peak': 0}
+        self._stack.append(entry)
+
+        # cProfile can not be nested, inner phases are part of the outer
+        profile = None
+        if self.profile_dir is not None and not self._profiling:
+            profile = cProfile.Profile()
+            self._profiling = True
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            if self.memory:
+                self._fold_peak()
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'],
+                                              entry['peak'])
+
+            record = {'phase': name,
+                      'depth': len(self._stack),
+                      'seconds': seconds,
+                      'peak [MB]': (entry['peak'] / 1024 ** 2
+                                    if self.memory else None),
+                      'max_rss [MB]': _max_rss()}
+            self.records.append(record)
+
+            if profile is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(
+                    self.profile_dir, '{0:02d}_{1}.prof'.format(
+                        len(self.records), name.replace(' ', '_'))))
+
+    def write(self, file_path):
+        """Write the records as JSON or CSV, depending on the extension."""
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if file_path.endswith('.json'):
+            with open(file_path, 'w') as f:
+                json.dump(self.records, f, indent=1)
+        else:
+            with open(file_path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=['phase', 'depth',
+                                                       'seconds', 'peak [MB]',
+                                                       'max_rss [MB]'])
+                writer.writeheader()
+                writer.writerows(self.records)
+
+
+def start(memory=True, profile_dir=None):
+    """Start recording the phases, returns the Profiler."""
+    stop()
+    profiler = Profiler(memory, profile_dir)
+    if memory:
+        tracemalloc.start()
+    _active.append(profiler)
+    return profiler
+
+
+def stop():
+    """Stop recording, returns the Profiler that was active (or None)."""
+    if not _active:
+        return None
+    profiler = _active.pop()
+    if profiler.memory:
+        tracemalloc.stop()
+    return profiler
+
+
+def phase(name):
+    """Context manager recording phase name if a profiler is started."""
+    if _active:
+        return _active[-1].phase(name)
+    return contextlib.nullcontext()
+
+
+def profiled(name):
+    """Decorator recording every call of the function as phase name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
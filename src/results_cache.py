@@ -0,0 +1,193 @@
+"""
+Content-addressed cache of solved designs.
+
+A solved design is stored under a hash of everything its results depend on:
+the design and general parameters, the weather data and the solver settings.
+Solving the same design again (re-running main_script.py, repeated or
+overlapping sweeps, re-plotting) loads the results from the cache instead of
+solving the LP.
+
+An entry holds the sequences of the string keyed results (flows and storage
+levels) and the KPIs of the design in one compressed NPZ file. The cache is
+bounded in size: when it grows beyond max_bytes the least recently used
+entries are removed.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from input_data import Weather
+
+# bump when the layout of the cache files changes
+CACHE_VERSION = 1
+
+
+def _update_hash(sha, value):
+    if isinstance(value, Weather):
+        for name in Weather.__slots__:
+            _update_hash(sha, getattr(value, name))
+    elif isinstance(value, np.ndarray):
+        sha.update(str((value.dtype.str, value.shape)).encode())
+        sha.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for name in sorted(value):
+            sha.update(repr(name).encode())
+            _update_hash(sha, value[name])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _update_hash(sha, item)
+    elif (isinstance(value, (int, float, np.integer, np.floating))
+          and not isinstance(value, bool)):
+        # 4 and 4.0 are the same design
+        sha.update(repr(float(value)).encode())
+    else:
+        sha.update(repr(value).encode())
+    sha.update(b';')
+
+
+def results_key(param_value, weather, **settings):
+    """
+    Hash of the parameters, weather data and solver settings of a solve.
+
+    param_value are the merged design and general parameters, settings
+    everything else the results depend on (solver, number of time steps,
+    typical periods, ...). Values may be scalars, arrays, Weather objects or
+    dicts and lists of these.
+    """
+    sha = hashlib.sha256(str(CACHE_VERSION).encode())
+    _update_hash(sha, {'param_value': param_value, 'weather': weather,
+                       'settings': settings})
+    return sha.hexdigest()
+
+
+class ResultsCache(object):
+    """
+    Directory of solved designs, keyed by results_key().
+
+    Instances only hold the directory and the size limit, so they can be
+    handed to worker processes; writes are atomic, so several processes can
+    share one cache directory.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _file(self, key):
+        return os.path.join(self.cache_dir, 'results_{0}.npz'.format(key))
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def load(self, key):
+        """
+        Results stored under key as (string_results, kpis), None if absent.
+
+        string_results has the format of
+        outputlib.views.convert_keys_to_strings (without scalars), kpis is a
+        Series.
+        """
+        cache_file = self._file(key)
+        try:
+            with np.load(cache_file, allow_pickle=False) as npz:
+                sequences = npz['sequences']
+                sources = npz['sources'].tolist()
+                targets = npz['targets'].tolist()
+                columns = npz['columns'].tolist()
+                timeindex = pd.date_range(str(npz['start']),
+                                          periods=len(sequences),
+                                          freq=str(npz['freq']))
+                kpis = pd.Series(npz['kpi_values'],
+                                 index=npz['kpi_names'].tolist())
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            # evicted by another process or partially removed
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+
+        string_results = {}
+        for number, key in enumerate(zip(sources, targets)):
+            string_results.setdefault(key, {'scalars': pd.Series(dtype=float),
+                                            'sequences': {}})
+            string_results[key]['sequences'][columns[number]] = \
+                sequences[:, number]
+        for value in string_results.values():
+            value['sequences'] = pd.DataFrame(value['sequences'],
+                                              index=timeindex)
+        logging.info('Load results from cache {0}'.format(cache_file))
+        return string_results, kpis
+
+    def store(self, key, string_results, kpis):
+        """Store the sequences of string_results and the kpis under key."""
+        sources, targets, columns, sequences = [], [], [], []
+        timeindex = None
+        for (source, target), value in string_results.items():
+            for column in value['sequences'].columns:
+                sources.append(source)
+                targets.append(target)
+                columns.append(str(column))
+                sequences.append(value['sequences'][column].to_numpy(
+                    dtype=np.float64))
+            timeindex = value['sequences'].index
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    sequences=np.column_stack(sequences),
+                    sources=np.array(sources, dtype=str),
+                    targets=np.array(targets, dtype=str),
+                    columns=np.array(columns, dtype=str),
+                    start=np.array(str(timeindex[0])),
+                    freq=np.array(timeindex.freqstr or 'H'),
+                    kpi_names=np.array(list(kpis.index), dtype=str),
+                    kpi_values=np.asarray(kpis, dtype=np.float64))
+            os.replace(tmp_file, self._file(key))
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('results_') and name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+        max_bytes, self.max_bytes = self.max_bytes, -1
+        try:
+            if os.path.isdir(self.cache_dir):
+                self.evict()
+        finally:
+            self.max_bytes = max_bytes
@@ -0,0 +1,138 @@
+"""
+Compact storage of the results of a solved energy system.
+
+Only the sequences of the string keyed results (flows and storage levels)
+are stored, as float32 columns of one NPY file, next to a JSON file with the
+column index, the KPIs and the meta results. Reading memory-maps the NPY
+file: results are loaded lazily and the DataFrames of read_results() are
+views of the file without copying.
+
+    results/optimisation_results/results/
+        sequences.npy   float32, one row per (source, target, column)
+        results.json    column index, time index, KPIs, meta results
+"""
+
+###############################################################################
+# imports
+###############################################################################
+from collections.abc import Mapping
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from results_view import ResultsView
+
+SEQUENCES_FILE = 'sequences.npy'
+INDEX_FILE = 'results.json'
+
+
+def _replace(path, write):
+    # write to a temporary file first so that readers never see a partially
+    # written file
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def write_results(path, string_results, kpis=None, meta=None):
+    """
+    Store the sequences of string_results in the directory path.
+
+    kpis (a Series or dict) and meta (e.g. energysystem.results['meta'])
+    are stored in results.json; values that are not JSON types are stored as
+    strings.
+    """
+    keys = []
+    columns = []
+    timeindex = None
+    for (source, target), value in string_results.items():
+        sequences = value['sequences']
+        keys.append([source, target, [str(c) for c in sequences.columns],
+                     len(columns)])
+        columns.extend(sequences[c].to_numpy(dtype=np.float32)
+                       for c in sequences.columns)
+        timeindex = sequences.index
+
+    # one row per column: the columns of one key are contiguous, in the
+    # order of the time steps
+    values = np.vstack(columns) if columns else np.zeros((0, 0), np.float32)
+
+    info = {'keys': keys,
+            'shape': list(values.shape),
+            'start': str(timeindex[0]) if timeindex is not None else None,
+            'freq': (timeindex.freqstr or 'H') if timeindex is not None
+            else None,
+            'kpis': {name: float(value)
+                     for name, value in dict(
+                         kpis if kpis is not None else {}).items()},
+            'meta': meta or {}}
+
+    os.makedirs(path, exist_ok=True)
+    _replace(os.path.join(path, SEQUENCES_FILE),
+             lambda f: np.save(f, values))
+    _replace(os.path.join(path, INDEX_FILE),
+             lambda f: f.write(json.dumps(info, indent=1,
+                                          default=str).encode()))
+
+
+class StoredResults(Mapping):
+    """
+    Results written by write_results, in the format of string keyed results.
+
+    results['chp', 'heat']['sequences'] is a DataFrame whose values are a
+    read-only view of the memory-mapped file. kpis and meta hold the stored
+    KPIs and meta results.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            info = json.load(f)
+        self._values = np.load(os.path.join(path, SEQUENCES_FILE),
+                               mmap_mode='r')
+        if list(self._values.shape) != info['shape']:
+            raise ValueError('{0} does not match {1}'.format(
+                SEQUENCES_FILE, INDEX_FILE))
+
+        self._keys = {(source, target): (columns, start)
+                      for source, target, columns, start in info['keys']}
+        self.timeindex = None
+        if info['start'] is not None:
+            self.timeindex = pd.date_range(info['start'],
+                                           periods=self._values.shape[1],
+                                           freq=info['freq'])
+        self.kpis = pd.Series(info['kpis'], dtype=float)
+        self.meta = info['meta']
+
+    def __getitem__(self, key):
+        columns, start = self._keys[key]
+        values = self._values[start:start + len(columns)].T
+        return {'scalars': pd.Series(dtype=float),
+                'sequences': pd.DataFrame(values, index=self.timeindex,
+                                          columns=columns, copy=False)}
+
+    def view(self):
+        """ResultsView of the memory-mapped file, without copying."""
+        index = {(source, target, column): start + number
+                 for (source, target), (columns, start) in self._keys.items()
+                 for number, column in enumerate(columns)}
+        return ResultsView(values=self._values, index=index,
+                           timeindex=self.timeindex)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def read_results(path):
+    """Results stored in the directory path, see StoredResults."""
+    return StoredResults(path)
@@ -0,0 +1,104 @@
+"""
+Array view of the results of a solved energy system.
+
+The string keyed results of outputlib hold one DataFrame per flow; every
+lookup like string_results['chp', 'heat']['sequences']['flow'][start:end]
+goes through pandas. ResultsView packs all sequences once into one 2-D NumPy
+array and looks them up by (source, target):
+
+    view = ResultsView(string_results)
+    view.flow(('chp', 'heat'), start, end)      # NumPy view, no copy
+    view.flow(('boiler', 'heat'), start, end)   # zeros if there is no boiler
+
+The array has one row per sequence, so that the hours of one flow are
+contiguous. Sequences of absent components are slices of one shared,
+read-only array of zeros.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import numpy as np
+
+
+class ResultsView(object):
+    """
+    Sequences of string keyed results as rows of one array.
+
+    results is a mapping of (source, target) to {'sequences': DataFrame},
+    e.g. the string keyed or stored results (see results_store.py), or the
+    node keyed energysystem.results['main']. values is the array of all
+    sequences, index maps (source, target, column) to its row.
+    """
+
+    def __init__(self, results=None, values=None, index=None,
+                 timeindex=None):
+        if results is not None:
+            values, index, timeindex = _pack(results)
+        self.values = values
+        self.index = index
+        self.timeindex = timeindex
+        self.values.flags.writeable = False
+        self._keys = {key[:2] for key in self.index}
+
+        self._zeros = np.zeros(self.values.shape[1], dtype=self.values.dtype)
+        self._zeros.flags.writeable = False
+
+    def __len__(self):
+        """Number of time steps."""
+        return self.values.shape[1]
+
+    def __contains__(self, key):
+        return tuple(key) in self._keys
+
+    def sequence(self, key, column, start=None, end=None):
+        """Hours [start, end) of column of key, zeros if it is absent."""
+        row = self.index.get((key[0], key[1], column))
+        if row is None:
+            return self._zeros[start:end]
+        return self.values[row, start:end]
+
+    def flow(self, key, start=None, end=None):
+        """Flow of key = (source, target) in [start, end), zeros if absent."""
+        return self.sequence(key, 'flow', start, end)
+
+    def sums(self, keys, column='flow'):
+        """Sum of the sequence of every key of the dict keys, 0 if absent."""
+        rows = {name: self.index.get((key[0], key[1], column))
+                for name, key in keys.items()}
+        present = [row for row in rows.values() if row is not None]
+        totals = dict(zip(present, self.values[present].sum(axis=1,
+                                                            dtype=float)))
+        return {name: totals.get(row, 0.) for name, row in rows.items()}
+
+
+def _pack(results):
+    # one copy of all sequences into a contiguous array
+    columns = []
+    for (source, target), value in results.items():
+        sequences = value['sequences']
+        for column in sequences.columns:
+            columns.append(((str(source), str(target), str(column)),
+                            sequences[column]))
+
+    timeindex = columns[0][1].index if columns else None
+    number_of_time_steps = len(timeindex) if columns else 0
+    values = np.empty((len(columns), number_of_time_steps))
+    index = {}
+    for row, (key, sequence) in enumerate(columns):
+        if len(sequence) != number_of_time_steps:
+            raise ValueError('The sequences of {0} have {1} instead of {2} '
+                             'time steps'.format(key[:2], len(sequence),
+                                                 number_of_time_steps))
+        values[row] = sequence.values
+        index[key] = row
+    return values, index, timeindex
+
+
+def results_view(results):
+    """ResultsView of results, results itself if it is one already."""
+    if isinstance(results, ResultsView):
+        return results
+    if hasattr(results, 'view'):  # stored results, see results_store.py
+        return results.view()
+    return ResultsView(results)
@@ -0,0 +1,173 @@
+"""
+Rolling horizon optimisation of the energy system.
+
+Instead of one model for the whole horizon, consecutive windows (e.g. one
+week) are optimised one after another. Every window looks ahead by an
+overlap (e.g. one day) whose results are discarded; the storage levels at the
+end of the kept part are the initial levels of the next window. Only one
+window model exists at a time, so the memory of the optimisation depends on
+the window size and not on the length of the horizon. The weather data may
+be streamed from the file (see input_data.stream_weather), so that also long
+weather files are never held in memory as a whole.
+
+The annual limit of the gas supply (sum_max_gas) is carried from window to
+window like the storage levels: every window may use what the kept hours of
+the windows before have left. Like the storage levels this is myopic, early
+windows may use up the budget that later ones would have needed more.
+
+The results of the windows are stitched together in the format of
+outputlib.processing.results, keyed by the labels of the nodes, so that
+display_results and the plots can be used unchanged after
+outputlib.views.convert_keys_to_strings.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+from collections import namedtuple
+import logging
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as po
+
+import oemof.solph as solph
+import oemof.outputlib as outputlib
+
+from design_components import STORAGES
+from energy_system import build_energy_system
+from energy_system import solve_model
+from input_data import Weather
+from input_data import concat_weather
+from input_data import merge_parameters
+from solver_config import pick_solver
+from solver_config import solver_options
+
+# results: stitched results in the format of energysystem.results
+# timeindex: hours of the whole horizon
+RollingHorizon = namedtuple('RollingHorizon', ['results', 'timeindex'])
+
+
+def _windows(weather, window, overlap):
+    """
+    (start, number of kept hours, Weather of the optimised hours, last) per
+    window.
+
+    weather is a Weather or an iterable of consecutive Weather parts, of
+    which only the hours up to the end of the next window are buffered.
+    """
+    parts = iter([weather]) if isinstance(weather, Weather) else iter(weather)
+    buffer = None
+    start = 0
+    while True:
+        # one hour more than window and overlap: the window is not the last
+        while buffer is None or len(buffer) <= window + overlap:
+            part = next(parts, None)
+            if part is None:
+                break
+            buffer = part if buffer is None else concat_weather([buffer,
+                                                                 part])
+        if buffer is None or len(buffer) == 0:
+            return
+        if len(buffer) <= window + overlap:
+            yield start, len(buffer), buffer, True
+            return
+        yield start, window, buffer.window(0, window + overlap), False
+        buffer = buffer.window(window, len(buffer))
+        start += window
+
+
+def _fix_final_storage_levels(model, levels):
+    # the storages of the original model are balanced over the whole
+    # horizon: the last window has to end at the initial storage levels
+    block = model.GenericStorageBlock
+    last = model.TIMESTEPS[-1]
+
+    def _final_level_rule(model, n):
+        return block.capacity[n, last] == levels[n.label]
+    model.final_storage_level = po.Constraint(block.STORAGES,
+                                              rule=_final_level_rule)
+
+
+def solve_rolling_horizon(design, params, weather, window=168, overlap=24,
+                          solver='cbc', solver_verbose=False, **settings):
+    """
+    Optimise the design window by window over the whole weather data.
+
+    weather is a Weather or an iterable of its consecutive parts, e.g.
+    input_data.stream_weather() of a long weather file; of these only the
+    hours of the next window are kept in memory. window and overlap are
+    given in hours, settings are those of solver_config.solver_options.
+    Returns a RollingHorizon:
+    results['main'] holds the stitched results, results['meta'] the meta
+    results of every window.
+    """
+    param_value = merge_parameters(design, params)
+    solver = pick_solver(solver)
+    options = solver_options(solver, **settings)
+
+    initial_levels = None
+    gas_budget = param_value['sum_max_gas'] * param_value['nom_val_gas']
+    gas_used = 0.
+
+    sequences = {}
+    scalars = {}
+    meta = []
+    for start, kept, window_weather, last in _windows(weather, window,
+                                                      overlap):
+        logging.info('Optimise hours {0} to {1}'.format(
+            start, start + len(window_weather)))
+        # the gas the kept hours of the windows before have left
+        window_params = dict(params, sum_max_gas=max(
+            gas_budget - gas_used, 0.) / param_value['nom_val_gas'])
+        window_system = build_energy_system(design, window_params,
+                                            window_weather)
+
+        if initial_levels is None:
+            initial_levels = {}
+            for label in STORAGES:
+                if label in window_system.groups:
+                    storage = window_system.groups[label]
+                    initial_levels[label] = (
+                        storage.initial_storage_level
+                        * storage.nominal_storage_capacity)
+            levels = dict(initial_levels)
+
+        # continue from the storage levels at the end of the last window
+        for label, level in levels.items():
+            storage = window_system.groups[label]
+            storage.initial_storage_level = (
+                level / storage.nominal_storage_capacity)
+            storage.balanced = False
+
+        model = solph.Model(window_system)
+        if last and levels:
+            _fix_final_storage_levels(model, initial_levels)
+        solve_model(model, solver, options, solver_verbose)
+
+        results = outputlib.processing.results(model)
+        meta.append(outputlib.processing.meta_results(model))
+
+        for key, value in results.items():
+            key = tuple(n.label if n is not None else None for n in key)
+            sequences.setdefault(key, []).append(
+                value['sequences'].iloc[:kept])
+            scalars.setdefault(key, value['scalars'])
+
+        for label in levels:
+            levels[label] = sequences[label, None][-1]['capacity'].iloc[-1]
+        gas_used += sequences['rgas', 'natural_gas'][-1]['flow'].sum()
+
+        # free the window model before the next one is built
+        del model, window_system, results
+
+    if initial_levels is None:
+        raise ValueError('The weather data is empty')
+    timeindex = pd.date_range('1/1/2030', periods=start + kept, freq='H')
+    main = {key: {'scalars': scalars[key],
+                  'sequences': pd.DataFrame(
+                      np.concatenate([s.values for s in parts]),
+                      columns=parts[0].columns, index=timeindex)}
+            for key, parts in sequences.items()}
+    return RollingHorizon({'main': main, 'meta': {'windows': meta}},
+                          timeindex)
@@ -0,0 +1,285 @@
+"""
+Screening of designs by bounds of their KPIs, before they are solved.
+
+For every design guaranteed lower and upper bounds of the KPIs of kpi.py
+are computed from the weather data and the capacities, without the LP:
+
+    variable costs    lower: every hour on its own (see fast_dispatch.py),
+                      the storages free sources up to their power, no
+                      limits of the gas supply; upper: the dispatch with
+                      idle storages, a feasible solution of the LP
+    costs             the annuity plus the bounds of the variable costs
+    CO2-emission      the variable costs times the smallest and the largest
+                      emission per EUR of gas and shortage, at least the
+                      emission of the shortage the capacities can not avoid
+    self-sufficiency  upper: the shortage the capacities can not avoid;
+                      lower: the largest shortage the upper bound of the
+                      variable costs can pay for
+
+For designs without storages both bounds of the variable costs are the
+optimum. The bounds hold for non-negative costs of excess.
+
+A design is skipped if its bounds violate a constraint (e.g. it can not
+reach a target self-sufficiency), or if a design that surely meets the
+constraints is surely at least as good in all objectives and better in one.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import logging
+
+import numpy as np
+import pandas as pd
+
+from design_components import STORAGES
+from design_components import design_values
+from fast_dispatch import dispatch
+from fast_dispatch import solve_hourly_lps
+from input_data import merge_parameters
+from kpi import KPI_NAMES
+from kpi import investment
+
+CO2, COSTS, SELF_SUFFICIENCY = KPI_NAMES
+
+# objectives that are maximised, the others are minimised
+MAXIMISED = (SELF_SUFFICIENCY,)
+
+# emission and costs of the flows the KPIs are computed from
+EMISSIONS = (('emission_gas', 'var_costs_gas'),
+             ('emission_el', 'var_costs_shortage_bel'),
+             ('emission_heat', 'var_costs_shortage_bth'))
+
+# relative margin for comparisons of bounds
+TOLERANCE = 1e-6
+
+
+def _flow_bounds(param_value, weather):
+    # bounds of the variable costs [EUR] of the KPIs, the shortages [MWh]
+    # the capacities can not avoid and the largest consumption of the heat
+    # pumps [MWh]
+    pv = param_value
+    values = design_values(pv, weather)
+    feed_in_el = (values['wind_turbine'] + values['PV_field']
+                  + values['PV_roof'])
+    power_el = values['storage_el'][1]
+    power_th = values['storage_th'][1]
+
+    cf_el_chp = pv['conversion_factor_bel_chp']
+    cf_th_chp = pv['conversion_factor_bth_chp']
+    eta_boiler = pv['conversion_factor_boiler']
+    cop = pv['COP_heat_pump']
+
+    # the hourly LP of fast_dispatch.py with the outflows of the storages
+    # as free sources; the costs of excess are not part of the KPIs
+    A = np.array([[cf_el_chp, 0, -1, 1, 0, -1, 0, 1, 0],
+                  [cf_th_chp, eta_boiler, cop, 0, 1, 0, -1, 0, 1]])
+    b = np.column_stack([weather.demand_el - feed_in_el,
+                         weather.demand_th - values['solar_thermal']])
+    cost = np.array([pv['var_costs_gas'], pv['var_costs_gas'], 0,
+                     pv['var_costs_shortage_bel'],
+                     pv['var_costs_shortage_bth'], 0, 0, 0, 0])
+    upper = np.array([values['chp'] / cf_th_chp,
+                      values['boiler'] / eta_boiler,
+                      values['heat_pump'] / cop,
+                      np.inf, np.inf, np.inf, np.inf, power_el, power_th])
+    lower = (solve_hourly_lps(A, b, cost, upper) @ cost).sum()
+
+    # idle storages keep their initial level, a feasible solution if they
+    # lose nothing; the costs of excess only raise the bound
+    upper_bound = np.inf
+    idle = all(pv['capacity_loss_storage_' + label[-2:]] == 0
+               or values[label][0] == 0 for label in STORAGES)
+    if idle:
+        try:
+            flows = dispatch(dict(pv, capacity_electr_storage=0,
+                                  capacity_thermal_storage=0), {}, weather)
+        except ValueError:
+            pass
+        else:
+            upper_bound = sum(
+                flows[key].sum() * pv[name] for key, name in (
+                    (('rgas', 'natural_gas'), 'var_costs_gas'),
+                    (('shortage_bel', 'electricity'),
+                     'var_costs_shortage_bel'),
+                    (('shortage_bth', 'heat'), 'var_costs_shortage_bth'),
+                    (('electricity', 'excess_bel'), 'var_costs_excess_bel'),
+                    (('heat', 'excess_bth'), 'var_costs_excess_bth')))
+
+    shortage_el = np.clip(b[:, 0] - upper[0] * cf_el_chp - power_el,
+                          0, None).sum()
+    shortage_th = np.clip(b[:, 1] - values['chp'] - values['boiler']
+                          - values['heat_pump'] - power_th, 0, None).sum()
+    return (lower, upper_bound, shortage_el, shortage_th,
+            len(weather) * upper[2])
+
+
+def _coverage_lower(budget, shortage_costs, demands):
+    # least coverage of the demands if the budget [EUR] pays for shortage,
+    # first of the demand whose coverage drops most per EUR
+    if min(shortage_costs) <= 0:
+        return 0.
+    rates = sorted((1 / (cost * demand)
+                    for cost, demand in zip(shortage_costs, demands)),
+                   reverse=True)
+    lost = 0.
+    for rate in rates:
+        share = min(1., budget * rate)
+        budget = max(budget - share / rate, 0.)
+        lost += share
+    return 1 - lost / len(rates)
+
+
+def kpi_bounds(designs, base_design, params, weather):
+    """
+    Lower and upper bounds of the KPIs of designs.
+
+    designs is a list of dicts of design parameters that override
+    base_design. Returns a DataFrame with one row per design and the
+    columns '<KPI> lower' and '<KPI> upper' for all KPI_NAMES.
+    """
+    base = merge_parameters(base_design, params)
+    for name in ('var_costs_excess_bel', 'var_costs_excess_bth'):
+        if base.get(name, 0) < 0:
+            raise ValueError('The bounds need non-negative {0}'.format(name))
+    table = pd.DataFrame(designs)
+    _, annuity = investment(table, base)
+    annuity = np.broadcast_to(annuity, len(table))
+
+    demand_el = weather.demand_el.sum()
+    demand_th = weather.demand_th.sum()
+    bounds = []
+    for design, design_annuity in zip(designs, annuity):
+        pv = merge_parameters(design, base)
+        lower, upper, shortage_el, shortage_th, heat_pump = _flow_bounds(
+            pv, weather)
+
+        # emission per EUR of gas and shortage
+        ratios = [pv[emission] / pv[cost] if pv[cost] > 0 else np.inf
+                  for emission, cost in EMISSIONS]
+        co2_lower = max(min(ratios) * lower,
+                        shortage_el * pv['emission_el']
+                        + shortage_th * pv['emission_heat'])
+        co2_upper = max(ratios) * upper if upper > 0 else 0.
+
+        # the electricity consumption includes the heat pumps
+        coverage_upper = (2 - shortage_el / (demand_el + heat_pump)
+                          - shortage_th / demand_th) / 2
+        # the variable costs pay for the shortage, at most for all of the
+        # consumption
+        coverage_lower = _coverage_lower(
+            upper, (pv['var_costs_shortage_bel'],
+                    pv['var_costs_shortage_bth']), (demand_el, demand_th))
+
+        bounds.append({CO2 + ' lower': co2_lower / 1e3,
+                       CO2 + ' upper': co2_upper / 1e3,
+                       COSTS + ' lower': (design_annuity + lower) / 1e6,
+                       COSTS + ' upper': (design_annuity + upper) / 1e6,
+                       SELF_SUFFICIENCY + ' lower': coverage_lower * 100,
+                       SELF_SUFFICIENCY + ' upper': coverage_upper * 100})
+    return pd.DataFrame(bounds, index=table.index)
+
+
+def _better(first, second, maximised):
+    # first >= second for maximised objectives, <= else, with a margin
+    margin = TOLERANCE * np.abs(second)
+    if maximised:
+        return first >= second - margin, first > second + margin
+    return first <= second + margin, first < second - margin
+
+
+def screen(bounds, min_self_sufficiency=None, max_co2=None, max_costs=None,
+           objectives=None):
+    """
+    Reasons to skip designs from their kpi_bounds.
+
+    Designs whose bounds violate min_self_sufficiency [%], max_co2 [t/a] or
+    max_costs [Mio. EUR/a] are skipped. With objectives (a subset of
+    KPI_NAMES) designs are also skipped if a design that surely meets the
+    constraints is surely better in the objectives: its worst bound is at
+    least as good as their best bound in all objectives, and better in one.
+
+    Returns a Series with the reason per design, '' for designs to solve.
+    """
+    constraints = [(SELF_SUFFICIENCY, min_self_sufficiency),
+                   (CO2, max_co2), (COSTS, max_costs)]
+    reasons = pd.Series('', index=bounds.index, name='Screening')
+    # designs that surely meet all constraints
+    feasible = np.ones(len(bounds), dtype=bool)
+    for name, limit in constraints:
+        if limit is None:
+            continue
+        maximised = name in MAXIMISED
+        best = bounds[name + (' upper' if maximised else ' lower')].values
+        worst = bounds[name + (' lower' if maximised else ' upper')].values
+        violated = ~_better(best, limit, maximised)[0]
+        reasons[violated & (reasons == '')] = 'violates ' + name
+        feasible &= _better(worst, limit, maximised)[0]
+
+    if objectives:
+        dominated = np.ones((len(bounds), len(bounds)), dtype=bool)
+        strictly = np.zeros_like(dominated)
+        for name in objectives:
+            maximised = name in MAXIMISED
+            best = bounds[name + (' upper' if maximised else ' lower')].values
+            worst = bounds[name + (' lower' if maximised else ' upper')].values
+            # [i, j]: the worst of design j against the best of design i
+            equal, better = _better(worst[None, :], best[:, None], maximised)
+            dominated &= equal
+            strictly |= better
+        dominated &= strictly & feasible[None, :]
+        np.fill_diagonal(dominated, False)
+        for row in np.flatnonzero(dominated.any(axis=1)
+                                  & (reasons == '').values):
+            reasons.iloc[row] = 'dominated by {0}'.format(
+                bounds.index[dominated[row].argmax()])
+    return reasons
+
+
+def screen_designs(designs, base_design, inputs, number_of_time_steps=None,
+                   min_self_sufficiency=None, max_co2=None, max_costs=None,
+                   objectives=None):
+    """
+    Bounds of the KPIs of designs and the reasons to skip them.
+
+    designs and base_design are those of sweep.run_sweep(), inputs is an
+    InputBundle, the KPIs are bounded for the first number_of_time_steps
+    hours. See screen() for the constraints and objectives.
+
+    Returns a DataFrame with one row per design: the design variables, the
+    kpi_bounds and the column 'Screening' with the reason to skip the
+    design, '' if it has to be solved.
+    """
+    weather = inputs.weather
+    if number_of_time_steps is not None:
+        weather = weather.window(0, number_of_time_steps)
+    bounds = kpi_bounds(designs, base_design, inputs.params, weather)
+    reasons = screen(bounds, min_self_sufficiency, max_co2, max_costs,
+                     objectives)
+    logging.info('Screening skips {0} of {1} designs'.format(
+        (reasons != '').sum(), len(reasons)))
+    return pd.concat([pd.DataFrame(designs, index=bounds.index), bounds,
+                      reasons], axis=1)
+
+
+if __name__ == '__main__':
+    import os
+
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+    from sweep import design_grid
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    base_design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    designs = design_grid(number_of_windturbines=[0, 4, 8, 12],
+                          number_of_chps=[0, 2, 4],
+                          capacity_thermal_storage=[0, 7])
+    table = screen_designs(designs, base_design, inputs,
+                           min_self_sufficiency=80, objectives=KPI_NAMES)
+    print(table)
@@ -0,0 +1,258 @@
+"""
+Sensitivity of the costs from the duals of one solve.
+
+Instead of solving again for every changed parameter, the marginal change of
+the objective (the variable costs of the simulated horizon [EUR]) is taken
+from the duals and reduced costs of the solved LP:
+
+* shadow prices: duals of the bus balances, the marginal costs of one more
+  MWh of demand per bus and hour [EUR/MWh]
+* parameters: derivatives of the objective with respect to the variable
+  costs, conversion factors and efficiencies of general_parameters.csv
+* capacities: derivatives with respect to one more unit of each design
+  parameter, next to the annuity of that unit; a negative net value means
+  one more unit lowers the annual costs
+
+The derivatives hold for small changes only, as long as the optimal basis
+does not change. The solve has to import the duals, see
+solve_energy_system(..., duals=True). Duals follow the convention of a
+minimisation: the change of the objective per unit increase of the right
+hand side of a constraint.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+from collections import namedtuple
+import logging
+
+import numpy as np
+import pandas as pd
+
+from design_components import DESIGN_COMPONENTS
+from design_components import FIXED_SOURCES
+from design_components import STORAGES
+from design_components import TRANSFORMERS
+from design_components import design_values
+from energy_system import build_energy_system
+from energy_system import solve_energy_system
+from input_data import merge_parameters
+from investment import nominal_units
+from kpi import INVESTMENT_COSTS
+from kpi import annuity_factor
+
+# variable costs -> (source, target) of the flow they are paid for
+VARIABLE_COSTS = {'var_costs_gas': ('rgas', 'natural_gas'),
+                  'var_costs_shortage_bel': ('shortage_bel', 'electricity'),
+                  'var_costs_shortage_bth': ('shortage_bth', 'heat'),
+                  'var_costs_excess_bel': ('electricity', 'excess_bel'),
+                  'var_costs_excess_bth': ('heat', 'excess_bth')}
+
+# conversion factors -> (transformer, input bus, output bus)
+CONVERSION_FACTORS = {
+    'conversion_factor_bth_chp': ('chp', 'natural_gas', 'heat'),
+    'conversion_factor_bel_chp': ('chp', 'natural_gas', 'electricity'),
+    'conversion_factor_boiler': ('boiler', 'natural_gas', 'heat'),
+    'COP_heat_pump': ('heat_pump', 'electricity', 'heat'),
+    }
+
+# efficiencies -> fixed sources whose feed-in is proportional to them
+EFFICIENCIES = {'eta_PV': ('PV_field', 'PV_roof'),
+                'eta_solar_th': ('solar_thermal',)}
+
+Sensitivity = namedtuple('Sensitivity', ['prices', 'parameters',
+                                         'capacities'])
+
+
+def _values(suffix, variables):
+    return np.array([suffix.get(var, 0.) or 0. for var in variables])
+
+
+def _flows(model, source, target):
+    # flow variables of (source, target) labels, None if absent
+    groups = model.es.groups
+    if source not in groups or target not in groups:
+        return None
+    key = (groups[source], groups[target])
+    if key not in model.flows:
+        return None
+    return [model.flow[key[0], key[1], t] for t in model.TIMESTEPS]
+
+
+def _upper_bound_value(model, variables):
+    # change of the objective per unit increase of the upper bounds of
+    # variables: the negative reduced costs of variables at their bound
+    return np.minimum(_values(model.rc, variables), 0.).sum()
+
+
+def _relation_duals(model, label, bus_in, bus_out):
+    # duals of the conversion constraints of a transformer per hour
+    groups = model.es.groups
+    node = groups[label]
+    return np.array([model.dual.get(model.TransformerBlock.relation[
+        node, groups[bus_in], groups[bus_out], t], 0.) or 0.
+        for t in model.TIMESTEPS])
+
+
+def shadow_prices(model):
+    """Duals of the bus balances [EUR/MWh], one column per bus."""
+    groups = model.es.groups
+    prices = {}
+    for bus in ('electricity', 'heat', 'natural_gas'):
+        node = groups[bus]
+        prices[bus] = [model.dual.get(model.Bus.balance[node, t], np.nan)
+                       for t in model.TIMESTEPS]
+    return pd.DataFrame(prices, index=model.es.timeindex[:len(
+        model.TIMESTEPS)])
+
+
+def parameter_sensitivities(model, param_value, prices=None):
+    """
+    Change of the objective [EUR] per unit increase of general parameters.
+
+    By the envelope theorem the derivative only depends on the solution:
+    variable costs are weighted with their flow, conversion factors with
+    the duals of the conversion constraints of their transformer and
+    efficiencies with the shadow price of the feed-in they raise.
+    """
+    if prices is None:
+        prices = shadow_prices(model)
+    groups = model.es.groups
+    sensitivities = {}
+
+    for name, (source, target) in VARIABLE_COSTS.items():
+        flows = _flows(model, source, target)
+        sensitivities[name] = (0. if flows is None
+                               else sum(var.value for var in flows))
+
+    # input * conversion factor - output == 0: one more unit of the factor
+    # lowers the right hand side by the input; the dual of this relation
+    # is the price of the output bus only while the output is below its
+    # nominal value
+    for name, (label, bus_in, bus_out) in CONVERSION_FACTORS.items():
+        flows = _flows(model, bus_in, label)
+        if flows is None:
+            sensitivities[name] = 0.
+            continue
+        inputs = np.array([var.value for var in flows])
+        sensitivities[name] = -(_relation_duals(model, label, bus_in, bus_out)
+                                * inputs).sum()
+
+    # the feed-in is proportional to the efficiency
+    for name, labels in EFFICIENCIES.items():
+        total = 0.
+        for label in labels:
+            bus = DESIGN_COMPONENTS[label][1]
+            flows = _flows(model, label, bus)
+            if flows is None:
+                continue
+            feed_in = np.array([var.value for var in flows])
+            total -= (prices[bus].values * feed_in).sum() / param_value[name]
+        sensitivities[name] = total
+
+    # the gas supply is limited per hour and per horizon
+    gas = _flows(model, 'rgas', 'natural_gas')
+    summed_max = 0.
+    key = (groups['rgas'], groups['natural_gas'])
+    if hasattr(model.Flow, 'summed_max') and key in model.Flow.summed_max:
+        summed_max = model.dual.get(model.Flow.summed_max[key], 0.) or 0.
+    sensitivities['sum_max_gas'] = summed_max * param_value['nom_val_gas']
+    sensitivities['nom_val_gas'] = (_upper_bound_value(model, gas)
+                                    + summed_max * param_value['sum_max_gas'])
+
+    return pd.Series(sensitivities, name='d costs / d parameter [EUR]')
+
+
+def capacity_values(model, param_value, weather, prices=None):
+    """
+    Change of the objective [EUR] per additional unit of every design
+    parameter, in the units of design_parameters.csv.
+
+    Fixed sources are valued with the shadow prices of their feed-in, also
+    if they are absent; transformers and storages with the reduced costs of
+    the variables bounded by their size, NaN if they are absent. The initial
+    storage level, fixed to a share of the capacity, is not included.
+    """
+    if prices is None:
+        prices = shadow_prices(model)
+    units = nominal_units(param_value)
+    number_of_time_steps = len(model.TIMESTEPS)
+    groups = model.es.groups
+
+    # feed-in of one unit of every fixed source
+    feed_in = design_values(
+        merge_parameters({name: 1 for name, _ in DESIGN_COMPONENTS.values()},
+                         param_value), weather)
+
+    values = {}
+    for label, (name, bus) in DESIGN_COMPONENTS.items():
+        if label in FIXED_SOURCES:
+            values[name] = -(prices[bus].values
+                             * feed_in[label][:number_of_time_steps]).sum()
+        elif label not in groups:
+            values[name] = np.nan
+        elif label in TRANSFORMERS:
+            values[name] = (_upper_bound_value(model,
+                                               _flows(model, label, bus))
+                            * units[name])
+        elif label in STORAGES:
+            node = groups[label]
+            levels = [model.GenericStorageBlock.capacity[node, t]
+                      for t in model.TIMESTEPS]
+            max_level = np.array([node.max_storage_level[t]
+                                  for t in model.TIMESTEPS])
+            power = (_upper_bound_value(model, _flows(model, label, bus))
+                     + _upper_bound_value(model, _flows(model, bus, label)))
+            charge_time = param_value['charge_time_' + label]
+            capacity = (np.minimum(_values(model.rc, levels), 0.)
+                        * max_level).sum() + power / charge_time
+            values[name] = capacity * units[name]
+
+    annuity = float(annuity_factor(param_value['lifetime'],
+                                   param_value['wacc']))
+    table = pd.DataFrame({'d costs / d unit [EUR]': pd.Series(values)})
+    table['annuity [EUR/unit]'] = [param_value[INVESTMENT_COSTS[name]]
+                                   * annuity for name in table.index]
+    table['net [EUR/unit]'] = (table['d costs / d unit [EUR]']
+                               + table['annuity [EUR/unit]'])
+    return table
+
+
+def sensitivity(model, param_value, weather):
+    """Shadow prices, parameter and capacity sensitivities of a solve."""
+    prices = shadow_prices(model)
+    return Sensitivity(prices,
+                       parameter_sensitivities(model, param_value, prices),
+                       capacity_values(model, param_value, weather, prices))
+
+
+def solve_sensitivity(design, params, weather, number_of_time_steps=None,
+                      solver='cbc', solver_verbose=False, **settings):
+    """Solve design once with duals, returns its Sensitivity."""
+    energysystem = build_energy_system(design, params, weather,
+                                       number_of_time_steps)
+    model = solve_energy_system(energysystem, solver=solver,
+                                solver_verbose=solver_verbose, duals=True,
+                                **settings)
+    logging.info('Evaluate the sensitivities')
+    return sensitivity(model, merge_parameters(design, params), weather)
+
+
+if __name__ == '__main__':
+    import os
+
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    result = solve_sensitivity(design, inputs.params, inputs.weather)
+    print(result.parameters)
+    print(result.capacities)
+    print(result.prices.describe())
@@ -0,0 +1,125 @@
+"""
+Solver configuration for CBC, HiGHS and GLPK.
+
+Options are given once in solver independent terms and translated to the
+command line options of the chosen solver:
+
+    threads      number of threads
+    method       'simplex' or 'barrier' (interior point)
+    time_limit   [s]
+    mip_gap      relative MIP gap
+    tolerance    primal feasibility tolerance
+
+Options a solver does not support are ignored with a warning. With
+solver='auto' the first installed solver of SOLVER_PREFERENCE is used.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import logging
+
+from pyomo.opt import SolverFactory
+
+# installed solvers are picked in this order by solver='auto'; the models of
+# this repository are LPs, for which HiGHS is usually the fastest
+SOLVER_PREFERENCE = ('appsi_highs', 'cbc', 'glpk')
+
+# solvers that are not called through a file interface by solph.Model.solve
+DIRECT_SOLVERS = ('appsi_highs',)
+
+# solver -> option -> name of the solver option
+OPTION_NAMES = {
+    'cbc': {'threads': 'threads',
+            'time_limit': 'sec',
+            'mip_gap': 'ratioGap',
+            'tolerance': 'primalTolerance'},
+    'glpk': {'time_limit': 'tmlim',
+             'mip_gap': 'mipgap'},
+    'appsi_highs': {'threads': 'threads',
+                    'time_limit': 'time_limit',
+                    'mip_gap': 'mip_rel_gap',
+                    'tolerance': 'primal_feasibility_tolerance'},
+    }
+
+# solver -> method -> solver options; '' are options without a value
+METHODS = {
+    'cbc': {'simplex': {'dualSimplex': ''},
+            'barrier': {'barrier': ''}},
+    'glpk': {'simplex': {'simplex': ''},
+             'barrier': {'interior': ''}},
+    'appsi_highs': {'simplex': {'solver': 'simplex'},
+                    'barrier': {'solver': 'ipm'}},
+    }
+
+# the iteration count in the solver results of Pyomo
+ITERATIONS = 'Number of iterations'
+
+_available = {}
+
+
+def available(solver):
+    """True if Pyomo finds the solver."""
+    if solver not in _available:
+        try:
+            _available[solver] = bool(
+                SolverFactory(solver).available(exception_flag=False))
+        except Exception:
+            _available[solver] = False
+    return _available[solver]
+
+
+def pick_solver(solver='auto'):
+    """The solver to use: solver itself or, for 'auto', the fastest found."""
+    if solver != 'auto':
+        return solver
+    for name in SOLVER_PREFERENCE:
+        if available(name):
+            logging.info('Use solver {0}'.format(name))
+            return name
+    raise RuntimeError('None of the solvers {0} is installed'.format(
+        ', '.join(SOLVER_PREFERENCE)))
+
+
+def solver_options(solver, threads=None, method=None, time_limit=None,
+                   mip_gap=None, tolerance=None):
+    """Options of solver for the given settings (None: solver default)."""
+    settings = {'threads': threads, 'time_limit': time_limit,
+                'mip_gap': mip_gap, 'tolerance': tolerance}
+    names = OPTION_NAMES.get(solver, {})
+    options = {}
+    for setting, value in settings.items():
+        if value is None:
+            continue
+        if setting in names:
+            options[names[setting]] = value
+        else:
+            logging.warning('{0} is not supported for {1}, ignored'.format(
+                setting, solver))
+
+    if method is not None:
+        if method not in ('simplex', 'barrier'):
+            raise ValueError("method must be 'simplex' or 'barrier'")
+        if method in METHODS.get(solver, {}):
+            options.update(METHODS[solver][method])
+        else:
+            logging.warning('method is not supported for {0}, ignored'
+                            .format(solver))
+    return options
+
+
+def iterations(solver_results):
+    """Iteration count reported by the solver, None if not reported."""
+    if isinstance(solver_results, dict):
+        for key, value in solver_results.items():
+            if key == ITERATIONS:
+                return value
+            found = iterations(value)
+            if found is not None:
+                return found
+    elif isinstance(solver_results, (list, tuple)):
+        for value in solver_results:
+            found = iterations(value)
+            if found is not None:
+                return found
+    return None
@@ -0,0 +1,337 @@
+"""
+LP of the energy system assembled as sparse matrices and solved by HiGHS.
+
+solph.Model creates one Pyomo object per variable and constraint and writes
+them to an LP file for the solver. For the fixed topology of
+energy_system.py the same LP is assembled here directly as scipy.sparse
+matrices from the design and general parameters and solved in memory by
+scipy.optimize.linprog (HiGHS):
+
+    columns   hourly blocks of the gas source, the inputs of CHP, boiler and
+              heat pump, shortage and excess of electricity and heat, the
+              in- and outflow and level of every storage, and import and
+              export of every exchange link
+    A_eq      hourly balances of natural gas, electricity and heat, storage
+              balances
+    A_ub      limit of the annual gas supply (sum_max_gas)
+
+The outputs of the transformers are eliminated (output = conversion factor
+* input), their nominal values bound the inputs instead. Fixed flows
+(demands, wind, PV, solar thermal) are constants of the balances. The
+solution is returned in the format of the string keyed results, see
+SparseModel.results.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+from scipy.optimize import linprog
+
+from design_components import components
+from design_components import design_values
+from input_data import merge_parameters
+from profiling import phase
+
+# solver_config settings -> linprog options of HiGHS
+METHODS = {'simplex': 'highs-ds', 'barrier': 'highs-ipm', None: 'highs'}
+OPTION_NAMES = {'time_limit': 'time_limit',
+                'tolerance': 'primal_feasibility_tolerance'}
+
+# storage label -> (bus, suffix of its parameters)
+STORAGE_PARAMETERS = {'storage_th': ('heat', 'th'),
+                      'storage_el': ('electricity', 'el')}
+
+
+class SparseModel(object):
+    """
+    The LP of one design as sparse matrices.
+
+    exchanges maps labels of links to other systems to (bus, capacity [MW]);
+    every link adds an import (label, bus) and an export (bus, label) column
+    without costs, see districts.py.
+
+    After solve(), results holds {'main': string keyed results, 'meta':
+    meta results} like energysystem.results, where the keys of 'main' are
+    already strings (outputlib.views.convert_keys_to_strings leaves them
+    unchanged).
+    """
+
+    def __init__(self, design, params, weather, number_of_time_steps=None,
+                 exchanges=None):
+        if number_of_time_steps is None:
+            number_of_time_steps = len(weather)
+        self.param_value = merge_parameters(design, params)
+        self.number_of_time_steps = number_of_time_steps
+        self.weather = weather.window(0, number_of_time_steps)
+        self.timeindex = pd.date_range('1/1/2030',
+                                       periods=number_of_time_steps,
+                                       freq='H')
+        self.exchanges = dict(exchanges or {})
+        self.results = {}
+        self.x = None
+
+        start = time.perf_counter()
+        with phase('build model'):
+            self._assemble()
+        self.build_time = time.perf_counter() - start
+
+    def _add_column(self, key, cost=0., upper=np.inf):
+        # one column per hour; returns the index of the first
+        first = self._number_of_columns
+        self._columns[key] = first
+        self._cost.append(np.broadcast_to(np.asarray(cost, float),
+                                          self.number_of_time_steps))
+        self._upper.append(np.broadcast_to(np.asarray(upper, float),
+                                           self.number_of_time_steps))
+        self._number_of_columns += self.number_of_time_steps
+        return first
+
+    def _add_entries(self, row, column, coefficient, shift=0):
+        # coefficient of column hour t - shift in row hour t
+        hours = np.arange(shift, self.number_of_time_steps)
+        self._rows.append(row + hours)
+        self._cols.append(column + hours - shift)
+        self._values.append(np.broadcast_to(np.asarray(coefficient, float),
+                                            self.number_of_time_steps)[shift:])
+
+    def _assemble(self):
+        pv = self.param_value
+        T = self.number_of_time_steps
+        present = components(pv)
+        values = design_values(pv, self.weather)
+        zeros = np.zeros(T)
+
+        self._columns = {}
+        self._cost, self._upper = [], []
+        self._rows, self._cols, self._values = [], [], []
+        self._number_of_columns = 0
+
+        # rows: balances of natural gas, electricity, heat, then storages
+        balance = {'natural_gas': 0, 'electricity': T, 'heat': 2 * T}
+        b_eq = [zeros,
+                self.weather.demand_el - sum(
+                    values[label] if label in present else zeros
+                    for label in ('wind_turbine', 'PV_field', 'PV_roof')),
+                self.weather.demand_th - (values['solar_thermal']
+                                          if 'solar_thermal' in present
+                                          else zeros)]
+
+        gas = self._add_column(('rgas', 'natural_gas'), pv['var_costs_gas'],
+                               pv['nom_val_gas'])
+        self._add_entries(balance['natural_gas'], gas, 1)
+
+        for label, bus, cost in (
+                ('shortage_bel', 'electricity', pv['var_costs_shortage_bel']),
+                ('shortage_bth', 'heat', pv['var_costs_shortage_bth'])):
+            self._add_entries(balance[bus], self._add_column((label, bus),
+                                                             cost), 1)
+        for label, bus, cost in (
+                ('excess_bel', 'electricity', pv['var_costs_excess_bel']),
+                ('excess_bth', 'heat', pv['var_costs_excess_bth'])):
+            self._add_entries(balance[bus], self._add_column((bus, label),
+                                                             cost), -1)
+
+        for label, (bus, capacity) in self.exchanges.items():
+            self._add_entries(balance[bus], self._add_column(
+                (label, bus), upper=capacity), 1)
+            self._add_entries(balance[bus], self._add_column(
+                (bus, label), upper=capacity), -1)
+
+        # transformers: input columns, the outputs enter the balances with
+        # their conversion factors
+        self._outputs = {}
+        transformers = (
+            ('chp', 'natural_gas', pv['conversion_factor_bth_chp'],
+             {'heat': pv['conversion_factor_bth_chp'],
+              'electricity': pv['conversion_factor_bel_chp']}),
+            ('boiler', 'natural_gas', pv['conversion_factor_boiler'],
+             {'heat': pv['conversion_factor_boiler']}),
+            ('heat_pump', 'electricity', pv['COP_heat_pump'],
+             {'heat': pv['COP_heat_pump']}))
+        for label, bus_in, heat_factor, outputs in transformers:
+            if label not in present:
+                continue
+            column = self._add_column((bus_in, label),
+                                      upper=values[label] / heat_factor)
+            self._add_entries(balance[bus_in], column, -1)
+            for bus_out, factor in outputs.items():
+                self._add_entries(balance[bus_out], column, factor)
+            self._outputs[label] = outputs
+
+        # storages: level[t] = (1 - loss) * level[t - 1] + inflow * eta_in
+        # - outflow / eta_out, the level at the end equals the initial level
+        row = 3 * T
+        self._initial_levels = {}
+        for label, (bus, suffix) in STORAGE_PARAMETERS.items():
+            if label not in present:
+                continue
+            capacity, power = values[label]
+            loss = pv['capacity_loss_storage_' + suffix]
+            eta_in = pv['inflow_conv_factor_storage_' + suffix]
+            eta_out = pv['outflow_conv_factor_storage_' + suffix]
+            initial = pv['init_capacity_storage_' + suffix] * capacity
+
+            inflow = self._add_column((bus, label), upper=power)
+            outflow = self._add_column((label, bus), upper=power)
+            level = self._add_column((label, 'None'), upper=capacity)
+            self._add_entries(balance[bus], inflow, -1)
+            self._add_entries(balance[bus], outflow, 1)
+            self._add_entries(row, level, 1)
+            self._add_entries(row, level, -(1 - loss), shift=1)
+            self._add_entries(row, inflow, -eta_in)
+            self._add_entries(row, outflow, 1 / eta_out)
+            b_eq.append(np.concatenate([[(1 - loss) * initial],
+                                        np.zeros(T - 1)]))
+            self._initial_levels[label] = (level + T - 1, initial)
+            row += T
+
+        self.c = np.concatenate(self._cost)
+        self.upper = np.concatenate(self._upper)
+        self.lower = np.zeros(self._number_of_columns)
+        # balanced storages, the level at the end is fixed
+        for column, initial in self._initial_levels.values():
+            self.lower[column] = self.upper[column] = initial
+
+        self.A_eq = sparse.csr_array(
+            (np.concatenate(self._values),
+             (np.concatenate(self._rows), np.concatenate(self._cols))),
+            shape=(row, self._number_of_columns))
+        self.b_eq = np.concatenate(b_eq)
+
+        # annual gas supply
+        self.A_ub = sparse.csr_array(
+            (np.ones(T), (np.zeros(T, dtype=int), gas + np.arange(T))),
+            shape=(1, self._number_of_columns))
+        self.b_ub = np.array([pv['sum_max_gas'] * pv['nom_val_gas']])
+
+    def column_range(self, key):
+        """Slice of the hourly columns of the flow key in c, lower, upper."""
+        first = self._columns[key]
+        return slice(first, first + self.number_of_time_steps)
+
+    def flow(self, key):
+        """Hourly values of the column key in the last solution."""
+        return self.x[self.column_range(key)]
+
+    def solve(self, solver_verbose=False, method=None, time_limit=None,
+              tolerance=None, **ignored):
+        """
+        Solve the LP with HiGHS, returns self.results.
+
+        method is 'simplex', 'barrier' or None (HiGHS chooses), other
+        settings of solver_config.solver_options that HiGHS does not take
+        through linprog (threads, mip_gap) are ignored with a warning.
+        """
+        for name, value in ignored.items():
+            if value is not None:
+                logging.warning('{0} is not supported by the sparse model, '
+                                'ignored'.format(name))
+        options = {'disp': solver_verbose}
+        for name, value in (('time_limit', time_limit),
+                            ('tolerance', tolerance)):
+            if value is not None:
+                options[OPTION_NAMES[name]] = value
+
+        logging.info('Solve the sparse LP ({0} columns, {1} non-zeros)'
+                     .format(self._number_of_columns,
+                             self.A_eq.nnz + self.A_ub.nnz))
+        start = time.perf_counter()
+        with phase('solve'):
+            solution = linprog(self.c, A_ub=self.A_ub, b_ub=self.b_ub,
+                               A_eq=self.A_eq, b_eq=self.b_eq,
+                               bounds=np.column_stack([self.lower,
+                                                       self.upper]),
+                               method=METHODS[method], options=options)
+        solve_time = time.perf_counter() - start
+        if solution.status != 0:
+            raise RuntimeError('The sparse LP was not solved: {0}'.format(
+                solution.message))
+
+        self.x = solution.x
+        with phase('process results'):
+            self.results = {'main': self._string_results(solution.x),
+                            'meta': {'objective': solution.fun,
+                                     'solver_name': 'highs',
+                                     'solver_options': dict(
+                                         options, method=METHODS[method]),
+                                     'build_time': self.build_time,
+                                     'solve_time': solve_time,
+                                     'iterations': solution.nit,
+                                     'status': solution.message}}
+        logging.info('Built in {0:.1f} s, solved in {1:.1f} s'.format(
+            self.build_time, solve_time))
+        return self.results
+
+    def _string_results(self, x):
+        T = self.number_of_time_steps
+        pv = self.param_value
+        present = components(pv)
+        values = design_values(pv, self.weather)
+
+        def column(key):
+            first = self._columns[key]
+            return x[first:first + T]
+
+        flows = {('electricity', 'demand_el'): self.weather.demand_el,
+                 ('heat', 'demand_th'): self.weather.demand_th}
+        for label in ('wind_turbine', 'PV_field', 'PV_roof'):
+            if label in present:
+                flows[label, 'electricity'] = values[label]
+        if 'solar_thermal' in present:
+            flows['solar_thermal', 'heat'] = values['solar_thermal']
+        for key in self._columns:
+            if key[1] != 'None':
+                flows[key] = column(key)
+        for label, outputs in self._outputs.items():
+            inputs = flows[next(key for key in self._columns
+                                if key[1] == label)]
+            for bus, factor in outputs.items():
+                flows[label, bus] = inputs * factor
+
+        results = {key: {'scalars': pd.Series(dtype=float),
+                         'sequences': pd.DataFrame(
+                             {'flow': np.clip(flow, 0, None)},
+                             index=self.timeindex)}
+                   for key, flow in flows.items()}
+        for label in self._initial_levels:
+            results[label, 'None'] = {
+                'scalars': pd.Series(dtype=float),
+                'sequences': pd.DataFrame(
+                    {'capacity': column((label, 'None'))},
+                    index=self.timeindex)}
+        return results
+
+
+def solve_sparse(design, params, weather, number_of_time_steps=None,
+                 solver_verbose=False, exchanges=None, **settings):
+    """Assemble and solve the LP of design, returns the SparseModel."""
+    model = SparseModel(design, params, weather, number_of_time_steps,
+                        exchanges)
+    model.solve(solver_verbose=solver_verbose, **settings)
+    return model
+
+
+if __name__ == '__main__':
+    import os
+
+    from basic_analysis import display_results
+    from input_data import load_input_bundle
+    from input_data import load_parameters
+
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    model = solve_sparse(design, inputs.params, inputs.weather)
+    display_results(model.results['main'],
+                    merge_parameters(design, inputs.params))
@@ -0,0 +1,338 @@
+"""
+Parallel sweep over the design parameters of the energy system.
+
+Every design vector overrides entries of design_parameters.csv. The designs
+are built and solved in a pool of worker processes; the input bundle (weather
+data and general parameters, see input_data.py) is loaded once in the parent
+process and handed to each worker when the pool starts, not once per design.
+"""
+
+###############################################################################
+# imports
+###############################################################################
+import itertools
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+import oemof.outputlib as outputlib
+
+from aggregation import solve_aggregated
+from energy_system import build_energy_system
+from energy_system import solve_energy_system
+from fast_dispatch import dispatch
+from fast_dispatch import has_storage
+from input_data import load_input_bundle
+from input_data import load_parameters
+from input_data import merge_parameters
+from kpi import FLOW_SUMS
+from kpi import evaluate_kpis
+from kpi import flow_sums
+from persistent_model import PersistentModel
+from persistent_model import TemplateModel
+from results_cache import results_key
+from screening import screen_designs
+from sparse_model import solve_sparse
+
+# set once per worker process by _init_worker
+_worker_state = {}
+
+
+###############################################################################
+# design vectors
+###############################################################################
+def design_grid(**ranges):
+    """
+    Full factorial grid of design vectors.
+
+    >>> design_grid(number_of_chps=[2, 4], number_of_boilers=[1])
+    [{'number_of_chps': 2, 'number_of_boilers': 1},
+     {'number_of_chps': 4, 'number_of_boilers': 1}]
+    """
+    names = list(ranges)
+    return [dict(zip(names, values))
+            for values in itertools.product(*ranges.values())]
+
+
+def design_sample(bounds, number_of_designs, integer=(), seed=None):
+    """
+    Uniform random sample of design vectors.
+
+    bounds maps var_name to (lower, upper). Names listed in integer are drawn
+    as whole numbers (e.g. number of turbines), all others as floats.
+    """
+    rng = np.random.default_rng(seed)
+    designs = [{} for _ in range(number_of_designs)]
+    for name, (lower, upper) in bounds.items():
+        if name in integer:
+            values = rng.integers(lower, upper, number_of_designs,
+                                  endpoint=True)
+        else:
+            values = rng.uniform(lower, upper, number_of_designs)
+        for design, value in zip(designs, values):
+            design[name] = value.item()
+    return designs
+
+
+###############################################################################
+# workers
+###############################################################################
+def _init_worker(base_design, inputs, cfg):
+    _worker_state['base_design'] = base_design
+    _worker_state['inputs'] = inputs
+    _worker_state['cfg'] = cfg
+
+
+def design_parameters(base_design, design):
+    """Copy of base_design with the values of design set."""
+    unknown = set(design) - set(base_design)
+    if unknown:
+        raise ValueError('Unknown design parameters: {0}'.format(
+            ', '.join(sorted(unknown))))
+    return merge_parameters(design, base_design)
+
+
+def evaluate_design(design, base_design, inputs, cfg):
+    """
+    Build and solve one design.
+
+    Returns the annual flow sums the KPIs are computed from (see kpi.py).
+    """
+    design = design_parameters(base_design, design)
+    param_value = merge_parameters(design, inputs.params)
+
+    if cfg.get('fast_dispatch') and not has_storage(param_value):
+        weather = inputs.weather
+        if cfg['number_of_time_steps'] is not None:
+            weather = weather.window(0, cfg['number_of_time_steps'])
+        try:
+            flows = dispatch(design, inputs.params, weather)
+        except ValueError:
+            # the gas supply couples the hours, solve the LP instead
+            pass
+        else:
+            return {name: flows[key].sum() if key in flows else 0.
+                    for name, key in FLOW_SUMS.items()}
+
+    # only LP solves are cached, the fast dispatch is faster than loading
+    results_cache = cfg.get('results_cache')
+    if results_cache is not None:
+        key = results_key(param_value, inputs.weather,
+                          solver='highs' if cfg.get('sparse')
+                          else cfg['solver'],
+                          number_of_time_steps=(cfg['number_of_time_steps']
+                                                or len(inputs.weather)),
+                          aggregation=cfg.get('aggregation'))
+        cached = results_cache.load(key)
+        if cached is not None:
+            return flow_sums(cached[0])
+
+    if cfg.get('aggregation') is not None:
+        energysystem = solve_aggregated(design, inputs.params,
+                                        cfg['aggregation'],
+                                        solver=cfg['solver'],
+                                        solver_verbose=cfg['solver_verbose'])
+    elif cfg.get('persistent'):
+        energysystem = _solve_persistent(design, inputs, cfg)
+    elif cfg.get('sparse'):
+        energysystem = solve_sparse(design, inputs.params, inputs.weather,
+                                    cfg['number_of_time_steps'],
+                                    solver_verbose=cfg['solver_verbose'])
+    else:
+        energysystem = build_energy_system(design, inputs.params,
+                                           inputs.weather,
+                                           cfg['number_of_time_steps'])
+        solve_energy_system(energysystem, solver=cfg['solver'],
+                            solver_verbose=cfg['solver_verbose'])
+
+    string_results = outputlib.views.convert_keys_to_strings(
+        energysystem.results['main'])
+    sums = flow_sums(string_results)
+    if results_cache is not None:
+        results_cache.store(key, string_results,
+                            evaluate_kpis(param_value, param_value,
+                                          sums).iloc[0])
+    return sums
+
+
+def _solve_persistent(design, inputs, cfg):
+    # reuse the model of the previous design of this worker if possible
+    model = _worker_state.get('model')
+    if model is not None and model.accepts(design):
+        model.update(design)
+    else:
+        if cfg['persistent'] == 'template':
+            model_class = TemplateModel
+        else:
+            model_class = PersistentModel
+        model = model_class(design, inputs.params, inputs.weather,
+                            cfg['number_of_time_steps'],
+                            solver=cfg['solver'],
+                            solver_verbose=cfg['solver_verbose'])
+        _worker_state['model'] = model
+    model.solve()
+    return model.energysystem
+
+
+def _evaluate_in_worker(design):
+    try:
+        return evaluate_design(design, _worker_state['base_design'],
+                               _worker_state['inputs'], _worker_state['cfg'])
+    except Exception:
+        logging.exception('Design {0} could not be evaluated'.format(design))
+        return dict.fromkeys(FLOW_SUMS, np.nan)
+
+
+###############################################################################
+# sweep
+###############################################################################
+def sweep_config(solver='cbc', number_of_time_steps=None,
+                 solver_verbose=False, persistent=False, aggregation=None,
+                 fast_dispatch=False, results_cache=None, sparse=False):
+    """Settings of evaluate_design(), see sweep_pool() for the options."""
+    if persistent and aggregation is not None:
+        raise ValueError('persistent and aggregation can not be combined')
+    if sparse and (persistent or aggregation is not None):
+        raise ValueError('sparse can not be combined with persistent or '
+                         'aggregation')
+
+    return {'solver': solver,
+            'solver_verbose': solver_verbose,
+            'number_of_time_steps': number_of_time_steps,
+            'persistent': persistent,
+            'aggregation': aggregation,
+            'fast_dispatch': fast_dispatch,
+            'results_cache': results_cache,
+            'sparse': sparse}
+
+
+def sweep_pool(base_design, inputs, solver='cbc', number_of_time_steps=None,
+               processes=None, solver_verbose=False, persistent=False,
+               aggregation=None, fast_dispatch=False, results_cache=None,
+               sparse=False):
+    """
+    Process pool whose workers evaluate designs, see evaluate_designs().
+
+    base_design holds the values of design_parameters.csv that are not part
+    of the design vectors, inputs is an InputBundle.
+
+    With persistent=True every worker keeps its model alive and only changes
+    the capacities for the next design (see persistent_model.py). With
+    persistent='template' the model contains all components, so that it is
+    built only once per worker for any designs.
+
+    With an Aggregation (see aggregation.py) only its typical periods are
+    simulated for every design, for fast screening of many designs.
+
+    With fast_dispatch=True designs without storages are dispatched in
+    NumPy (see fast_dispatch.py) instead of being solved by the LP solver.
+
+    With a ResultsCache (see results_cache.py) designs solved before, also
+    in earlier sweeps, are loaded instead of solved again.
+
+    With sparse=True the LPs are assembled as sparse matrices and solved by
+    HiGHS in memory (see sparse_model.py), solver is not used.
+    """
+    cfg = sweep_config(solver, number_of_time_steps, solver_verbose,
+                       persistent, aggregation, fast_dispatch, results_cache,
+                       sparse)
+    if processes is None:
+        processes = os.cpu_count()
+
+    return multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(base_design, inputs, cfg))
+
+
+def evaluate_designs(pool, designs, base_design, inputs, chunksize=1):
+    """
+    Evaluate designs with the workers of a sweep_pool.
+
+    Returns a DataFrame with one row per design: the design variables
+    followed by the KPIs of kpi.evaluate_kpis, which are computed for all
+    designs at once. Designs whose solve failed have NaN KPIs.
+    """
+    sums = pool.map(_evaluate_in_worker, designs, chunksize=chunksize)
+
+    table = pd.DataFrame(designs)
+    kpis = evaluate_kpis(table, merge_parameters(base_design, inputs.params),
+                         pd.DataFrame(sums, index=table.index))
+    return pd.concat([table, kpis], axis=1)
+
+
+def run_sweep(designs, base_design, inputs, processes=None, persistent=False,
+              screening=None, **options):
+    """
+    Evaluate all designs in parallel.
+
+    The options are those of sweep_pool(), the result is that of
+    evaluate_designs(). With persistent=True designs are handed out in
+    chunks so that one worker sees consecutive designs, which usually share
+    their components.
+
+    With screening, a dict of the constraints and objectives of
+    screening.screen(), designs whose bounds of the KPIs show that they
+    violate the constraints or are dominated are not solved. Their KPIs are
+    NaN; the result also holds the bounds and the column 'Screening' with
+    the reason a design was skipped.
+    """
+    if processes is None:
+        processes = os.cpu_count()
+
+    if persistent:
+        chunksize = max(1, len(designs) // processes)
+    else:
+        chunksize = 1
+
+    if screening is None:
+        logging.info('Sweep over {0} designs with {1} processes'.format(
+            len(designs), processes))
+        with sweep_pool(base_design, inputs, processes=processes,
+                        persistent=persistent, **options) as pool:
+            return evaluate_designs(pool, designs, base_design, inputs,
+                                    chunksize)
+
+    if options.get('aggregation') is not None:
+        raise ValueError('screening and aggregation can not be combined')
+    screened = screen_designs(designs, base_design, inputs,
+                              options.get('number_of_time_steps'),
+                              **screening)
+    solved = screened.index[screened['Screening'] == '']
+    logging.info('Sweep over {0} designs with {1} processes'.format(
+        len(solved), processes))
+
+    # skipped designs keep NaN flow sums and thus NaN KPIs
+    sums = pd.DataFrame(np.nan, index=screened.index, columns=list(FLOW_SUMS))
+    if len(solved):
+        with sweep_pool(base_design, inputs, processes=processes,
+                        persistent=persistent, **options) as pool:
+            sums.loc[solved] = pd.DataFrame(
+                pool.map(_evaluate_in_worker, [designs[i] for i in solved],
+                         chunksize=chunksize), index=solved)
+
+    table = pd.DataFrame(designs)
+    kpis = evaluate_kpis(table, merge_parameters(base_design, inputs.params),
+                         sums)
+    return pd.concat([table, kpis, screened.drop(columns=table.columns)],
+                     axis=1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    abs_path = os.path.dirname(os.path.abspath(os.path.join(__file__, '..')))
+
+    inputs = load_input_bundle(abs_path + '/data/weather_data.CSV',
+                               abs_path + '/data/general_parameters.csv',
+                               cache_dir=abs_path + '/cache')
+    base_design = load_parameters(abs_path + '/data/design_parameters.csv')
+
+    designs = design_grid(number_of_windturbines=[4, 8, 12],
+                          number_of_chps=[2, 4],
+                          capacity_thermal_storage=[0, 7])
+
+    table = run_sweep(designs, base_design, inputs)
+    table.to_csv(abs_path + '/results/sweep_results.csv')
+    print(table)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+# the modules of src/ import each other by name
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+
+@pytest.fixture(scope='session')
+def inputs(tmp_path_factory):
+    """InputBundle of the data directory."""
+    from input_data import load_input_bundle
+
+    return load_input_bundle(
+        os.path.join(DATA_DIR, 'weather_data.CSV'),
+        os.path.join(DATA_DIR, 'general_parameters.csv'),
+        cache_dir=str(tmp_path_factory.mktemp('cache')))
+
+
+@pytest.fixture(scope='session')
+def base_design():
+    """Values of design_parameters.csv."""
+    from input_data import load_parameters
+
+    return load_parameters(os.path.join(DATA_DIR, 'design_parameters.csv'))
+
+
+@pytest.fixture(scope='session')
+def cbc():
+    """Skips tests of the solph models if oemof or CBC are missing."""
+    pytest.importorskip('oemof.solph')
+    from pyomo.opt import SolverFactory
+
+    if not SolverFactory('cbc').available(exception_flag=False):
+        pytest.skip('CBC is not installed')
+    return 'cbc'
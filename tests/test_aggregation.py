@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('oemof.solph')
+
+from aggregation import aggregate_weather
+from aggregation import solve_aggregated
+
+
+def test_gas_limit_holds_for_the_year(cbc, inputs, base_design):
+    # two typical days of one week, the gas limit below the unconstrained use
+    aggregation = aggregate_weather(inputs.weather.window(0, 168), 2)
+    limit = 500.
+    params = dict(inputs.params,
+                  sum_max_gas=limit / inputs.params['nom_val_gas'])
+    design = dict(base_design, capacity_electr_storage=0,
+                  capacity_thermal_storage=0)
+    energysystem = solve_aggregated(design, params, aggregation, solver=cbc)
+
+    gas = [value['sequences']['flow'].sum()
+           for (source, target), value in energysystem.results['main'].items()
+           if str(source) == 'rgas']
+    assert np.isclose(sum(gas), limit, rtol=1e-4)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from fast_dispatch import verify_against_lp
+
+
+def test_dispatch_matches_the_lp(inputs, base_design):
+    # reference case: two weeks of the design without storages
+    design = dict(base_design, capacity_electr_storage=0,
+                  capacity_thermal_storage=0)
+    comparison = verify_against_lp(design, inputs.params,
+                                   inputs.weather.window(0, 336))
+
+    objective = comparison.loc[('objective', '')]
+    assert np.isclose(objective['fast dispatch'], objective['LP'],
+                      rtol=1e-9)
+    assert np.isclose(objective['LP'], 243744.056, rtol=1e-8)
+
+    # flows without alternative optima; CHP, heat shortage, gas and excess
+    # electricity may differ at equal costs
+    for key in [('electricity', 'demand_el'), ('heat', 'demand_th'),
+                ('shortage_bel', 'electricity'),
+                ('wind_turbine', 'electricity'), ('natural_gas', 'boiler'),
+                ('electricity', 'heat_pump')]:
+        assert np.isclose(comparison.loc[key, 'fast dispatch'],
+                          comparison.loc[key, 'LP'], rtol=1e-6), key
+
+    # both balance heat
+    for column in ('fast dispatch', 'LP'):
+        flows = comparison[column]
+        supply = sum(flows[key, 'heat'] for key in (
+            'chp', 'boiler', 'heat_pump', 'solar_thermal', 'shortage_bth'))
+        assert np.isclose(supply, flows['heat', 'demand_th']
+                          + flows['heat', 'excess_bth'])
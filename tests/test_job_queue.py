@@ -0,0 +1,87 @@
+import pytest
+
+import job_queue
+from job_queue import JobQueue
+from kpi import KPI_COLUMNS
+
+DESIGNS = [{'number_of_chps': 2}, {'number_of_chps': 4}]
+SUMS = dict.fromkeys(job_queue.FLOW_SUMS, 1.)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # time of the queue, advanced by the tests
+    now = [1000.]
+    monkeypatch.setattr(job_queue.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(tmp_path, clock, base_design):
+    with JobQueue(str(tmp_path / 'study.sqlite'), lease=60,
+                  max_attempts=2) as queue:
+        queue.configure(base_design)
+        queue.enqueue(DESIGNS)
+        yield queue
+
+
+def status(queue, job_id):
+    return queue._connection.execute(
+        'SELECT status, attempts, worker FROM jobs WHERE id = ?',
+        (job_id,)).fetchone()
+
+
+def test_enqueue_skips_queued_designs(queue):
+    assert queue.enqueue(DESIGNS + [{'number_of_chps': 6}]) == 1
+    assert queue.counts()['pending'] == 3
+
+
+def test_results_before_any_job_is_done(queue, inputs):
+    table = queue.results(inputs.params)
+    assert len(table) == 0
+    assert list(table.columns) == ['number_of_chps'] + KPI_COLUMNS
+
+
+def test_results_of_done_jobs(queue, inputs):
+    job_id, design = queue.claim('a')
+    assert queue.complete(job_id, SUMS, 1., 'a')
+    table = queue.results(inputs.params)
+    assert table['number_of_chps'].tolist() == [design['number_of_chps']]
+    assert table[KPI_COLUMNS].notna().all(axis=None)
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+    job_id, _ = queue.claim('a')
+    clock[0] += 30
+    assert queue.claim('b')[0] != job_id
+    clock[0] += 61
+    assert queue.claim('c')[0] == job_id
+    assert status(queue, job_id) == ('running', 2, 'c')
+
+
+def test_stale_worker_can_not_fail_or_complete(queue, clock):
+    job_id, _ = queue.claim('a')
+    clock[0] += 61
+    assert queue.claim('b')[0] == job_id
+
+    # the lease of a ran out, its job is running for b
+    assert not queue.fail(job_id, 'error', 'a')
+    assert not queue.complete(job_id, SUMS, 1., 'a')
+    assert status(queue, job_id) == ('running', 2, 'b')
+    assert queue.claim('c')[0] != job_id
+
+    assert queue.complete(job_id, SUMS, 1., 'b')
+    assert status(queue, job_id)[0] == 'done'
+
+
+def test_failed_job_is_retried_up_to_max_attempts(queue):
+    job_id, _ = queue.claim('a')
+    assert queue.fail(job_id, 'error', 'a')
+    assert status(queue, job_id) == ('pending', 1, 'a')
+
+    assert queue.claim('b')[0] == job_id
+    assert queue.fail(job_id, 'error', 'b')
+    assert status(queue, job_id)[:2] == ('failed', 2)
+
+    assert queue.retry_failed() == 1
+    assert status(queue, job_id)[:2] == ('pending', 0)